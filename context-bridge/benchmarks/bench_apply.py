@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: applying many SEARCH/REPLACE blocks to one large generated file.
+
+Compares the batch engine (apply_patches) with the previous
+one-block-at-a-time apply_patch (re-read, full-window fuzzy scan and
+rewrite per block). Half of the blocks have re-indented SEARCH text, so
+they need the whitespace-insensitive match.
+
+The batch engine is first checked against CHECKS (files with CRLF line
+endings); the exit status is 1 if one of them fails.
+
+Usage:
+    python benchmarks/bench_apply.py [--lines 10000,50000] [--hunks 40]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_core import apply_patches, read_file_content  # noqa: E402
+
+CRLF_FILE = b'a = 1\r\nb = 2\r\nc = 3\r\n'
+
+# (name, file bytes or None, search, replace, expected message, expected bytes)
+CHECKS = (
+    ('crlf exact', CRLF_FILE, 'a = 1\nb = 2', 'a = 10\nb = 20',
+     '✅ Modified: x.py', b'a = 10\r\nb = 20\r\nc = 3\r\n'),
+    ('crlf exact, more lines', CRLF_FILE, 'b = 2', 'b = 20\nbb = 21',
+     '✅ Modified: x.py', b'a = 1\r\nb = 20\r\nbb = 21\r\nc = 3\r\n'),
+    ('crlf fuzzy', CRLF_FILE, '  b = 2\n  c = 3', 'b = 20\nc = 30',
+     '✅ Modified (fuzzy match): x.py', b'a = 1\r\nb = 20\r\nc = 30\r\n'),
+    ('create', None, '', 'x = 1\ny = 2\n',
+     '✅ Created: x.py', b'x = 1\ny = 2\n'),
+    ('crlf overwrite', CRLF_FILE, '', 'x = 1\ny = 2\n',
+     '✅ Created: x.py', b'x = 1\ny = 2\n'),
+)
+
+
+def legacy_apply(patch: dict, project_root: Path) -> tuple:
+    """The previous apply_patch() modification path."""
+    file_path = project_root / patch['file']
+    content = read_file_content(file_path)
+    search, replace = patch['search'], patch['replace']
+    if search in content:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content.replace(search, replace, 1))
+        return (True, 'exact')
+    content_lines = content.splitlines()
+    search_lines = search.splitlines()
+    for i in range(len(content_lines) - len(search_lines) + 1):
+        if all(content_lines[i + j].strip() == s.strip() for j, s in enumerate(search_lines)):
+            new_lines = content_lines[:i] + replace.splitlines() + content_lines[i + len(search_lines):]
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(new_lines))
+            return (True, 'fuzzy')
+    return (False, 'not found')
+
+
+def make_file(lines: int) -> str:
+    out = []
+    for i in range(lines // 5):
+        out.append(f'def handler_{i}(request):\n')
+        out.append(f'    value = request.get("field_{i}")\n')
+        out.append('    if value is None:\n')
+        out.append('        return None\n')
+        out.append(f'    return transform_{i % 7}(value)\n')
+    return ''.join(out)
+
+
+def make_patches(lines: int, hunks: int) -> list:
+    patches = []
+    step = max(1, (lines // 5) // hunks)
+    for k in range(hunks):
+        i = k * step
+        search = f'def handler_{i}(request):\n    value = request.get("field_{i}")'
+        if k % 2:
+            search = search.replace('    value', '  value')  # needs the fuzzy match
+        replace = f'def handler_{i}(request):\n    value = request.get("field_{i}", "")'
+        patches.append({'file': 'gen.py', 'search': search, 'replace': replace})
+    return patches
+
+
+def check() -> bool:
+    ok = True
+    for name, original, search, replace, message, expected in CHECKS:
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            if original is not None:
+                (root / 'x.py').write_bytes(original)
+            (_, got_message), = apply_patches([{'file': 'x.py', 'search': search, 'replace': replace}], root)
+            got = (root / 'x.py').read_bytes()
+        if got_message != message or got != expected:
+            print(f"FAIL {name}: {got_message!r}, {got!r} (expected {message!r}, {expected!r})")
+            ok = False
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time applying many SEARCH/REPLACE blocks to one file.")
+    parser.add_argument('--lines', default='10000,50000', help="comma-separated file sizes (lines)")
+    parser.add_argument('--hunks', type=int, default=40)
+    args = parser.parse_args()
+
+    if not check():
+        return 1
+    sizes = [int(s) for s in args.lines.split(',')]
+    hunks = args.hunks
+
+    print(f"{'lines':>7} {'hunks':>6} {'legacy ms':>10} {'batch ms':>9} {'speedup':>8}")
+    for lines in sizes:
+        text = make_file(lines)
+        patches = make_patches(lines, hunks)
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            target = root / 'gen.py'
+
+            target.write_text(text, encoding='utf-8')
+            start = time.perf_counter()
+            legacy = [legacy_apply(p, root) for p in patches]
+            legacy_ms = (time.perf_counter() - start) * 1000
+
+            target.write_text(text, encoding='utf-8')
+            start = time.perf_counter()
+            batch = apply_patches(patches, root)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+        assert all(ok for ok, _ in legacy) and all(ok for ok, _ in batch)
+        print(f"{lines:>7} {hunks:>6} {legacy_ms:>10.1f} {batch_ms:>9.1f} {legacy_ms / batch_ms:>7.0f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
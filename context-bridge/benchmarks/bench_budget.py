@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: token-budget planning time vs. candidate count.
+
+Only planning is timed (priorities + greedy/knapsack selection); packing
+itself reads the chosen files like a normal copy.
+
+Usage:
+    python benchmarks/bench_budget.py [--files 5000,20000,50000] [--budget 1000000]
+"""
+
+import sys
+import time
+import argparse
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_budget import POLICIES, STRATEGIES, Candidate, plan_budget  # noqa: E402
+
+
+def make_candidates(count: int, rng: random.Random) -> list:
+    candidates = []
+    for i in range(count):
+        tokens = int(rng.lognormvariate(7, 1.2)) + 20  # median ~1.1k tokens, long tail
+        rel = f'pkg{i % 97}/sub{i % 13}/module_{i}.py'
+        candidates.append(Candidate(rel, None, tokens, rng.randrange(10 ** 15), True))
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time token-budget planning.")
+    parser.add_argument('--files', default='5000,20000,50000', help="comma-separated candidate counts")
+    parser.add_argument('--budget', type=int, default=1000000)
+    args = parser.parse_args()
+
+    counts = [int(s) for s in args.files.split(',')]
+    budget = args.budget
+    rng = random.Random(42)
+    instruction = 'Refactor pkg3/sub2/module_42.py and module_1234.py'
+    policy_sets = [('mentioned', 'recent'), ('mentioned', 'small'), POLICIES]
+
+    print(f"{'files':>7} {'strategy':>9} {'policies':>26} {'ms':>8} {'packed':>7} {'tokens':>9}")
+    for count in counts:
+        candidates = make_candidates(count, rng)
+        for strategy in STRATEGIES:
+            for policies in policy_sets:
+                start = time.perf_counter()
+                plan = plan_budget(candidates, budget, policies, strategy, instruction)
+                ms = (time.perf_counter() - start) * 1000
+                print(f"{count:>7} {strategy:>9} {'+'.join(policies):>26} {ms:>8.1f} "
+                      f"{len(plan.selected):>7} {plan.planned:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: repeated Copy of the same selection with the fragment cache.
+
+Packs one synthetic tree several times with different instructions:
+    first   - empty fragment cache (every file read, decoded and hashed)
+    repeat  - nothing changed (no file read again)
+    edited  - 1% of the files rewritten in between
+    touched - 1% of the files touched (mtime only) in between
+and compares them with copying a string of the prompt's size.
+
+Usage:
+    python benchmarks/bench_fragments.py [--sizes 20,100] (MB) [--file-kb 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+import bridge_core as b  # noqa: E402
+from bridge_fragments import FragmentCache  # noqa: E402
+from bridge_sinks import StringSink, write_prompt  # noqa: E402
+
+
+def make_tree(root: Path, total_mb: int, file_kb: int) -> list:
+    line = 'const value = "lorem ipsum dolor sit amet";  // filler\n'
+    body = line * (file_kb * 1024 // len(line))
+    for i in range(total_mb * 1024 // file_kb):
+        d = root / f'pkg{i % 32}'
+        d.mkdir(exist_ok=True)
+        (d / f'file{i}.js').write_text(body, encoding='utf-8')
+    return b.collect_files(root)
+
+
+def pack_ms(files: list, root: Path, instruction: str, fragments: FragmentCache) -> tuple:
+    start = time.perf_counter()
+    prompt = write_prompt(b.iter_prompt(files, root, instruction, fragments=fragments), StringSink())
+    return (time.perf_counter() - start) * 1000, prompt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time repeated Copy of one selection with the fragment cache.")
+    parser.add_argument('--sizes', default='20,100', help="comma-separated context sizes (MB)")
+    parser.add_argument('--file-kb', type=int, default=8)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    file_kb = args.file_kb
+
+    print(f"{'context MB':>10} {'files':>6} {'first ms':>9} {'repeat ms':>10} {'edited ms':>10} "
+          f"{'touched ms':>11} {'copy ms':>8}")
+    for size in sizes:
+        fragments = FragmentCache(limit=size * 2 << 20)  # room for the whole tree
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            files = make_tree(root, size, file_kb)
+            first, prompt = pack_ms(files, root, 'first', fragments)
+            repeat, _ = pack_ms(files, root, 'second', fragments)
+
+            step = max(1, len(files) // 100)
+            for f in files[::step]:
+                f.write_text(f.read_text(encoding='utf-8') + '// edited\n', encoding='utf-8')
+            edited, _ = pack_ms(files, root, 'third', fragments)
+
+            for f in files[::step]:
+                st = f.stat()
+                os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+            touched, _ = pack_ms(files, root, 'fourth', fragments)
+
+            start = time.perf_counter()
+            copy = (prompt + ' ')[:-1]
+            copy_ms = (time.perf_counter() - start) * 1000
+            del copy
+            print(f"{size:>10} {len(files):>6} {first:>9.1f} {repeat:>10.1f} {edited:>10.1f} "
+                  f"{touched:>11.1f} {copy_ms:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
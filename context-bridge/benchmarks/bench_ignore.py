@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: per-path cost of the compiled ignore engine vs. pattern count.
+
+The compiled engine is first checked against CHECKS (pattern, path,
+ignored); the exit status is 1 if one of them fails.
+
+Usage:
+    python benchmarks/bench_ignore.py [--paths 20000]
+"""
+
+import sys
+import time
+import argparse
+import random
+import fnmatch
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_ignore import IgnoreMatcher  # noqa: E402
+
+# (pattern, path, ignored): bracket classes and other globs the indexed buckets must not mis-key
+CHECKS = (
+    ('foo[.]txt', 'foo.txt', True),
+    ('foo[.]txt', 'fooxtxt', False),
+    ('*[.]log', 'a/b/debug.log', True),
+    ('foo[ab].txt', 'foob.txt', True),
+    ('/src[0-9]/*.py', 'src1/a.py', True),
+    ('*.py[co]', 'mod.pyc', True),
+    ('name]', 'name]', True),
+)
+
+
+def legacy_match(rel_str: str, name: str, patterns: list) -> bool:
+    """The previous per-pattern fnmatch loop from should_ignore()."""
+    for pattern in patterns:
+        if pattern.startswith('!'):
+            continue
+        p = pattern.rstrip('/')
+        if fnmatch.fnmatch(rel_str, p):
+            return True
+        if fnmatch.fnmatch(rel_str, p + '/*'):
+            return True
+        if fnmatch.fnmatch(name, p):
+            return True
+        if pattern.endswith('/'):
+            if fnmatch.fnmatch(rel_str, p + '*'):
+                return True
+    return False
+
+
+def make_patterns(count: int, rng: random.Random) -> list:
+    kinds = [
+        lambda i: f'*.ext{i}',
+        lambda i: f'name{i}',
+        lambda i: f'/root{i}',
+        lambda i: f'dir{i}/',
+        lambda i: f'pkg{i}/**/gen',
+        lambda i: f'!keep{i}.ext{i}',
+        lambda i: f'build{i}/*.o',
+    ]
+    return [rng.choice(kinds)(i) for i in range(count)]
+
+
+def make_paths(count: int, rng: random.Random) -> list:
+    paths = []
+    for i in range(count):
+        depth = rng.randint(0, 6)
+        dirs = [f'd{rng.randint(0, 50)}' for _ in range(depth)]
+        paths.append('/'.join(dirs + [f'file{i}.{rng.choice(["py", "js", "md", "ext3"])}']))
+    return paths
+
+
+def bench(fn, paths: list) -> float:
+    start = time.perf_counter()
+    for p in paths:
+        fn(p)
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def check() -> bool:
+    ok = True
+    for pattern, path, expected in CHECKS:
+        got = IgnoreMatcher(Path('.'), [pattern], nested=False).match(path)
+        if got != expected:
+            print(f"FAIL {pattern!r} on {path!r}: ignored={got}, expected {expected}")
+            ok = False
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Time the compiled ignore engine against the pattern count.")
+    parser.add_argument('--paths', type=int, default=20000)
+    args = parser.parse_args()
+
+    if not check():
+        return 1
+    n_paths = args.paths
+    rng = random.Random(42)
+    paths = make_paths(n_paths, rng)
+    legacy_paths = paths[:max(1, n_paths // 10)]
+
+    print(f"{'patterns':>9} {'compiled us/path':>17} {'legacy us/path':>15}")
+    for count in (10, 30, 100, 300, 1000):
+        patterns = make_patterns(count, random.Random(count))
+        matcher = IgnoreMatcher(Path('.'), patterns, nested=False)
+        compiled = bench(lambda p: matcher.match(p), paths)
+        legacy = bench(lambda p: legacy_match(p, p.rsplit('/', 1)[-1], patterns), legacy_paths)
+        print(f'{count:>9} {compiled:>17.2f} {legacy:>15.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
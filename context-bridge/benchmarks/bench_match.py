@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: approximate matching of SEARCH blocks with small edits.
+
+Builds a file of --lines code-like lines, takes --blocks random runs of
+3-12 lines from it and makes one small edit to each, the kind an AI makes
+when it quotes code from memory:
+  - rename: one identifier renamed on one line
+  - comma: a trailing comma added to one line
+  - comment: a comment appended to one line
+Every edited block misses the exact and whitespace-insensitive matches,
+so each one goes through bridge_match. Reports the time per block and
+how many were placed correctly, wrongly, refused as ambiguous or not
+found at all.
+
+Usage:
+    python benchmarks/bench_match.py [--lines 20000] [--blocks 200] [--seed 1]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_apply import Document  # noqa: E402
+
+import synth  # noqa: E402
+
+EDITS = ('rename', 'comma', 'comment')
+
+
+def edit_block(rng: random.Random, lines: list, kind: str) -> list:
+    lines = list(lines)
+    targets = [i for i, line in enumerate(lines) if line.strip()]
+    i = rng.choice(targets)
+    line = lines[i].rstrip('\n')
+    if kind == 'rename':
+        words = [w for w in line.replace('(', ' ').replace(')', ' ').split() if w.isidentifier()]
+        if words:
+            word = rng.choice(words)
+            line = line.replace(word, word + 'x', 1)
+    elif kind == 'comma':
+        line += ','
+    else:
+        line += '  # see above'
+    lines[i] = line + '\n'
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time approximate SEARCH block matching.")
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text = ''
+    counter = [0]
+    while text.count('\n') < args.lines:
+        text += synth._source(rng, 64 * 1024, counter, rng.random() < 0.4, rng.random() < 0.2)
+    lines = text.splitlines(True)[:args.lines]
+    text = ''.join(lines)
+    start = time.perf_counter()
+    doc = Document(text)
+    doc.find_fuzzy(['warm up the line index'], [])
+    print(f"{len(lines):,} lines, {len(text) / 2**20:.1f} MB; line index built in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(f"{'edit':>8} {'blocks':>7} {'mean ms':>8} {'max ms':>7} {'right':>6} {'wrong':>6} "
+          f"{'refused':>8} {'missed':>7}")
+    for kind in EDITS:
+        times, right, wrong, refused, missed = [], 0, 0, 0, 0
+        for _ in range(args.blocks):
+            size = rng.randint(3, 12)
+            first = rng.randrange(0, len(lines) - size)
+            search = edit_block(rng, lines[first:first + size], kind)
+            begin = time.perf_counter()
+            span = doc.find_approx(''.join(search).splitlines(), [])
+            times.append((time.perf_counter() - begin) * 1000)
+            if span is not None:
+                expected = sum(map(len, lines[:first]))
+                right += span[0] == expected
+                wrong += span[0] != expected
+            elif doc.miss and 'similar places' in doc.miss:
+                refused += 1
+            else:
+                missed += 1
+        print(f"{kind:>8} {len(times):>7} {sum(times) / len(times):>8.2f} {max(times):>7.2f} "
+              f"{right:>6} {wrong:>6} {refused:>8} {missed:>7}")
+
+
+if __name__ == '__main__':
+    main()
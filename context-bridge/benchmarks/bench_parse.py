@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: parsing SEARCH/REPLACE blocks out of large AI responses.
+
+Compares the line-oriented parser (bridge_patches) with the previous
+single re.DOTALL regex on:
+  - well-formed: many ordinary blocks between prose
+  - no-separator: SEARCH headers whose ==== never comes
+  - no-close: blocks whose >>>> never comes
+The regex rescans the rest of the text from every header it cannot
+close, so the last two grow at least quadratically with the input (no-close
+takes seconds at 100 blocks and about an hour at 1000); above
+--legacy-max blocks the regex is skipped for them.
+
+Usage:
+    python benchmarks/bench_parse.py [--blocks 100,1000] [--legacy-max 100]
+"""
+
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_patches import iter_patches  # noqa: E402
+
+LEGACY_PATTERN = r'<<<<\s*SEARCH\s+([^\n]+)\n(.*?)\n====\n(.*?)\n>>>>'
+
+# Malformed inputs with more blocks than this are not given to the regex
+LEGACY_MAX_BLOCKS = 100
+
+
+def legacy_parse(text: str) -> list:
+    """The previous parse_patches()."""
+    return [{'file': m.group(1).strip(), 'search': m.group(2), 'replace': m.group(3)}
+            for m in re.finditer(LEGACY_PATTERN, text, re.DOTALL)]
+
+
+def make_text(kind: str, blocks: int) -> str:
+    body = ''.join(f'    value_{j} = compute({j})\n' for j in range(20))
+    out = []
+    for i in range(blocks):
+        out.append(f'Change {i} updates the handler.\n\n')
+        out.append(f'<<<< SEARCH src/module_{i}.py\n{body}')
+        if kind == 'no-separator':
+            continue
+        out.append(f'====\n{body}')
+        if kind == 'no-close':
+            continue
+        out.append('>>>>\n\n')
+    return ''.join(out)
+
+
+def measure(func, text: str) -> tuple:
+    start = time.perf_counter()
+    found = len(func(text))
+    return (time.perf_counter() - start) * 1000, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time parsing SEARCH/REPLACE blocks out of large responses.")
+    parser.add_argument('--blocks', default='100,1000', help="comma-separated block counts")
+    parser.add_argument('--legacy-max', type=int, default=LEGACY_MAX_BLOCKS,
+                        help="largest malformed input the old regex is run on")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.blocks.split(',')]
+    legacy_max = args.legacy_max
+
+    print(f"{'input':<13} {'blocks':>7} {'MB':>6} {'regex ms':>9} {'parser ms':>10} {'found':>11}")
+    for kind in ('well-formed', 'no-separator', 'no-close'):
+        for blocks in sizes:
+            text = make_text(kind, blocks)
+            if kind != 'well-formed' and blocks > legacy_max:
+                legacy, legacy_found = 'skipped', '-'
+            else:
+                legacy_ms, legacy_found = measure(legacy_parse, text)
+                legacy = f'{legacy_ms:.1f}'
+            issues = []
+            parser_ms, found = measure(lambda t: list(iter_patches(t, issues)), text)
+            mb = len(text.encode('utf-8')) / 1e6
+            print(f"{kind:<13} {blocks:>7} {mb:>6.2f} {legacy:>9} {parser_ms:>10.1f} "
+                  f"{legacy_found:>5}/{found:<5}" + (f" ({len(issues)} issues)" if issues else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: peak RSS of prompt building vs. total context size.
+
+Each measurement runs in a fresh subprocess so ru_maxrss only reflects one
+mode. Modes:
+    legacy  - pack_context_xml() + f-string wrapping (the old _copy_to_clipboard)
+    string  - iter_prompt() into a StringSink (one join)
+    stream  - iter_prompt() into a FileSink (os.devnull), never materialised
+    mapped  - stream, with files of LARGE_FILE_SIZE or more memory-mapped and
+              written as bytes (use --file-kb 16384 to get such files)
+
+Streaming must not hold the context: the exit status is 1 if stream mode
+peaks more than --max-stream-mb over its baseline at any size (e.g. when
+file contents are kept in a cache nobody asked for).
+
+Usage:
+    python benchmarks/bench_prompt.py [--sizes 10,40,100] (MB) [--file-kb 256] [--max-stream-mb 16]
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+TOOLS = Path(__file__).resolve().parent.parent / 'tools'
+
+# RSS over baseline (MB) stream mode may reach at any context size
+STREAM_RSS_LIMIT_MB = 16
+
+MODES = ('legacy', 'string', 'stream', 'mapped')
+
+CHILD = r'''
+import os, sys, json, argparse, resource
+from pathlib import Path
+parser = argparse.ArgumentParser(prog='bench_prompt child')
+parser.add_argument('--tools', required=True)
+parser.add_argument('--root', type=Path, required=True)
+parser.add_argument('--mode', choices=%r, required=True)
+args = parser.parse_args()
+sys.path.insert(0, args.tools)
+import bridge_core as b
+from bridge_sinks import FileSink, StringSink, write_prompt
+root, mode = args.root, args.mode
+files = b.collect_files(root)
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if mode == 'legacy':
+    xml = b.pack_context_xml(files, root)
+    prompt = f"""{b.SYSTEM_PROMPT}\n\n{xml}\n\n---\n## User Instruction\nx\n"""
+    chars = len(prompt)
+elif mode == 'string':
+    prompt = write_prompt(b.iter_prompt(files, root, 'x'), StringSink())
+    chars = len(prompt)
+else:
+    sink = FileSink(os.devnull)
+    write_prompt(b.iter_prompt(files, root, 'x', mapped=mode == 'mapped'), sink)
+    chars = sink.chars
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == 'darwin' else 1024
+print(json.dumps({'chars': chars, 'peak_rss_mb': peak * scale / 2**20, 'base_rss_mb': base * scale / 2**20}))
+''' % (MODES,)
+
+
+def make_tree(root: Path, total_mb: int, file_kb: int = 256):
+    line = 'const value = "lorem ipsum dolor sit amet";  // filler\n'
+    body = line * (file_kb * 1024 // len(line))
+    for i in range(total_mb * 1024 // file_kb):
+        d = root / f'pkg{i % 32}'
+        d.mkdir(exist_ok=True)
+        (d / f'file{i}.js').write_text(body, encoding='utf-8')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the peak RSS of prompt building.")
+    parser.add_argument('--sizes', default='10,40,100', help="comma-separated context sizes (MB)")
+    parser.add_argument('--file-kb', type=int, default=256)
+    parser.add_argument('--max-stream-mb', type=float, default=STREAM_RSS_LIMIT_MB,
+                        help="RSS over baseline stream mode may reach")
+    parser.add_argument('--json', action='store_true', help="also print the results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    file_kb = args.file_kb
+    limit = args.max_stream_mb
+    ok = True
+    env = dict(os.environ, CONTEXT_BRIDGE_CACHE=tempfile.mkdtemp())
+    results = []
+    print(f"{'context MB':>10} {'mode':>7} {'peak RSS MB':>12} {'RSS over base':>14}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            make_tree(Path(tmp), size, file_kb)
+            for mode in MODES:
+                argv = ['--tools', str(TOOLS), '--root', tmp, '--mode', mode]
+                out = subprocess.run([sys.executable, '-c', CHILD] + argv,
+                                     capture_output=True, text=True, env=env, check=True).stdout
+                r = json.loads(out)
+                r.update(context_mb=size, mode=mode)
+                results.append(r)
+                over = r['peak_rss_mb'] - r['base_rss_mb']
+                flag = ''
+                if mode == 'stream' and over > limit:
+                    flag = f'  OVER {limit:g} MB'
+                    ok = False
+                print(f"{size:>10} {mode:>7} {r['peak_rss_mb']:>12.1f} {over:>14.1f}{flag}")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: context reduction on a project with vendored copies and license headers.
+
+Writes --files source files (half of them starting with the same license
+header, some with trailing spaces and runs of blank lines), copies
+--vendored of them under vendor/ and adds a package-lock.json of about
+--lock-kb. Then packs the whole project without and with reduction and
+reports the prompt size, the token estimate and the time; the reduced
+pack runs twice, the second time from the reduction cache.
+
+Usage:
+    python benchmarks/bench_reduce.py [--files 1000] [--vendored 200] [--lock-kb 2048] [--seed 1]
+"""
+
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_core import Project  # noqa: E402
+from bridge_fragments import FragmentCache  # noqa: E402
+from bridge_sinks import StringSink  # noqa: E402
+
+import synth  # noqa: E402
+
+LICENSE = '''# Copyright (c) 2024 Example Corporation and contributors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+
+'''
+
+
+def make_tree(root: Path, rng: random.Random, files: int, vendored: int, lock_kb: int):
+    counter = [0]
+    rels = []
+    for i in range(files):
+        rel = f'src/{rng.choice(synth._WORDS)}/{rng.choice(synth._WORDS)}_{i}.py'
+        text = synth._source(rng, int(4096 * rng.lognormvariate(0, 0.8)), counter, False, rng.random() < 0.2)
+        if i % 2:
+            text = LICENSE + text
+        if rng.random() < 0.3:
+            text = text.replace('\n', '   \n').replace('\n\n', '\n\n\n\n\n')
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+        rels.append(rel)
+    for rel in rng.sample(rels, min(vendored, len(rels))):
+        target = root / 'vendor' / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(root / rel, target)
+    packages = {}
+    while len(json.dumps(packages)) < lock_kb * 1024:
+        name = f'node_modules/{rng.choice(synth._WORDS)}-{len(packages)}'
+        packages[name] = {'version': f'1.{len(packages)}.0', 'resolved': f'https://registry.example/{name}.tgz',
+                          'integrity': f'sha512-{rng.getrandbits(256):064x}'}
+    (root / 'package-lock.json').write_text(json.dumps({'packages': packages}, indent=2), encoding='utf-8')
+
+
+def pack(project: Project, reduce: bool) -> tuple:
+    start = time.perf_counter()
+    result = project.pack('Refactor the handlers', sink=StringSink(), reduce=reduce)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what context reduction saves.")
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--vendored', type=int, default=200)
+    parser.add_argument('--lock-kb', type=int, default=2048)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_reduce_') as tmp:
+        root = Path(tmp)
+        make_tree(root, random.Random(args.seed), args.files, args.vendored, args.lock_kb)
+        project = Project(root, use_cache=False, counter='approx', fragments=FragmentCache(256 << 20))
+        project.files()
+        pack(project, False)  # warm the fragment cache: both runs read from memory
+
+        print(f"{'pack':>14} {'chars':>12} {'tokens':>10} {'ms':>8}")
+        plain, elapsed = pack(project, False)
+        print(f"{'as is':>14} {plain['chars']:>12,} {plain['tokens']:>10,} {elapsed:>8.0f}")
+        for label in ('reduced', 'reduced again'):
+            result, elapsed = pack(project, True)
+            print(f"{label:>14} {result['chars']:>12,} {result['tokens']:>10,} {elapsed:>8.0f}")
+        reduction = result['reduction']
+        print(f"saved {reduction['chars_saved']:,} chars, ~{reduction['tokens_saved']:,} tokens: "
+              f"{len(reduction['duplicates'])} duplicates, {len(reduction['headers'])} headers folded, "
+              f"{len(reduction['truncated'])} data files cut")
+
+
+if __name__ == '__main__':
+    main()
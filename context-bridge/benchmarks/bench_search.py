@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: relevance search over a large project.
+
+Indexes --files synthetic source files in memory (no disk, no SQLite),
+then times instruction queries, English and Japanese, including the
+preselection of imported files. The synthetic vocabulary is small, so
+most query words occur in most files: the worst case for the postings
+walk. Finally --changed files are rewritten and the index is synced, to
+show that only they are tokenised again, and the queries are timed once
+more with the dead postings of the old versions still in place.
+
+Usage:
+    python benchmarks/bench_search.py [--files 50000] [--size 1500] [--changed 100] [--seed 1]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tools'))
+
+from bridge_search import SearchIndex  # noqa: E402
+
+import synth  # noqa: E402
+
+QUERIES = (
+    'fix the user session handler so expired tokens are refreshed',
+    'load_config_value returns the wrong cache path',
+    'order item result buffer stream record request index',
+    'ユーザー一覧を返す処理でキャッシュを更新するように修正して',
+    '注文の合計金額の計算を直す',
+)
+
+
+def make_files(rng: random.Random, count: int, size: int) -> dict:
+    dirs = synth._dirs(rng, max(1, count // 20), 6)
+    counter = [0]
+    files = {}
+    for n in range(count):
+        js = rng.random() < 0.4
+        folder = rng.choice(dirs)
+        name = f'{rng.choice(synth._WORDS)}_{n}' + ('.js' if js else '.py')
+        rel = f'{folder}/{name}' if folder else name
+        head = ''
+        if files and rng.random() < 0.5:
+            other = rng.choice(list(files)[-50:])
+            target = other.rpartition('.')[0]
+            head = (f"import x from '@/{target}';\n" if js else f"from {target.replace('/', '.')} import x\n")
+        files[rel] = head + synth._source(rng, size, counter, js, rng.random() < 0.2)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time relevance search queries.")
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--size', type=int, default=1500)
+    parser.add_argument('--changed', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    files = make_files(rng, args.files, args.size)
+    signatures = {rel: (1, len(text), n) for n, (rel, text) in enumerate(files.items())}
+    index = SearchIndex(Path('.'), persist=False)
+    start = time.perf_counter()
+    index.sync(signatures, files.get)
+    elapsed = time.perf_counter() - start
+    print(f"{len(files):,} files, {sum(map(len, files.values())) / 2**20:.0f} MB, "
+          f"{len(index.postings):,} terms; indexed in {elapsed:.1f} s")
+
+    print(f"{'query':<40} {'search ms':>10} {'preselect ms':>13} {'ranked':>7} {'imported':>9}")
+    for query in QUERIES:
+        begin = time.perf_counter()
+        index.search(query, 20)
+        searched = (time.perf_counter() - begin) * 1000
+        begin = time.perf_counter()
+        picks = index.preselect(query, 20)
+        picked = (time.perf_counter() - begin) * 1000
+        label = query if len(query) <= 38 else query[:37] + '…'
+        print(f"{label:<40} {searched:>10.1f} {picked:>13.1f} {len(picks.ranked):>7} {len(picks.imported):>9}")
+
+    for rel in rng.sample(list(files), args.changed):
+        files[rel] += '# changed\n'
+        signatures[rel] = (2,) + signatures[rel][1:]
+    start = time.perf_counter()
+    read = index.sync(signatures, files.get)
+    print(f"sync after {args.changed} changes: {read} files read, "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    index.search(QUERIES[0], 20)  # length norms are recomputed once after a change
+    slowest = 0.0
+    for query in QUERIES:
+        begin = time.perf_counter()
+        index.search(query, 20)
+        slowest = max(slowest, (time.perf_counter() - begin) * 1000)
+    print(f"slowest query with {index.dead} dead files: {slowest:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
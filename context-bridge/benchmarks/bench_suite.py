@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: scan, pack, parse and apply on a synthetic project.
+
+Generates a seeded project and AI response (see synth.py), then times
+each stage in a fresh subprocess so its peak memory is its own:
+    scan    - collect_files() without a scan cache
+    rescan  - collect_files() with a warm scan cache
+    pack    - pack_context_xml() of every collected file (no fragment cache)
+    parse   - parse_patches() of the response
+    apply   - apply_patches() of the parsed blocks (files restored between runs)
+Every stage reports the best and median wall time of --repeat runs, peak
+RSS (where the resource module exists) and the peak of Python allocations
+(tracemalloc, measured in one extra run). Nothing needs a display.
+
+--json writes the results with the spec that produced them; --compare
+prints the change against such a file, and with --max-slowdown the exit
+status is 1 if any stage got slower than that factor (stages under
+NOISE_MS are not judged).
+
+Usage:
+    python benchmarks/bench_suite.py [--stages scan,pack,parse,apply] [--repeat 5]
+        [--seed 1] [--files 2000] [--depth 4] [--size-kb 6] [--binary 0.05] [--sjis 0.1]
+        [--ignore-rules 40] [--node-modules 2000] [--hunks 40] [--fuzzy 0.3] [--malformed 0.1]
+        [--json results.json] [--compare baseline.json] [--max-slowdown 1.2]
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import synth
+
+TOOLS = Path(__file__).resolve().parent.parent / 'tools'
+
+STAGES = ('scan', 'rescan', 'pack', 'parse', 'apply')
+
+# Results format; bump when the meaning of a field changes
+FORMAT_VERSION = 1
+
+# Stages faster than this (ms) in both runs are too noisy for --max-slowdown
+NOISE_MS = 5.0
+
+CHILD = r'''
+import sys, json, time, statistics, tracemalloc
+sys.path.insert(0, sys.argv[1])
+try:
+    import resource
+except ImportError:
+    resource = None
+import bridge_core as b
+from bridge_cache import ScanCache
+from pathlib import Path
+
+root, stage, response, repeat = Path(sys.argv[2]), sys.argv[3], Path(sys.argv[4]), int(sys.argv[5])
+extra = {}
+
+
+def rss_mb():
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+if stage == 'scan':
+    def run():
+        extra['files'] = len(b.collect_files(root))
+elif stage == 'rescan':
+    cache = ScanCache(root)
+    b.collect_files(root, cache=cache)
+    def run():
+        extra['files'] = len(b.collect_files(root, cache=cache))
+elif stage == 'pack':
+    files = b.collect_files(root)
+    def run():
+        extra['chars'] = len(b.pack_context_xml(files, root))
+elif stage == 'parse':
+    text = response.read_text(encoding='utf-8')
+    def run():
+        issues = []
+        extra['blocks'] = len(b.parse_patches(text, issues))
+        extra['issues'] = len(issues)
+elif stage == 'apply':
+    patches = b.parse_patches(response.read_text(encoding='utf-8'))
+    originals = {p['file']: (root / p['file']).read_bytes() for p in patches}
+    def run():
+        try:
+            results = b.apply_patches(patches, root)
+        finally:
+            for rel, data in originals.items():
+                (root / rel).write_bytes(data)
+        extra['applied'] = sum(1 for ok, _ in results if ok)
+        extra['failed'] = len(results) - extra['applied']
+else:
+    raise SystemExit(f"unknown stage {stage}")
+
+base = rss_mb()
+times = []
+for _ in range(repeat):
+    start = time.perf_counter()
+    run()
+    times.append((time.perf_counter() - start) * 1000)
+peak = rss_mb()
+tracemalloc.start()
+run()
+alloc_peak = tracemalloc.get_traced_memory()[1] / 2**20
+tracemalloc.stop()
+print(json.dumps({
+    'best_ms': min(times), 'median_ms': statistics.median(times), 'runs': len(times),
+    'peak_rss_mb': peak, 'rss_over_base_mb': None if peak is None else peak - base,
+    'peak_alloc_mb': alloc_peak, **extra,
+}))
+'''
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(TOOLS),
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_stage(stage: str, root: Path, response: Path, repeat: int, env: dict) -> dict:
+    out = subprocess.run([sys.executable, '-c', CHILD, str(TOOLS), str(root), stage, str(response), str(repeat)],
+                         capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        raise RuntimeError(f"stage {stage} failed:\n{out.stderr}")
+    return json.loads(out.stdout)
+
+
+def compare(results: dict, baseline: dict, max_slowdown: float = None) -> bool:
+    """Print the change of every stage against baseline; False if one is slower than max_slowdown."""
+    ok = True
+    old_results = baseline.get('results', {})
+    if baseline.get('spec') != results['spec']:
+        print("note: the baseline was generated with a different spec; numbers are not comparable")
+    print(f"\n{'stage':>7} {'base ms':>9} {'now ms':>9} {'ratio':>6} {'base MB':>8} {'now MB':>7}")
+    for stage, now in results['results'].items():
+        old = old_results.get(stage)
+        if old is None:
+            print(f"{stage:>7} {'-':>9} {now['best_ms']:>9.1f}")
+            continue
+        ratio = now['best_ms'] / old['best_ms'] if old['best_ms'] else float('inf')
+        flag = ''
+        if max_slowdown is not None and ratio > max_slowdown and now['best_ms'] >= NOISE_MS:
+            flag = '  SLOWER'
+            ok = False
+        print(f"{stage:>7} {old['best_ms']:>9.1f} {now['best_ms']:>9.1f} {ratio:>5.2f}x "
+              f"{old['peak_alloc_mb']:>8.1f} {now['peak_alloc_mb']:>7.1f}{flag}")
+    return ok
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Time scan, pack, parse and apply on a synthetic project.")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated stages to run")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per stage")
+    parser.add_argument('--seed', type=int, default=1)
+    for key, default in synth.PROJECT_SPEC.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=type(default), default=default)
+    for key, default in synth.RESPONSE_SPEC.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=type(default), default=default)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file of an earlier run to compare with")
+    parser.add_argument('--max-slowdown', type=float,
+                        help="with --compare, exit 1 if a stage is slower than this factor")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    stages = [s for s in args.stages.split(',') if s]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"Unknown stage: {', '.join(unknown)} (choose from {', '.join(STAGES)})", file=sys.stderr)
+        return 2
+    project_spec = {key: getattr(args, key) for key in synth.PROJECT_SPEC}
+    response_spec = {key: getattr(args, key) for key in synth.RESPONSE_SPEC}
+    results = {
+        'version': FORMAT_VERSION,
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'spec': {'seed': args.seed, 'repeat': args.repeat, 'project': project_spec, 'response': response_spec},
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'project'
+        start = time.perf_counter()
+        summary = synth.make_project(root, args.seed, **project_spec)
+        response = Path(tmp) / 'response.txt'
+        response.write_text(synth.make_response(root, summary['text'], args.seed, **response_spec),
+                            encoding='utf-8')
+        results['project'] = {k: v for k, v in summary.items() if k != 'text'}
+        print(f"Generated {summary['files']} files + {summary['node_modules']} in node_modules, "
+              f"{summary['bytes'] / 2**20:.1f} MB in {time.perf_counter() - start:.1f}s")
+        # Keep the user's scan cache out of it
+        env = dict(os.environ, CONTEXT_BRIDGE_CACHE=str(Path(tmp) / 'cache'))
+
+        print(f"{'stage':>7} {'best ms':>9} {'median ms':>10} {'peak RSS MB':>12} {'alloc MB':>9}  details")
+        for stage in stages:
+            r = run_stage(stage, root, response, args.repeat, env)
+            results['results'][stage] = r
+            rss = '-' if r['peak_rss_mb'] is None else f"{r['peak_rss_mb']:.1f}"
+            details = ', '.join(f'{k}={v}' for k, v in r.items()
+                                if k not in ('best_ms', 'median_ms', 'runs', 'peak_rss_mb',
+                                             'rss_over_base_mb', 'peak_alloc_mb'))
+            print(f"{stage:>7} {r['best_ms']:>9.1f} {r['median_ms']:>10.1f} {rss:>12} "
+                  f"{r['peak_alloc_mb']:>9.1f}  {details}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_slowdown):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic projects and AI responses for the benchmarks.
+
+Everything is generated from a seed, so the same spec and seed give the
+same bytes on every machine and every run.
+
+make_project(root, seed, **spec) writes a project tree; the spec keys
+(PROJECT_SPEC holds the defaults):
+    files         - source files in the project (outside node_modules)
+    depth         - deepest directory level
+    size_kb       - median file size; sizes are log-normal around it
+    size_sigma    - spread of the sizes (0 = every file the same size)
+    binary        - share of files that are binary (half by extension,
+                    half with NUL bytes that only the sniff catches)
+    sjis          - share of text files written in Shift_JIS (cp932)
+    ignore_rules  - rules in the root .gitignore
+    ignored       - files matched by those rules
+    node_modules  - files under node_modules (pruned by the scan)
+
+make_response(root, text_files, seed, **spec) returns the text of an AI
+reply with SEARCH/REPLACE blocks against those files (RESPONSE_SPEC):
+    hunks         - well-formed blocks, each against distinct lines
+    fuzzy         - share of blocks whose SEARCH text is re-indented or
+                    has trailing spaces (whitespace-insensitive match)
+    malformed     - extra blocks that are broken (no ====, no >>>>, or
+                    no path), reported as parse issues
+"""
+
+import random
+from pathlib import Path
+
+PROJECT_SPEC = {
+    'files': 2000, 'depth': 4, 'size_kb': 6, 'size_sigma': 1.0, 'binary': 0.05,
+    'sjis': 0.1, 'ignore_rules': 40, 'ignored': 200, 'node_modules': 2000,
+}
+
+RESPONSE_SPEC = {'hunks': 40, 'fuzzy': 0.3, 'malformed': 0.1}
+
+# Size caps, so one unlucky draw does not dominate a run
+MAX_FILE_FACTOR = 40
+
+_WORDS = ('user', 'order', 'item', 'cache', 'config', 'token', 'index', 'path', 'value',
+          'result', 'request', 'handler', 'session', 'record', 'buffer', 'stream')
+
+_JAPANESE = ('設定ファイルを読み込む', 'ユーザー一覧を返す', 'キャッシュを更新する',
+             '文字コードを判定する', '例外を記録して続行する', '注文の合計金額を計算する')
+
+_PY_LINES = (
+    'def {a}_{n}({b}):\n',
+    '    {a} = {b}.get("{c}_{n}")\n',
+    '    if {a} is None:\n',
+    '        return None\n',
+    '    return transform_{n}({a}, {b})\n',
+    '\n',
+)
+
+_JS_LINES = (
+    'export function {a}{n}({b}) {{\n',
+    '  const {a} = {b}.{c}_{n} ?? null;\n',
+    '  if (!{a}) return undefined;\n',
+    '  return render{n}({a});\n',
+    '}}\n',
+    '\n',
+)
+
+_IGNORE_TEMPLATES = (
+    ('*.log{i}', 'logs/run{i}.log{i}'),
+    ('/gen{i}/', 'gen{i}/out.py'),
+    ('tmp{i}/**', 'tmp{i}/a/b.txt'),
+    ('build{i}/', 'src/build{i}/x.js'),
+    ('**/out{i}/*.txt', 'deep/x/out{i}/r.txt'),
+    ('*.cache{i}', 'data/blob.cache{i}'),
+    ('!keep{i}.log{i}', None),
+    ('docs/**/*.tmp{i}', 'docs/a/b/c.tmp{i}'),
+)
+
+
+def _source(rng: random.Random, size: int, counter: list, js: bool, japanese: bool) -> str:
+    """Code-like text of about size characters; every function name is unique."""
+    lines = _JS_LINES if js else _PY_LINES
+    comment = '//' if js else '#'
+    out = []
+    total = 0
+    while total < size:
+        counter[0] += 1
+        words = {'a': rng.choice(_WORDS), 'b': rng.choice(_WORDS), 'c': rng.choice(_WORDS), 'n': counter[0]}
+        if japanese and rng.random() < 0.3:
+            line = f'{comment} {rng.choice(_JAPANESE)}（{counter[0]}）\n'
+            out.append(line)
+            total += len(line)
+        for template in lines:
+            line = template.format(**words)
+            out.append(line)
+            total += len(line)
+    return ''.join(out)
+
+
+def _dirs(rng: random.Random, count: int, depth: int) -> list:
+    """count project-relative directories, spread over levels 0..depth."""
+    dirs = ['']
+    while len(dirs) < count:
+        parent = rng.choice(dirs)
+        if parent.count('/') + (1 if parent else 0) >= depth:
+            continue
+        name = f'{rng.choice(_WORDS)}{len(dirs)}'
+        dirs.append(f'{parent}/{name}' if parent else name)
+    return dirs
+
+
+def _write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def make_project(root: Path, seed: int = 1, **spec) -> dict:
+    """Write a synthetic project under root and return what was written.
+
+    The result has 'files', 'bytes', 'binary', 'sjis', 'ignored' and
+    'node_modules' counts, and 'text': the UTF-8 source files (relative
+    paths) that make_response() can target.
+    """
+    unknown = set(spec) - set(PROJECT_SPEC)
+    if unknown:
+        raise ValueError(f"Unknown project spec keys: {', '.join(sorted(unknown))}")
+    spec = dict(PROJECT_SPEC, **spec)
+    rng = random.Random(seed)
+    root = Path(root)
+    counter = [0]
+    summary = {'files': 0, 'bytes': 0, 'binary': 0, 'sjis': 0, 'ignored': 0, 'node_modules': 0,
+               'text': []}
+
+    def add(rel: str, data: bytes, kind: str = None):
+        _write(root / rel, data)
+        summary['bytes'] += len(data)
+        if kind is not None:
+            summary[kind] += 1
+
+    dirs = _dirs(rng, max(1, spec['files'] // 15), spec['depth'])
+    median = spec['size_kb'] * 1024
+    for i in range(spec['files']):
+        folder = rng.choice(dirs)
+        prefix = f'{folder}/' if folder else ''
+        size = min(int(median * rng.lognormvariate(0, spec['size_sigma'])), median * MAX_FILE_FACTOR)
+        summary['files'] += 1
+        if rng.random() < spec['binary']:
+            n = min(size, 4096)
+            if i % 2:
+                add(f'{prefix}asset{i}.png', rng.getrandbits(8 * n).to_bytes(n, 'little'), 'binary')
+            else:
+                add(f'{prefix}blob{i}.dat', b'\x00\x01DATA' * (n // 6), 'binary')
+            continue
+        js = rng.random() < 0.4
+        rel = f"{prefix}{rng.choice(_WORDS)}_{i}.{'js' if js else 'py'}"
+        if rng.random() < spec['sjis']:
+            add(rel, _source(rng, size, counter, js, True).encode('cp932'), 'sjis')
+        else:
+            add(rel, _source(rng, size, counter, js, rng.random() < 0.2).encode('utf-8'))
+            summary['text'].append(rel)
+
+    rules = []
+    targets = []
+    for i in range(spec['ignore_rules']):
+        rule, target = _IGNORE_TEMPLATES[i % len(_IGNORE_TEMPLATES)]
+        rules.append(rule.format(i=i))
+        if target is not None:
+            targets.append(target.format(i=i))
+    (root / '.gitignore').write_text('# generated\n' + '\n'.join(rules) + '\n', encoding='utf-8')
+    for i in range(spec['ignored'] if targets else 0):
+        target = targets[i % len(targets)]
+        if i >= len(targets):
+            stem, dot, ext = target.rpartition('.')
+            target = f'{stem}_{i}{dot}{ext}' if dot else f'{target}_{i}'
+        add(target, f'ignored {i}\n'.encode('utf-8'), 'ignored')
+
+    for i in range(spec['node_modules']):
+        rel = f'node_modules/pkg{i % 50}/lib/sub{i % 7}/mod{i}.js'
+        add(rel, _source(rng, 600, counter, True, False).encode('utf-8'), 'node_modules')
+    return summary
+
+
+def _reindent(rng: random.Random, lines: list) -> list:
+    """The same lines with changed indentation or trailing spaces."""
+    if rng.random() < 0.5:
+        return [('  ' + line.lstrip(' ')) if line.strip() else line for line in lines]
+    return [line.rstrip('\n') + '  \n' if line.strip() else line for line in lines]
+
+
+def make_response(root: Path, text_files: list, seed: int = 1, **spec) -> str:
+    """An AI reply with SEARCH/REPLACE blocks against text_files (UTF-8, under root).
+
+    Each well-formed block replaces a distinct run of 3-6 lines, so all of
+    them apply to an unmodified tree. Prose and markdown fences surround
+    the blocks as in a real reply.
+    """
+    unknown = set(spec) - set(RESPONSE_SPEC)
+    if unknown:
+        raise ValueError(f"Unknown response spec keys: {', '.join(sorted(unknown))}")
+    spec = dict(RESPONSE_SPEC, **spec)
+    rng = random.Random(seed)
+    root = Path(root)
+    if not text_files:
+        raise ValueError("No text files to target")
+    blocks = []
+    used = {}
+    attempts = 0
+    while len(blocks) < spec['hunks'] and attempts < spec['hunks'] * 20:
+        attempts += 1
+        rel = rng.choice(text_files)
+        lines = (root / rel).read_text(encoding='utf-8').splitlines(True)
+        length = rng.randint(3, 6)
+        if len(lines) <= length:
+            continue
+        start = rng.randrange(0, len(lines) - length)
+        taken = used.setdefault(rel, set())
+        span = set(range(start - 1, start + length + 1))
+        if taken & span or not any(line.strip() for line in lines[start:start + length]):
+            continue
+        taken.update(span)
+        search = lines[start:start + length]
+        first = search[0]
+        indent = first[:len(first) - len(first.lstrip(' '))]
+        replace = search[:1] + [f'{indent}# edited\n'] + search[1:]
+        if rng.random() < spec['fuzzy']:
+            search = _reindent(rng, search)
+        blocks.append(f'<<<< SEARCH {rel}\n{"".join(search)}====\n{"".join(replace)}>>>>\n')
+
+    broken = []
+    for i in range(int(round(spec['hunks'] * spec['malformed']))):
+        rel = rng.choice(text_files)
+        kind = i % 3
+        if kind == 0:
+            broken.append(f'<<<< SEARCH {rel}\nmissing separator {i}\n>>>>\n')
+        elif kind == 1:
+            broken.append('<<<< SEARCH\nno path\n====\nstill no path\n>>>>\n')
+        else:
+            broken.append(f'<<<< SEARCH {rel}\nnever closed {i}\n====\ncut off\n')
+    # Unclosed blocks swallow what follows, so they go last
+    broken.sort(key=lambda b: b.rstrip().endswith('>>>>'), reverse=True)
+
+    out = ['Here are the changes.\n\n']
+    for i, block in enumerate(blocks):
+        out.append(f'Change {i + 1}:\n\n```\n{block}```\n\n')
+    out.extend(broken)
+    return ''.join(out)
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Batch patch application
+SEARCH/REPLACE ブロックをファイルごとにまとめて適用する。各ファイルは1回だけ
+読み込み、すべてのブロックを元のテキストに対して位置決めしてから1回だけ書き込む。
+
+Matching follows the original apply_patch(): an exact substring match
+first, then a line-by-line comparison that ignores leading/trailing
+whitespace. The fuzzy search looks candidate anchors up in a hash index of
+stripped lines instead of sliding over every window. Blocks that match
+neither way fall back to the approximate search of bridge_match (edit
+distance within a similarity threshold and a CPU budget, refusing
+ambiguous places). Blocks whose match
+overlaps an earlier block of the batch (or that only match text produced
+by an earlier block) are retried in order against the patched text, as the
+one-at-a-time engine would have seen it.
+
+Writes go through bridge_journal.commit_files(): the files of a batch are
+replaced together or not at all, and the batch can be journaled for undo.
+"""
+
+from collections import namedtuple
+from pathlib import Path
+
+from bridge_journal import FileWrite, Journal, TransactionError, commit_files, make_entry
+from bridge_match import MIN_SIMILARITY, Ambiguous, ApproxMatcher, OutOfBudget
+from bridge_trace import tracer
+
+# A located edit: replace text[start:end] with replacement; similarity is
+# below 1 for approximate matches
+Edit = namedtuple('Edit', 'start end replacement index fuzzy similarity', defaults=(1.0,))
+
+
+def _line_ending_length(line: str) -> int:
+    body = line.splitlines()
+    return len(line) - len(body[0]) if body else len(line)
+
+
+class Document:
+    """The text of one file plus a lazily built index of its stripped lines."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._lines = None
+        self._stripped = None
+        self._offsets = None
+        self._index = None
+        self._matcher = None
+        # Why the last approximate search found nothing ('' if there was no candidate)
+        self.miss = ''
+
+    def _build(self):
+        lines = self.text.splitlines(keepends=True)
+        offsets = [0] * (len(lines) + 1)
+        pos = 0
+        for i, line in enumerate(lines):
+            pos += len(line)
+            offsets[i + 1] = pos
+        stripped = [line.strip() for line in lines]
+        index = {}
+        for i, key in enumerate(stripped):
+            index.setdefault(key, []).append(i)
+        self._lines, self._stripped, self._offsets, self._index = lines, stripped, offsets, index
+
+    def find_exact(self, search: str, taken: list):
+        """Offsets of the first occurrence of search not overlapping taken, or None."""
+        pos = self.text.find(search)
+        while pos != -1:
+            end = pos + len(search)
+            if not _overlaps(taken, pos, end):
+                return pos, end
+            pos = self.text.find(search, pos + 1)
+        return None
+
+    def find_fuzzy(self, search_lines: list, taken: list):
+        """Offsets of the first whitespace-insensitive line match, or None.
+
+        The rarest stripped search line is the anchor; only windows around
+        its occurrences are compared. The match ends before the line ending
+        of its last line, like the original block replacement.
+        """
+        if self._index is None:
+            self._build()
+        keys = [line.strip() for line in search_lines]
+        if not keys:
+            return None
+        index = self._index
+        anchor = min(range(len(keys)), key=lambda j: len(index.get(keys[j], ())))
+        stripped, m = self._stripped, len(keys)
+        compared = 0
+        span = None
+        for pos in index.get(keys[anchor], ()):
+            first = pos - anchor
+            if first < 0 or first + m > len(stripped):
+                continue
+            compared += 1
+            if stripped[first:first + m] != keys:
+                continue
+            last = self._lines[first + m - 1]
+            start = self._offsets[first]
+            end = self._offsets[first + m] - _line_ending_length(last)
+            if not _overlaps(taken, start, end):
+                span = start, end
+                break
+        tracer.count('fuzzy comparisons', compared)
+        return span
+
+    def find_approx(self, search_lines: list, taken: list, similarity: float = MIN_SIMILARITY):
+        """(start, end, similarity) of the closest unique window of lines, or None.
+
+        Offsets are bounded like find_fuzzy(); self.miss tells why nothing
+        was chosen.
+        """
+        self.miss = ''
+        if self._index is None:
+            self._build()
+        if self._matcher is None:
+            self._matcher = ApproxMatcher(self._stripped, self._index)
+        offsets = self._offsets
+
+        def bounds(first, end):
+            return offsets[first], offsets[end] - _line_ending_length(self._lines[end - 1])
+
+        def free(first, end):
+            return not _overlaps(taken, *bounds(first, end))
+
+        try:
+            match = self._matcher.find([line.strip() for line in search_lines], similarity, free=free)
+        except Ambiguous as e:
+            self.miss = f"{e.places} similar places, none applied"
+            return None
+        except OutOfBudget:
+            self.miss = "approximate search ran out of time"
+            return None
+        if match is None:
+            return None
+        return bounds(match.first, match.end) + (match.similarity,)
+
+
+def _crlf(text: str) -> str:
+    """text with every line ending written as CRLF."""
+    return text.replace('\r\n', '\n').replace('\n', '\r\n')
+
+
+def _overlaps(taken: list, start: int, end: int) -> bool:
+    for s, e in taken:
+        if start < e and s < end:
+            return True
+        # Two insertions at the same point would be ambiguous too
+        if start == end == s == e:
+            return True
+    return False
+
+
+def locate(doc: Document, patch: dict, taken: list, index: int = 0,
+           similarity: float = MIN_SIMILARITY):
+    """Find where patch (number index of its batch) applies in doc, avoiding taken ranges.
+
+    similarity is the threshold of the approximate fallback (0 disables it).
+    Blocks are parsed with LF line endings; in a file with CRLF endings the
+    SEARCH text is matched, and the REPLACE text written, with CRLF.
+    """
+    search = patch['search']
+    crlf = '\r\n' in doc.text
+    span = doc.find_exact(_crlf(search), taken) if crlf else None
+    if span is None:
+        span = doc.find_exact(search, taken)
+    if span is not None:
+        replacement = _crlf(patch['replace']) if crlf else patch['replace']
+        return Edit(span[0], span[1], replacement, index, False)
+    lines = search.splitlines()
+    span = doc.find_fuzzy(lines, taken)
+    if span is None:
+        span = doc.find_approx(lines, taken, similarity)
+    if span is None:
+        return None
+    replacement = '\n'.join(patch['replace'].splitlines())
+    if crlf:
+        replacement = _crlf(replacement)
+    return Edit(span[0], span[1], replacement, index, True, *span[2:])
+
+
+def splice(text: str, edits: list) -> str:
+    """Apply non-overlapping edits (any order) to text in one pass."""
+    out = []
+    pos = 0
+    for edit in sorted(edits, key=lambda e: e.start):
+        out.append(text[pos:edit.start])
+        out.append(edit.replacement)
+        pos = edit.end
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+# ==============================================================================
+# Batches
+# ==============================================================================
+
+class FileChange:
+    """Planned outcome for one file: new text, or None to delete it.
+
+    ``ops`` lists the [offset, old, new] edits that turn ``original`` ('' for
+    a new file) into ``new``, for the undo journal; None if the original
+    text could not be read. ``encoding`` is the one the file was read with
+    (UTF-8 for new files); the new text is written back in it.
+    """
+
+    def __init__(self, rel: str, path: Path, existed: bool):
+        self.rel = rel
+        self.path = path
+        self.existed = existed
+        self.original = None
+        self.original_bytes = None
+        self.encoding = 'utf-8'
+        self.new = None
+        self.changed = False
+        self.patches = []
+        self.ops = []
+
+
+def edit_ops(text: str, edits: list) -> list:
+    """Turn non-overlapping edits of text into sequential [offset, old, new] ops."""
+    ops = []
+    shift = 0
+    for edit in sorted(edits, key=lambda e: e.start):
+        ops.append([edit.start + shift, text[edit.start:edit.end], edit.replacement])
+        shift += len(edit.replacement) - (edit.end - edit.start)
+    return ops
+
+
+def _plan_file(rel: str, path: Path, items: list, read, results: list,
+               similarity: float = MIN_SIMILARITY) -> FileChange:
+    """Resolve every (i, patch) of one file; fills results[i]."""
+    existed = path.exists()
+    change = FileChange(rel, path, existed)
+    exists = existed
+    text = None
+    loaded = False
+    edits, taken, deferred = [], [], []
+
+    def load():
+        nonlocal text, loaded
+        text, change.original_bytes, change.encoding = read(path)
+        change.original = text
+        loaded = True
+
+    def record(text, edits):
+        if change.ops is not None:
+            change.ops.extend(edit_ops(text, edits))
+        return splice(text, edits)
+
+    def flush(text):
+        """Apply located edits, then retry deferred blocks one by one on the result."""
+        if edits:
+            text = record(text, edits)
+            for edit in edits:
+                change.patches.append(edit.index)
+        for i, patch, overlapping in deferred:
+            current = Document(text)
+            edit = locate(current, patch, [], i, similarity)
+            if edit is None:
+                if overlapping:
+                    results[i] = (False, f"❌ Overlaps another block in: {rel}")
+                elif current.miss:
+                    results[i] = (False, f"❌ Search content not found in: {rel} ({current.miss})")
+                else:
+                    results[i] = (False, f"❌ Search content not found in: {rel}")
+                continue
+            text = record(text, [edit])
+            change.patches.append(i)
+            results[i] = _modified(rel, edit)
+        edits.clear()
+        taken.clear()
+        deferred.clear()
+        return text
+
+    doc = None
+    for i, patch in items:
+        search, replace = patch['search'], patch['replace']
+        if not search.strip() or not replace.strip():
+            if doc is not None:
+                text = flush(text)
+                doc = None
+            if exists and not loaded:
+                # Only needed for the journal's pre-image
+                try:
+                    load()
+                except Exception:
+                    change.ops = None
+            current = text if exists and text is not None else ''
+        if not search.strip():
+            if change.ops is not None:
+                change.ops.append([0, current, replace])
+            text, exists, loaded = replace, True, True
+            change.patches.append(i)
+            results[i] = (True, f"✅ Created: {rel}")
+            continue
+        if not replace.strip():
+            if exists:
+                if change.ops is not None:
+                    change.ops.append([0, current, ''])
+                text, exists = None, False
+                change.patches.append(i)
+                results[i] = (True, f"🗑️ Deleted: {rel}")
+            else:
+                results[i] = (False, f"⚠️ File not found for deletion: {rel}")
+            continue
+        if not exists:
+            results[i] = (False, f"❌ File not found: {rel}")
+            continue
+        if not loaded:
+            try:
+                load()
+            except Exception as e:
+                results[i] = (False, f"❌ Failed to modify {rel}: {e}")
+                continue
+        if doc is None:
+            doc = Document(text)
+        edit = locate(doc, patch, taken, i, similarity)
+        if edit is None:
+            deferred.append((i, patch, bool(taken) and locate(doc, patch, [], i, similarity) is not None))
+            continue
+        edits.append(edit)
+        taken.append((edit.start, edit.end))
+        results[i] = _modified(rel, edit)
+    if doc is not None:
+        text = flush(text)
+    if not exists:
+        change.changed = existed
+    elif loaded:
+        change.new = text
+        change.changed = not existed or text != change.original
+    if change.changed and change.new is not None:
+        try:
+            change.new.encode(change.encoding)
+        except UnicodeEncodeError as e:
+            bad = change.new[e.start:e.end]
+            for i in change.patches:
+                results[i] = (False, f"❌ {rel} is {change.encoding}, which cannot hold {bad!r}")
+            change.changed = False
+    return change
+
+
+def _modified(rel: str, edit: Edit) -> tuple:
+    if edit.similarity < 1:
+        return (True, f"✅ Modified (approximate match, {edit.similarity:.0%} similar): {rel}")
+    if edit.fuzzy:
+        return (True, f"✅ Modified (fuzzy match): {rel}")
+    return (True, f"✅ Modified: {rel}")
+
+
+def plan_patches(patches: list, project_root: Path, read, similarity: float = MIN_SIMILARITY) -> tuple:
+    """Resolve a batch of patches without touching the disk.
+
+    read(path) -> (text, raw bytes, encoding) decodes an existing file
+    (raising on failure); similarity is the approximate match threshold
+    (0 = exact and whitespace-insensitive matches only). Returns (changes, results): FileChange per touched file in
+    first-seen order, and one (success, message) per patch in input order.
+    """
+    by_file = {}
+    for i, patch in enumerate(patches):
+        by_file.setdefault(patch['file'], []).append((i, patch))
+    results = [None] * len(patches)
+    changes = []
+    for rel, items in by_file.items():
+        changes.append(_plan_file(rel, Path(project_root) / rel, items, read, results, similarity))
+    return changes, results
+
+
+def write_changes(changes: list, results: list, journal: Journal = None, label: str = ''):
+    """Write every changed file in one transaction (see commit_files), each in its own encoding.
+
+    With a Journal the batch is recorded for undo; returns its number (or
+    None). If the commit fails nothing is changed and the results of every
+    block that touched a file become errors.
+    """
+    changed = [c for c in changes if c.changed]
+    if not changed:
+        return None
+    writes, entries = [], []
+    try:
+        for c in changed:
+            before = c.original_bytes
+            if c.existed and before is None:
+                before = c.path.read_bytes()
+            after = c.new.encode(c.encoding) if c.new is not None else None
+            writes.append(FileWrite(c.path, after, before if c.existed else None))
+            entries.append(make_entry(c.rel, before if c.existed else None, after,
+                                      c.ops, c.original, c.encoding))
+    except OSError as e:
+        _fail_all(changed, results, e)
+        return None
+
+    seq = journal.begin(entries, label) if journal is not None else None
+    try:
+        commit_files(writes)
+    except TransactionError as e:
+        if seq is not None:
+            journal.abort(seq)
+        _fail_all(changed, results, e)
+        return None
+    if seq is not None:
+        journal.finish(seq)
+    return seq
+
+
+def _fail_all(changed: list, results: list, error):
+    for c in changed:
+        for i in c.patches:
+            results[i] = (False, f"❌ Failed to write {c.rel}, nothing was changed: {error}")
+
+
+def apply_patches(patches: list, project_root: Path, read, journal: Journal = None,
+                  atomic: bool = False, similarity: float = MIN_SIMILARITY) -> list:
+    """Apply a batch of patches, reading and writing every file at most once.
+
+    With atomic, nothing is written unless every block applies.
+    """
+    with tracer.span('locate', blocks=len(patches)):
+        changes, results = plan_patches(patches, project_root, read, similarity)
+    if atomic and not all(ok for ok, _ in results):
+        for i, (ok, _) in enumerate(results):
+            if ok:
+                results[i] = (False, f"⏭️ Not applied (another block failed): {patches[i]['file']}")
+        return results
+    files = sum(1 for c in changes if c.changed)
+    with tracer.span('write', files=files):
+        write_changes(changes, results, journal, f"{len(patches)} blocks, {files} files")
+    return results
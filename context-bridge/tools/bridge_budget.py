@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Token-budget packing
+選択されたファイルをモデルのコンテキスト上限（トークン数）に収まるように
+優先度に従って取捨選択する。入りきらないファイルは概要（シグネチャのみ）の
+スタブに置き換えるか、除外リストとして報告する。
+
+Planning only looks at per-file token counts (cached or estimated from the
+file size), never at file contents, so it stays interactive on tens of
+thousands of candidates. Policies:
+    mentioned - files whose name or path appears in the instruction
+    recent    - most recently modified first
+    small     - fewest tokens first
+Strategies:
+    greedy    - take files in priority order while they fit
+    knapsack  - maximise the total priority value that fits (core knapsack
+                around the greedy break point, so it stays fast)
+"""
+
+import re
+from collections import namedtuple
+
+# Bytes per token assumed for files whose count is not cached yet. Deliberately
+# pessimistic (CJK text is ~3 bytes per token) so plans rarely overshoot.
+ESTIMATE_BYTES_PER_TOKEN = 3
+
+# Value of a file named in the instruction, relative to the 0..1 range of the
+# rank-based policies
+MENTIONED_VALUE = 10.0
+
+# Items around the greedy break point solved exactly, and capacity resolution
+KNAPSACK_CORE = 256
+KNAPSACK_RESOLUTION = 1024
+
+# Lines kept in an outline stub
+OUTLINE_MAX_LINES = 200
+
+POLICIES = ('mentioned', 'recent', 'small')
+STRATEGIES = ('greedy', 'knapsack')
+
+# One file offered to the packer; exact is False when tokens is an estimate
+Candidate = namedtuple('Candidate', 'rel path tokens mtime_ns exact')
+
+
+def estimate_tokens(size: int) -> int:
+    return size // ESTIMATE_BYTES_PER_TOKEN + 1
+
+
+# ==============================================================================
+# Priorities
+# ==============================================================================
+
+_WORD = re.compile(r"[\w./\\-]+")
+
+
+def _mentioned_words(instruction: str) -> set:
+    words = set()
+    for word in _WORD.findall(instruction):
+        word = word.replace('\\', '/').strip('./')
+        if word:
+            words.add(word)
+    return words
+
+
+def mentioned_names(instruction: str) -> set:
+    """Return the file names a rel must have to be mentioned_in instruction (to look files up by name)."""
+    return {word.rpartition('/')[2] for word in _mentioned_words(instruction)}
+
+
+def mentioned_in(instruction: str, rels) -> set:
+    """Return the rels whose file name or (trailing) path appears in instruction."""
+    words = _mentioned_words(instruction)
+    paths = [w for w in words if '/' in w]
+    found = set()
+    for rel in rels:
+        name = rel.rpartition('/')[2]
+        if name in words or rel in words or any(rel.endswith('/' + p) for p in paths):
+            found.add(rel)
+    return found
+
+
+def _rank_values(candidates: list, key, reverse: bool) -> list:
+    """Map each candidate to 1.0 (best) .. ~0.0 (worst) by its rank under key."""
+    n = len(candidates)
+    order = sorted(range(n), key=lambda i: key(candidates[i]), reverse=reverse)
+    values = [0.0] * n
+    for rank, i in enumerate(order):
+        values[i] = 1.0 - rank / n
+    return values
+
+
+def priority_values(candidates: list, policies=('mentioned', 'recent'), instruction: str = '') -> list:
+    """Return one priority value per candidate (higher is packed first).
+
+    Every file is worth at least 1, so with no policy the packers maximise
+    the number of files.
+    """
+    values = [1.0] * len(candidates)
+    for policy in policies:
+        if policy == 'mentioned':
+            found = mentioned_in(instruction, [c.rel for c in candidates])
+            extra = [MENTIONED_VALUE if c.rel in found else 0.0 for c in candidates]
+        elif policy == 'recent':
+            extra = _rank_values(candidates, lambda c: c.mtime_ns, True)
+        elif policy == 'small':
+            extra = _rank_values(candidates, lambda c: c.tokens, False)
+        else:
+            raise ValueError(f"Unknown priority policy: {policy}")
+        values = [v + e for v, e in zip(values, extra)]
+    return values
+
+
+# ==============================================================================
+# Strategies
+# ==============================================================================
+
+def greedy(weights: list, values: list, budget: int) -> set:
+    """Take items by descending value while they fit; return chosen indices."""
+    chosen = set()
+    left = budget
+    for i in sorted(range(len(weights)), key=lambda i: (-values[i], weights[i])):
+        if weights[i] <= left:
+            chosen.add(i)
+            left -= weights[i]
+    return chosen
+
+
+def knapsack(weights: list, values: list, budget: int,
+             core: int = KNAPSACK_CORE, resolution: int = KNAPSACK_RESOLUTION) -> set:
+    """Approximate 0/1 knapsack; return chosen indices.
+
+    Items are sorted by value density. Those well before the greedy break
+    item are taken, those well after it are left out, and the `core` items
+    around it are solved by dynamic programming over the remaining capacity
+    quantised to `resolution` steps (weights rounded up, so the result never
+    exceeds budget). Leftover capacity is then filled greedily, and the
+    plain greedy() answer is returned instead if it happens to be better.
+    """
+    order = sorted((i for i in range(len(weights)) if weights[i] <= budget),
+                   key=lambda i: (-values[i] / max(1, weights[i]), weights[i]))
+    used = 0
+    brk = len(order)
+    for pos, i in enumerate(order):
+        if used + weights[i] > budget:
+            brk = pos
+            break
+        used += weights[i]
+    lo = max(0, brk - core // 2)
+    hi = min(len(order), lo + core)
+    chosen = set(order[:lo])
+    capacity = budget - sum(weights[i] for i in chosen)
+
+    items = order[lo:hi]
+    scale = max(1, -(-capacity // resolution))
+    cap = capacity // scale
+    best = [0.0] * (cap + 1)
+    keep = []
+    for i in items:
+        w = -(-weights[i] // scale)
+        v = values[i]
+        took = bytearray(cap + 1)
+        for c in range(cap, w - 1, -1):
+            candidate = best[c - w] + v
+            if candidate > best[c]:
+                best[c] = candidate
+                took[c] = 1
+        keep.append(took)
+    c = cap
+    for i, took in zip(reversed(items), reversed(keep)):
+        if took[c]:
+            chosen.add(i)
+            c -= -(-weights[i] // scale)
+
+    left = budget - sum(weights[i] for i in chosen)
+    for i in order[lo:]:
+        if i not in chosen and weights[i] <= left:
+            chosen.add(i)
+            left -= weights[i]
+    fallback = greedy(weights, values, budget)
+    if sum(values[i] for i in fallback) > sum(values[i] for i in chosen):
+        return fallback
+    return chosen
+
+
+# ==============================================================================
+# Plans
+# ==============================================================================
+
+class BudgetPlan:
+    """Result of plan_budget().
+
+    ``selected`` keeps the candidates' original order; ``dropped`` is in
+    priority order (the best outline-stub candidates first). The packer
+    fills ``outlined`` and ``overflow`` (files whose real count turned out
+    too large for the remaining budget) and ``used`` while writing.
+    """
+
+    def __init__(self, budget: int, selected: list, dropped: list, strategy: str, policies):
+        self.budget = budget
+        self.selected = selected
+        self.dropped = dropped
+        self.strategy = strategy
+        self.policies = tuple(policies)
+        self.planned = sum(c.tokens for c in selected)
+        self.used = 0
+        self.outlined = []
+        self.overflow = []
+
+    def omitted(self) -> list:
+        """Rels left out entirely (neither packed nor outlined)."""
+        outlined = set(self.outlined)
+        return [c.rel for c in self.dropped if c.rel not in outlined] + list(self.overflow)
+
+
+def plan_budget(candidates: list, budget: int, policies=('mentioned', 'recent'),
+                strategy: str = 'greedy', instruction: str = '') -> BudgetPlan:
+    """Choose which candidates fit into budget tokens."""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown packing strategy: {strategy}")
+    values = priority_values(candidates, policies, instruction)
+    weights = [c.tokens for c in candidates]
+    pick = greedy if strategy == 'greedy' else knapsack
+    chosen = pick(weights, values, budget)
+    selected = [c for i, c in enumerate(candidates) if i in chosen]
+    rest = sorted((i for i in range(len(candidates)) if i not in chosen),
+                  key=lambda i: (-values[i], weights[i]))
+    return BudgetPlan(budget, selected, [candidates[i] for i in rest], strategy, policies)
+
+
+# ==============================================================================
+# Outline stubs
+# ==============================================================================
+
+_OUTLINE = re.compile(
+    r'^[ \t]*(?:'
+    r'(?:export\s+)?(?:default\s+)?(?:pub(?:\([\w:]+\))?\s+)?(?:async\s+)?'
+    r'(?:def|class|function|interface|struct|enum|trait|impl|fn|func|type|module|namespace|object)\b'
+    r'|(?:public|private|protected|internal|static|abstract|final)\s+[\w<>\[\], ]+\('
+    r'|#{1,6}\s'
+    r').*$',
+    re.MULTILINE,
+)
+
+
+def outline(text: str, max_lines: int = OUTLINE_MAX_LINES) -> str:
+    """Return the declaration lines of a source file (signatures, headings), trimmed."""
+    lines = []
+    for match in _OUTLINE.finditer(text):
+        lines.append(match.group(0).rstrip())
+        if len(lines) >= max_lines:
+            lines.append('...')
+            break
+    return '\n'.join(lines)
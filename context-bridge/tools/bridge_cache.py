@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Persistent scan cache
+プロジェクトごとに SQLite ファイルへスキャン結果を保存し、再スキャン時は
+stat シグネチャ (mtime/size/inode) が変わったファイルだけを再判定する。
+
+The cache lives under default_cache_dir() (override with the
+CONTEXT_BRIDGE_CACHE environment variable), one database per project root. Any cache failure
+(read-only home, corrupt file) silently disables caching.
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+from collections import namedtuple
+from pathlib import Path
+
+from bridge_trace import tracer
+
+# Bumped when cached verdicts change meaning (2: single-pass encoding detection)
+SCHEMA_VERSION = '2'
+
+
+def default_cache_dir() -> Path:
+    """Return the per-user cache directory for Context Bridge."""
+    override = os.environ.get('CONTEXT_BRIDGE_CACHE')
+    if override:
+        return Path(override)
+    if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+        return Path(os.environ['LOCALAPPDATA']) / 'context-bridge'
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'context-bridge'
+
+
+def project_cache_path(project_root: Path, suffix: str, cache_dir: Path = None) -> Path:
+    """Return <cache dir>/<project name>-<hash of its path><suffix> for a (resolved) project root."""
+    cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir()
+    key = hashlib.sha1(str(project_root).encode('utf-8')).hexdigest()[:16]
+    return cache_dir / f'{project_root.name}-{key}{suffix}'
+
+
+# stat signature + classification of one file
+FileRecord = namedtuple('FileRecord', 'mtime_ns size inode is_text encoding hash')
+
+
+def stat_signature(st) -> tuple:
+    """Return the (mtime_ns, size, inode) signature of an os.stat_result."""
+    # DirEntry.stat() leaves st_ino at 0 on Windows while fstat() fills it in
+    return (st.st_mtime_ns, st.st_size, st.st_ino if os.name != 'nt' else 0)
+
+
+def content_hash(data: bytes) -> str:
+    """Return the content hash used throughout the cache."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ScanCache:
+    """Per-project table of path -> FileRecord, persisted in SQLite.
+
+    Records are loaded into a dict on open and written back in a single
+    transaction by save(); all lookups are in-memory. Callers should only
+    use a ScanCache from one thread at a time.
+    """
+
+    def __init__(self, project_root: Path, cache_dir: Path = None):
+        self.project_root = Path(project_root).resolve()
+        self.db_path = project_cache_path(self.project_root, '.sqlite3', cache_dir)
+        self.records = {}
+        self.tokens = {}  # (content hash, counter name) -> token count
+        self._dirty_tokens = set()
+        self._dirty = set()
+        self._removed = set()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=5)
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is None or row[0] != SCHEMA_VERSION:
+            conn.execute('DROP TABLE IF EXISTS files')
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (str(self.project_root),))
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER, '
+            'is_text INTEGER, encoding TEXT, hash TEXT)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tokens ('
+            'hash TEXT, counter TEXT, count INTEGER, PRIMARY KEY (hash, counter))'
+        )
+        return conn
+
+    def _load(self):
+        if not self.db_path.exists():
+            return
+        try:
+            conn = self._connect()
+            try:
+                for row in conn.execute('SELECT * FROM files'):
+                    self.records[row[0]] = FileRecord(row[1], row[2], row[3], bool(row[4]), row[5], row[6])
+                for digest, counter, count in conn.execute('SELECT * FROM tokens'):
+                    self.tokens[(digest, counter)] = count
+            finally:
+                conn.close()
+        except Exception:
+            self.records = {}
+            self.tokens = {}
+
+    def lookup(self, rel: str, signature: tuple):
+        """Return the cached record if its signature still matches, else None."""
+        record = self.records.get(rel)
+        if record is not None and record[:3] == signature:
+            self.hits += 1
+            return record
+        self.misses += 1
+        return None
+
+    def store(self, rel: str, signature: tuple, is_text: bool, encoding: str = None, digest: str = None):
+        """Record a fresh classification for rel."""
+        old = self.records.get(rel)
+        if digest is None and old is not None and old[:3] == signature:
+            digest = old.hash
+        self.records[rel] = FileRecord(signature[0], signature[1], signature[2], is_text, encoding, digest)
+        self._dirty.add(rel)
+        self._removed.discard(rel)
+
+    def store_hash(self, rel: str, st, digest: str, encoding: str = None):
+        """Record the content hash (and decoded encoding) of rel as read under stat result st (from fstat)."""
+        signature = stat_signature(st)
+        old = self.records.get(rel)
+        if old is not None and old[:3] == signature:
+            encoding = encoding or old.encoding
+            if old.hash != digest or old.encoding != encoding:
+                self.records[rel] = old._replace(hash=digest, encoding=encoding)
+                self._dirty.add(rel)
+        else:
+            if encoding is None and old is not None:
+                encoding = old.encoding
+            self.store(rel, signature, True, encoding, digest)
+
+    def get_tokens(self, digest: str, counter: str):
+        """Return the cached token count of content `digest` under `counter`, or None."""
+        return self.tokens.get((digest, counter))
+
+    def put_tokens(self, digest: str, counter: str, count: int):
+        self.tokens[(digest, counter)] = count
+        self._dirty_tokens.add((digest, counter))
+
+    def retain(self, seen):
+        """Forget every record whose path is not in seen (after a full scan)."""
+        for rel in set(self.records) - set(seen):
+            del self.records[rel]
+            self._dirty.discard(rel)
+            self._removed.add(rel)
+
+    def save(self):
+        """Write pending changes to disk."""
+        if not self._dirty and not self._removed and not self._dirty_tokens:
+            return
+        with tracer.span('save cache', files=len(self._dirty), tokens=len(self._dirty_tokens)):
+            self._save()
+
+    def _save(self):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in self._removed])
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        [(p,) + tuple(self.records[p]) for p in self._dirty],
+                    )
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO tokens VALUES (?, ?, ?)',
+                        [key + (self.tokens[key],) for key in self._dirty_tokens],
+                    )
+                    # Drop counts of content no file has anymore
+                    if self._removed:
+                        conn.execute('DELETE FROM tokens WHERE hash NOT IN '
+                                     '(SELECT hash FROM files WHERE hash IS NOT NULL)')
+            finally:
+                conn.close()
+            self._dirty.clear()
+            self._removed.clear()
+            self._dirty_tokens.clear()
+        except Exception:
+            pass
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Command line interface
+GUI を起動せずにプロンプト生成・パッチ適用・統計を実行するコマンド。
+スクリプトや CI から使う。tkinter は読み込まない。
+
+Usage:
+    python tools/bridge_cli.py pack   [PATH ...] [--cwd DIR] -i "instruction" [-o prompt.txt] [--delta]
+                                      [--relevant N] [--reduce]
+    python tools/bridge_cli.py apply  [FILE | -] [--cwd DIR] [--check]
+    python tools/bridge_cli.py stats  [PATH ...] [--cwd DIR]
+    python tools/bridge_cli.py search "instruction" [--cwd DIR] [--limit N]
+
+Every command takes --json to print its result as one JSON object and
+--trace FILE to print where the time went to stderr and write a Chrome
+trace (CONTEXT_BRIDGE_TRACE does the same). Exit
+codes: 0 success, 1 some block failed to apply (or none was found, or no
+file is relevant), 2 bad arguments, 3 scan or I/O error.
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+from bridge_scan import ScanLimitExceeded
+from bridge_trace import tracer
+from bridge_sinks import FileSink, StdoutSink
+from bridge_patches import read_chunks
+from bridge_budget import POLICIES, STRATEGIES
+from bridge_core import (
+    APPLY_ATOMIC, APPLY_SIMILARITY, BUDGET_POLICIES, BUDGET_STRATEGY, PART_LIMIT, PART_UNIT, REDUCE_CONTEXT,
+    RELEVANT_FILES, TOKEN_BUDGET, TOKEN_COUNTER, Project,
+)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_ERROR = 3
+
+
+class UsageError(Exception):
+    """Bad command line arguments detected after parsing."""
+
+
+# ==============================================================================
+# Commands
+# ==============================================================================
+
+def _read_instruction(args) -> str:
+    if args.instruction_file is None:
+        return args.instruction
+    if args.instruction_file == '-':
+        return sys.stdin.read().strip()
+    return Path(args.instruction_file).read_text(encoding='utf-8').strip()
+
+
+def _part_path(output: Path, number: int, count: int) -> Path:
+    """prompt.txt -> prompt.part1of3.txt"""
+    return output.with_name(f"{output.stem}.part{number}of{count}{output.suffix}")
+
+
+def cmd_pack(project: Project, args) -> tuple:
+    instruction = _read_instruction(args)
+    if not instruction and not args.allow_empty:
+        raise UsageError("An instruction is required (-i, --instruction-file or --allow-empty)")
+    files = project.files(args.paths)
+    relevant = None
+    if args.relevant > 0:
+        if not instruction:
+            raise UsageError("--relevant needs an instruction to rank files by")
+        relevant = project.relevant(instruction, args.relevant)
+        picked = set(relevant['files'])
+        files = [f for f in files if project.index.rel(f) in picked]
+    if not files:
+        raise UsageError("No files to pack")
+    policies = args.policies.split('+')
+    unknown = [p for p in policies if p not in POLICIES]
+    if unknown:
+        raise UsageError(f"Unknown budget policy: {', '.join(unknown)} (choose from {', '.join(POLICIES)})")
+    if args.delta and args.no_cache:
+        raise UsageError("--delta needs the snapshot kept in the cache (drop --no-cache)")
+    output = Path(args.output) if args.output else None
+    if args.parts > 0 and output is None:
+        raise UsageError("--parts needs --output (one file is written per part)")
+
+    sink = FileSink(output) if output is not None else StdoutSink()
+    part_sink = (lambda i, n: FileSink(_part_path(output, i + 1, n))) if output is not None else None
+    try:
+        result = project.pack(instruction, files, sink, args.budget, policies,
+                              args.strategy, not args.no_outlines, args.parts, args.part_unit, part_sink,
+                              args.delta, args.reduce)
+    except ValueError as e:
+        sink.close()
+        if output is not None:
+            output.unlink()
+        raise UsageError(str(e))
+    result['relevant'] = relevant
+    if output is not None:
+        if result['parts'] > 1:
+            sink.close()
+            output.unlink()  # opened for the single prompt, unused
+            result['output'] = [str(_part_path(output, i + 1, result['parts']))
+                                for i in range(result['parts'])]
+        else:
+            result['output'] = str(output)
+    return result, EXIT_OK
+
+
+def cmd_apply(project: Project, args) -> tuple:
+    if args.input in (None, '-'):
+        result = project.apply(read_chunks(sys.stdin), args.atomic, args.check, args.similarity)
+    else:
+        with open(args.input, encoding='utf-8', newline='') as stream:
+            result = project.apply(read_chunks(stream), args.atomic, args.check, args.similarity)
+    ok = result['results'] and not result['failed'] and not result['issues']
+    return result, EXIT_OK if ok else EXIT_FAILED
+
+
+def cmd_stats(project: Project, args) -> tuple:
+    return project.stats(project.files(args.paths), exact=not args.estimate), EXIT_OK
+
+
+def cmd_search(project: Project, args) -> tuple:
+    result = project.relevant(args.query, args.limit, not args.no_imports)
+    return result, EXIT_OK if result['files'] else EXIT_FAILED
+
+
+# ==============================================================================
+# Output
+# ==============================================================================
+
+def _summary(command: str, result: dict) -> str:
+    if command == 'pack':
+        lines = [f"Packed {result['files']} files: {result['chars']:,} chars, "
+                 f"~{result['tokens']:,} tokens ({result['counter']})"]
+        if result['parts'] > 1:
+            lines.append(f"Split into {result['parts']} parts: " + ', '.join(result['output']))
+        delta = result['delta']
+        if delta is not None:
+            lines.append(f"Delta: {len(delta['added'])} added, {len(delta['modified'])} modified, "
+                         f"{len(delta['removed'])} removed, {len(delta['deselected'])} deselected (not sent), "
+                         f"{delta['unchanged']} unchanged")
+        reduction = result['reduction']
+        if reduction is not None:
+            saved = f", ~{reduction['tokens_saved']:,} tokens" if reduction['tokens_saved'] is not None else ''
+            lines.append(f"Reduced: {reduction['chars_saved']:,} chars{saved} saved "
+                         f"({len(reduction['duplicates'])} duplicates, {len(reduction['headers'])} headers, "
+                         f"{len(reduction['truncated'])} data files cut)")
+        relevant = result['relevant']
+        if relevant is not None:
+            lines.append(f"Relevant: {len(relevant['mentioned'])} named, {len(relevant['ranked'])} ranked, "
+                         f"{len(relevant['imported'])} imported")
+        budget = result['budget']
+        if budget is not None:
+            lines.append(f"Budget: {budget['overhead'] + budget['used']:,} / {budget['budget']:,} tokens "
+                         f"(prompt {budget['overhead']:,}, context {budget['used']:,} / "
+                         f"{budget['context_budget']:,}), "
+                         f"{len(budget['outlined'])} outlined, {len(budget['omitted'])} omitted")
+        return '\n'.join(lines)
+    if command == 'apply':
+        lines = [f"line {i['line']}: {i['message']}" for i in result['issues']]
+        lines += [r['message'] for r in result['results']]
+        if not result['results']:
+            lines.append("No SEARCH/REPLACE blocks found")
+        verb = 'would apply' if result['dry_run'] else 'applied'
+        lines.append(f"{result['applied']} {verb}, {result['failed']} failed")
+        return '\n'.join(lines)
+    if command == 'search':
+        lines = [f"named     {rel}" for rel in result['mentioned']]
+        lines += [f"{r['score']:8.2f}  {r['file']}" for r in result['ranked']]
+        lines += [f"imported  {rel}" for rel in result['imported']]
+        return '\n'.join(lines) if lines else "No relevant files found"
+    pending = f", {result['estimated']} estimated" if result['estimated'] else ''
+    return (f"{result['files']} files, {result['bytes']:,} bytes, "
+            f"~{result['tokens']:,} tokens ({result['counter']}{pending})")
+
+
+def _report(command: str, result: dict, args):
+    # The prompt itself may be on stdout; the report then goes to stderr
+    stream = sys.stderr if command == 'pack' and not args.output else sys.stdout
+    if args.json:
+        json.dump(result, stream, ensure_ascii=False)
+        stream.write('\n')
+    else:
+        print(_summary(command, result), file=stream)
+
+
+def _report_trace(mark):
+    if mark is None:
+        return
+    for line in tracer.report(mark):
+        print(f"trace: {line}", file=sys.stderr)
+    try:
+        print(f"trace: written to {tracer.export()}", file=sys.stderr)
+    except OSError as e:
+        print(f"trace: cannot write {tracer.path}: {e}", file=sys.stderr)
+
+
+# ==============================================================================
+# Argument parsing
+# ==============================================================================
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='bridge_cli', description="Context Bridge without the GUI.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--cwd', default='.', help="project root (default: current directory)")
+    common.add_argument('--json', action='store_true', help="print the result as JSON")
+    common.add_argument('--no-cache', action='store_true',
+                        help="do not read or write the scan cache and undo journal")
+    common.add_argument('--counter', default=TOKEN_COUNTER, choices=('auto', 'tiktoken', 'bpe', 'approx'),
+                        help="token counter")
+    common.add_argument('--trace', metavar='FILE',
+                        help="print phase timings to stderr and write a Chrome trace to FILE")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    pack = commands.add_parser('pack', parents=[common], help="write the prompt for the project")
+    pack.add_argument('paths', nargs='*', help="files or folders to include (default: all)")
+    pack.add_argument('-i', '--instruction', default='', help="instruction for the AI")
+    pack.add_argument('--instruction-file', help="read the instruction from a file ('-' for stdin)")
+    pack.add_argument('--allow-empty', action='store_true', help="pack without an instruction")
+    pack.add_argument('-o', '--output', help="write the prompt to a file instead of stdout")
+    pack.add_argument('--budget', type=int, default=TOKEN_BUDGET, help="token limit (0 = unlimited)")
+    pack.add_argument('--policies', default='+'.join(BUDGET_POLICIES),
+                      help="budget priorities joined with '+' (mentioned, recent, small)")
+    pack.add_argument('--strategy', default=BUDGET_STRATEGY, choices=STRATEGIES)
+    pack.add_argument('--no-outlines', action='store_true', help="no outline stubs for dropped files")
+    pack.add_argument('--parts', type=int, default=PART_LIMIT, help="split into parts of at most this size")
+    pack.add_argument('--part-unit', default=PART_UNIT, choices=('chars', 'tokens'))
+    pack.add_argument('--delta', action='store_true',
+                      help="only what changed since the last pack (everything if there was none)")
+    pack.add_argument('--reduce', action='store_true', default=REDUCE_CONTEXT,
+                      help="send duplicate files and shared headers once, drop trailing whitespace "
+                           "and extra blank lines, cut long data files (not with --budget or --parts)")
+    pack.add_argument('--relevant', type=int, default=0, metavar='N',
+                      help="pack only the files named in the instruction, the N most relevant to it "
+                           "and the files they import")
+
+    apply = commands.add_parser('apply', parents=[common], help="apply SEARCH/REPLACE blocks")
+    apply.add_argument('input', nargs='?', help="file holding the AI response (default: stdin)")
+    apply.add_argument('--check', action='store_true', help="locate every block but write nothing")
+    apply.add_argument('--no-atomic', dest='atomic', action='store_false', default=APPLY_ATOMIC,
+                       help="apply the blocks that match even if others fail")
+    apply.add_argument('--similarity', type=float, default=APPLY_SIMILARITY,
+                       help="0-1, how alike the closest lines must be when a block matches "
+                            "neither exactly nor ignoring whitespace (0 = never)")
+
+    stats = commands.add_parser('stats', parents=[common], help="count files, bytes and tokens")
+    stats.add_argument('paths', nargs='*', help="files or folders to count (default: all)")
+    stats.add_argument('--estimate', action='store_true', help="estimate uncached counts from file sizes")
+
+    search = commands.add_parser('search', parents=[common], help="list the files relevant to an instruction")
+    search.add_argument('query', help="instruction or keywords (Japanese works too)")
+    search.add_argument('--limit', type=int, default=RELEVANT_FILES, help="ranked files to list")
+    search.add_argument('--no-imports', action='store_true', help="do not add the files they import")
+    return parser
+
+
+COMMANDS = {'pack': cmd_pack, 'apply': cmd_apply, 'stats': cmd_stats, 'search': cmd_search}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        tracer.enable(args.trace)
+    else:
+        tracer.enable_from_env()
+    mark = tracer.mark()
+    try:
+        with tracer.span(args.command):
+            project = Project(args.cwd, use_cache=not args.no_cache, counter=args.counter)
+            result, code = COMMANDS[args.command](project, args)
+    except (UsageError, NotADirectoryError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except (ScanLimitExceeded, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        _report_trace(mark)
+    _report(args.command, result, args)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,986 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Core
+GUI に依存しない処理（ファイル収集・プロンプト生成・パッチ適用）と、
+スクリプトから使うためのライブラリ API。tkinter を読み込まない。
+
+bridge_gui and bridge_cli are both built on this module. Project bundles
+one project root with its index, scan cache, token counts and undo
+journal; pack(), apply(), stats() and relevant() return plain dicts that can be
+written out as JSON as they are.
+"""
+
+import os
+from pathlib import Path
+
+from bridge_ignore import IgnoreMatcher, compile_name_patterns, read_gitignore
+from bridge_scan import ScanLimitExceeded, ordered_map, read_file_bytes, read_file_stat, sniff_file
+from bridge_cache import ScanCache, content_hash, stat_signature
+from bridge_index import ProjectIndex
+from bridge_encoding import decode_text
+from bridge_fragments import FragmentCache
+from bridge_mapped import LARGE_FILE_SIZE, MappedText, map_text
+from bridge_delta import DELTA_PROMPT, Delta, Snapshot, render_change
+from bridge_sinks import StringSink, write_prompt
+from bridge_tokens import FileTokenCounts, file_wrapper, get_token_counter
+from bridge_budget import Candidate, estimate_tokens, outline, plan_budget
+from bridge_parts import plan_parts
+from bridge_patches import iter_patches
+from bridge_apply import apply_patches as apply_batch, plan_patches
+from bridge_journal import Journal
+from bridge_search import SearchIndex
+from bridge_reduce import Reducer
+from bridge_trace import tracer
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+
+# Default excluded directories (always ignored)
+DEFAULT_EXCLUDED_DIRS = {
+    '.git', '.agent', '__pycache__', 'node_modules', '.venv', 'venv', 'env',
+    '.idea', '.vscode', '.vs', 'dist', 'build', '.next', '.nuxt',
+    'coverage', '.pytest_cache', '.mypy_cache', '.tox', 'eggs',
+    '*.egg-info', '.eggs', 'bower_components', 'jspm_packages',
+    '.cache', 'tmp', 'temp', '.temp', '.tmp'
+}
+
+# Binary file extensions (always excluded)
+BINARY_EXTENSIONS = {
+    '.exe', '.dll', '.so', '.dylib', '.bin', '.obj', '.o', '.a',
+    '.lib', '.pyc', '.pyo', '.pyd', '.class', '.jar', '.war',
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.svg',
+    '.mp3', '.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.wav',
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.zip', '.tar', '.gz', '.rar', '.7z', '.bz2', '.xz',
+    '.ttf', '.otf', '.woff', '.woff2', '.eot',
+    '.db', '.sqlite', '.sqlite3', '.mdb',
+    '.lock', '.ico'
+}
+
+# Scan limits so runaway trees (generated output, symlink farms) abort early
+MAX_SCAN_DEPTH = 64
+MAX_SCAN_FILES = 200000
+
+# Files read ahead of the prompt writer (bounds memory while streaming)
+PACK_READ_AHEAD = 16
+
+# Token counter: 'auto' (tiktoken > bundled BPE vocab > approximation), 'bpe' or 'approx'
+TOKEN_COUNTER = 'auto'
+# Token budget for the whole prompt (0 = unlimited) and how it is filled
+TOKEN_BUDGET = 0
+BUDGET_POLICIES = ('mentioned', 'recent')
+BUDGET_STRATEGY = 'greedy'
+
+# Apply patches all-or-nothing: one failed block leaves every file untouched
+APPLY_ATOMIC = True
+# Similarity (0-1) a block that matches neither exactly nor ignoring
+# whitespace needs to be applied to the closest lines (0 = never)
+APPLY_SIMILARITY = 0.9
+
+# Outline stubs are not attempted once fewer tokens than this are left
+OUTLINE_MIN_TOKENS = 64
+
+# Split the prompt into parts of at most this size for chats that limit one
+# paste (0 = single paste); PART_UNIT is 'chars' or 'tokens'
+PART_LIMIT = 0
+PART_UNIT = 'chars'
+
+# Reduce the packed context: duplicate files once, shared license headers
+# once, trailing whitespace and blank line runs dropped, data files cut
+REDUCE_CONTEXT = False
+
+# Files ranked relevant to the instruction that are preselected, besides
+# the files it names and the files they import
+RELEVANT_FILES = 20
+
+# System prompt for Web AI
+SYSTEM_PROMPT = """あなたは熟練したソフトウェアエンジニアです。\
+以下のルールに**厳密に**従ってください。
+
+## 絶対ルール
+1. コードの変更は**必ず**以下のブロック形式で出力すること：
+
+<<<< SEARCH path/to/file.ext
+検索対象の既存コード（変更前のコード）
+====
+置換後の新しいコード
+>>>>
+
+2. 新規ファイル作成の場合は、SEARCHブロックを空にする：
+
+<<<< SEARCH path/to/newfile.ext
+====
+新規ファイルの内容
+>>>>
+
+3. ファイル削除の場合は、REPLACEブロックを空にする：
+
+<<<< SEARCH path/to/deletefile.ext
+削除するファイルの内容
+====
+>>>>
+
+4. 変更がない説明文は、コードブロックの**外に**記述すること
+5. 各SEARCHブロックは、対象ファイル内で**一意に特定できる**十分な文脈を含めること
+6. インデント・空白は**正確に**保持すること
+
+## 出力例
+ファイル `src/main.py` の関数名を変更する場合：
+
+<<<< SEARCH src/main.py
+def old_function_name():
+    print("Hello")
+====
+def new_function_name():
+    print("Hello, World!")
+>>>>
+
+---
+以下はプロジェクトのファイル一覧とその内容です。\
+ユーザーの指示に従って修正を行ってください。
+"""
+
+# ==============================================================================
+# Utility Functions
+# ==============================================================================
+
+def parse_gitignore(project_root: Path) -> list:
+    """Parse .gitignore file and return list of patterns."""
+    return read_gitignore(project_root / '.gitignore')
+
+
+# Compiled once: literal names use a set lookup, globs share one regex
+_is_default_excluded = compile_name_patterns(DEFAULT_EXCLUDED_DIRS)
+
+_matcher_cache = {}
+
+
+def build_ignore_matcher(project_root: Path, gitignore_patterns: list = None) -> IgnoreMatcher:
+    """Compile the root .gitignore (and lazily, nested ones) for project_root."""
+    return IgnoreMatcher(project_root, gitignore_patterns)
+
+
+def _get_matcher(project_root: Path, gitignore_patterns) -> IgnoreMatcher:
+    """Return a compiled matcher, reusing one per (root, patterns) pair."""
+    if isinstance(gitignore_patterns, IgnoreMatcher):
+        return gitignore_patterns
+    key = (str(project_root), tuple(gitignore_patterns))
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        if len(_matcher_cache) > 16:
+            _matcher_cache.clear()
+        matcher = _matcher_cache[key] = IgnoreMatcher(project_root, gitignore_patterns)
+    return matcher
+
+
+def should_ignore(path: Path, project_root: Path, gitignore_patterns, is_dir: bool = None) -> bool:
+    """Check if a path should be ignored based on .gitignore patterns and defaults.
+
+    gitignore_patterns may be the list returned by parse_gitignore() or an
+    IgnoreMatcher; lists are compiled once and cached.
+    """
+    rel_path = path.relative_to(project_root)
+    parts = rel_path.parts
+    
+    # Check default excluded directories
+    for part in parts:
+        if _is_default_excluded(part):
+            return True
+    
+    if is_dir is None:
+        is_dir = path.is_dir()
+    
+    # Check binary extensions
+    if not is_dir and path.suffix.lower() in BINARY_EXTENSIONS:
+        return True
+    
+    # Check .gitignore patterns
+    return _get_matcher(project_root, gitignore_patterns).match('/'.join(parts), is_dir)
+
+
+def is_text_file(file_path: Path) -> bool:
+    """Check if a file is a text file by reading first bytes."""
+    try:
+        return sniff_file(file_path) is not None
+    except Exception:
+        return False
+
+
+def _entry_ignored(rel: str, name: str, is_dir: bool, matcher: IgnoreMatcher) -> bool:
+    """should_ignore() for a walker entry whose parents were already checked."""
+    if _is_default_excluded(name):
+        return True
+    if not is_dir and os.path.splitext(name)[1].lower() in BINARY_EXTENSIONS:
+        return True
+    return matcher.match(rel, is_dir)
+
+
+def make_ignore_predicate(project_root: Path):
+    """Return is_ignored(rel, name, is_dir) for walkers/indexes of project_root."""
+    matcher = build_ignore_matcher(project_root)
+    return lambda rel, name, is_dir: _entry_ignored(rel, name, is_dir, matcher)
+
+
+def build_project_index(project_root: Path, cache: ScanCache = None,
+                        max_depth: int = MAX_SCAN_DEPTH,
+                        max_files: int = MAX_SCAN_FILES) -> ProjectIndex:
+    """Create an (unscanned) ProjectIndex using the default ignore rules."""
+    return ProjectIndex(project_root, make_ignore_predicate, cache=cache,
+                        max_depth=max_depth, max_files=max_files)
+
+
+def collect_files(project_root: Path, max_depth: int = MAX_SCAN_DEPTH,
+                  max_files: int = MAX_SCAN_FILES, cache: ScanCache = None) -> list:
+    """Collect all text files in the project, respecting .gitignore.
+
+    Ignored directories are pruned without being walked. With a ScanCache,
+    files whose stat signature is unchanged reuse their cached verdict and
+    are not opened. Raises ScanLimitExceeded (carrying the partial, sorted
+    file list) when max_depth or max_files is hit.
+    """
+    index = build_project_index(project_root, cache, max_depth, max_files)
+    index.rescan()
+    files = list(index.files())
+    if index.truncated:
+        raise ScanLimitExceeded(f"Scan stopped early: {index.truncated}", files)
+    return files
+
+
+def decode_content(data: bytes) -> str:
+    """Decode file bytes, detecting the encoding in one pass (see bridge_encoding)."""
+    return decode_text(data)[0]
+
+
+def read_file_content(file_path: Path) -> str:
+    """Read file content, detecting its encoding.
+
+    Binary files are only skipped when collecting; a file asked for is
+    decoded even if it holds NUL bytes (latin-1 accepts any bytes).
+    """
+    try:
+        _, data = read_file_bytes(file_path, sniff=False)
+    except Exception as e:
+        return f"[Error reading file: {e}]"
+    return decode_content(data)
+
+
+def _read_for_pack(item: tuple, mapped: bool = False,
+                   fragments: FragmentCache = None) -> tuple:
+    """Read and decode one file on the I/O pool.
+
+    Returns (content, fstat or None, hash or None, encoding or None).
+
+    item is (path, hint); hint is the (stat signature, encoding) recorded
+    for the file, used only if the file is unchanged since. With mapped,
+    a UTF-8 file of LARGE_FILE_SIZE or more comes back as a MappedText
+    instead (see bridge_mapped), which is not kept in fragments. Like
+    read_file_content(), the file is not classified again.
+    """
+    file_path, hint = item
+    try:
+        if mapped and os.stat(file_path).st_size >= LARGE_FILE_SIZE:
+            content, st, digest = map_text(file_path)
+            if content is not None:
+                return content, st, digest, content.encoding
+        _, data, st = read_file_stat(file_path, sniff=False)
+    except Exception as e:
+        return f"[Error reading file: {e}]", None, None, None
+    digest = content_hash(data)
+    content = fragments.text_for(file_path, digest) if fragments is not None else None
+    encoding = None
+    if content is None:
+        known = hint[1] if hint is not None and hint[0] == stat_signature(st) else None
+        content, encoding = decode_text(data, known)
+    if fragments is not None:
+        fragments.store(file_path, st, digest, content)
+    return content, st, digest, encoding
+
+
+def _iter_read(files: list, project_root: Path, cache: ScanCache = None,
+               tokens: FileTokenCounts = None, mapped: bool = False,
+               fragments: FragmentCache = None):
+    """Yield (rel, content, token count or None, hash or None) per file, in the order of `files`.
+
+    With a FragmentCache, files still in it with an unchanged stat
+    signature are not read again, and the files read are added to it.
+    The others are read concurrently on the I/O pool, but only a bounded
+    number are held at once. With a ScanCache, the content hash of every
+    file is recorded; with FileTokenCounts, its token count too.
+    With mapped, large UTF-8 files are yielded as a MappedText, which the
+    caller closes.
+    """
+    rels = [str(file_path.relative_to(project_root)).replace('\\', '/') for file_path in files]
+    if fragments is not None:
+        cached = [fragments.lookup(file_path) for file_path in files]
+    else:
+        cached = [None] * len(files)
+    # Encodings detected at scan time (or by an earlier pack) are tried first
+    records = cache.records if cache is not None else {}
+    missing = []
+    for file_path, rel_str, hit in zip(files, rels, cached):
+        if hit is None:
+            record = records.get(rel_str)
+            hint = (record[:3], record.encoding) if record is not None and record.encoding else None
+            missing.append((file_path, hint))
+    tracer.count('fragment hits', len(files) - len(missing))
+
+    def read(item):
+        with tracer.span('read', file=item[0].name):
+            return _read_for_pack(item, mapped, fragments)
+    contents = ordered_map(read, missing, window=PACK_READ_AHEAD)
+    for rel_str, hit in zip(rels, cached):
+        if hit is not None:
+            content, st, digest = hit
+            encoding = None
+        else:
+            content, st, digest, encoding = next(contents)
+        n = None
+        if cache is not None and st is not None:
+            cache.store_hash(rel_str, st, digest, encoding)
+        if tokens is not None and st is not None:
+            n = tokens.record(rel_str, stat_signature(st), digest, content)
+        yield rel_str, content, n, digest
+
+
+def iter_context_xml(files: list, project_root: Path, cache: ScanCache = None,
+                     tokens: FileTokenCounts = None, record=None, mapped: bool = False,
+                     reducer: Reducer = None, fragments: FragmentCache = None):
+    """Yield the packed XML context piece by piece (see _iter_read).
+
+    record(rel, hash, content) is called for every file sent (e.g.
+    SnapshotWriter.add), with its content as it is on disk. With mapped, the
+    content of a large UTF-8 file is yielded as a MappedText, valid until
+    the next piece is requested; pass it only to sinks (see bridge_sinks).
+    With a Reducer, every file goes through it (see bridge_reduce).
+    """
+    pieces = _iter_read(files, project_root, cache, tokens, mapped, fragments)
+    for i, (rel_str, content, n, digest) in enumerate(pieces):
+        try:
+            if record is not None and digest is not None:
+                record(rel_str, digest, content)
+            if i:
+                yield '\n\n'
+            if reducer is None:
+                note, attrs, text = '', '', content
+            else:
+                note, attrs, text = reducer.reduce(rel_str, content, digest, n)
+            if note:
+                yield note + '\n'
+            if text is None:
+                yield f'<file path="{rel_str}"{attrs} />'
+                continue
+            yield f'<file path="{rel_str}"{attrs}>\n'
+            yield text
+            yield '\n</file>'
+        finally:
+            if isinstance(content, MappedText):
+                content.close()
+    
+    if cache is not None:
+        cache.save()
+
+
+def pack_context_xml(files: list, project_root: Path, cache: ScanCache = None,
+                     reducer: Reducer = None, fragments: FragmentCache = None) -> str:
+    """Pack file contents into XML format (reduced, with a Reducer)."""
+    context = iter_context_xml(files, project_root, cache, reducer=reducer, fragments=fragments)
+    return write_prompt(context, StringSink())
+
+
+def budget_candidates(files: list, project_root: Path, tokens: FileTokenCounts = None,
+                      signatures: dict = None) -> list:
+    """Describe files for plan_budget(), with cached token counts where still valid.
+
+    signatures (rel -> stat signature, e.g. from the ProjectIndex) saves a
+    stat call per file; files without a cached count get a size estimate.
+    """
+    candidates = []
+    for file_path in files:
+        rel_str = str(file_path.relative_to(project_root)).replace('\\', '/')
+        signature = signatures.get(rel_str) if signatures else None
+        if signature is None:
+            try:
+                signature = stat_signature(file_path.stat())
+            except OSError:
+                continue
+        n = tokens.lookup(rel_str, signature) if tokens is not None else None
+        exact = n is not None
+        if not exact:
+            n = estimate_tokens(signature[1])
+        candidates.append(Candidate(rel_str, file_path, n, signature[0], exact))
+    return candidates
+
+
+def iter_context_budget(plan, project_root: Path, tokens: FileTokenCounts,
+                        cache: ScanCache = None, outlines: bool = True, record=None,
+                        fragments: FragmentCache = None):
+    """Yield the XML context of a BudgetPlan, never exceeding plan.budget tokens.
+
+    Selected files are counted exactly as they are read; one that turns out
+    larger than the remaining budget is skipped (plan.overflow). With
+    outlines, the dropped files follow in priority order as
+    <file outline="true"> stubs holding only their declarations, while they
+    fit. plan.used and plan.outlined are filled in as the context is written.
+    record is called for the files sent whole, as in iter_context_xml().
+    fragments is passed on to _iter_read().
+    """
+    counter = tokens.counter
+    left = plan.budget
+    first = True
+    selected = [c.path for c in plan.selected]
+    for rel_str, content, n, digest in _iter_read(selected, project_root, cache, tokens,
+                                                  fragments=fragments):
+        if n is None:
+            n = counter.count(content) + counter.count(file_wrapper(rel_str))
+        if n > left:
+            plan.overflow.append(rel_str)
+            continue
+        left -= n
+        plan.used += n
+        if record is not None and digest is not None:
+            record(rel_str, digest, content)
+        if not first:
+            yield '\n\n'
+        first = False
+        yield f'<file path="{rel_str}">\n'
+        yield content
+        yield '\n</file>'
+    
+    if outlines and plan.dropped and left >= OUTLINE_MIN_TOKENS:
+        note = ('\n\n<!-- outline="true": declarations only, '
+                'file content omitted to fit the context -->')
+        note_tokens = counter.count(note)
+        for rel_str, content, _, _ in _iter_read([c.path for c in plan.dropped], project_root,
+                                                  fragments=fragments):
+            if left < OUTLINE_MIN_TOKENS + note_tokens:
+                break
+            stub = outline(content)
+            if not stub:
+                continue
+            head = f'<file path="{rel_str}" outline="true">\n'
+            n = counter.count(head) + counter.count(stub) + counter.count('\n</file>\n\n')
+            if n + note_tokens > left:
+                continue
+            if note:
+                yield note
+                left -= note_tokens
+                plan.used += note_tokens
+                note, note_tokens = '', 0
+            left -= n
+            plan.used += n
+            plan.outlined.append(rel_str)
+            yield '\n\n'
+            yield head
+            yield stub
+            yield '\n</file>'
+    
+    if cache is not None:
+        cache.save()
+
+
+def _instruction_block(instruction: str) -> str:
+    return f"""
+
+---
+## User Instruction
+{instruction}
+"""
+
+
+def prompt_overhead(counter, instruction: str) -> int:
+    """Tokens of the prompt outside the XML context (system prompt + instruction)."""
+    return counter.count(SYSTEM_PROMPT + '\n\n') + counter.count(_instruction_block(instruction))
+
+
+def iter_prompt(files: list, project_root: Path, instruction: str, cache: ScanCache = None,
+                tokens: FileTokenCounts = None, context=None, mapped: bool = False,
+                fragments: FragmentCache = None):
+    """Yield the full prompt (system prompt, XML context, instruction) piece by piece.
+
+    context replaces the XML context of files (e.g. iter_context_budget()).
+    mapped and fragments are passed on to iter_context_xml().
+    """
+    yield SYSTEM_PROMPT
+    yield '\n\n'
+    if context is None:
+        context = iter_context_xml(files, project_root, cache, tokens, mapped=mapped,
+                                   fragments=fragments)
+    yield from context
+    yield _instruction_block(instruction)
+
+
+def plan_prompt_parts(files: list, project_root: Path, instruction: str, limit: int,
+                      measure=len, cache: ScanCache = None, record=None,
+                      fragments: FragmentCache = None):
+    """Lay the prompt for files out into parts of at most limit (see bridge_parts).
+
+    Files are read once here to measure them and again, part by part, by
+    iter_prompt_parts(); only one file is held at a time while planning.
+    record is called for every file, as in iter_context_xml().
+    """
+    def documents():
+        for rel, content, _, digest in _iter_read(files, project_root, cache, fragments=fragments):
+            if record is not None and digest is not None:
+                record(rel, digest, content)
+            yield rel, content
+
+    plan = plan_parts(documents(), limit, measure, SYSTEM_PROMPT + '\n\n',
+                      _instruction_block(instruction))
+    if cache is not None:
+        cache.save()
+    return plan
+
+
+def iter_prompt_parts(plan, files: list, project_root: Path, fragments: FragmentCache = None):
+    """Yield the text of each part of a plan_prompt_parts() plan, one at a time."""
+    def read(numbers):
+        pieces = _iter_read([files[i] for i in numbers], project_root, fragments=fragments)
+        return (content for _, content, _, _ in pieces)
+    return plan.iter_parts(read)
+
+
+def _hash_for_delta(file_path: Path) -> tuple:
+    """Hash one file on the I/O pool: (hash, fstat), or (None, None) if unreadable."""
+    try:
+        _, data, st = read_file_stat(file_path, sniff=False)
+    except OSError:
+        return None, None
+    return content_hash(data), st
+
+
+def current_hashes(files: list, project_root: Path, cache: ScanCache = None,
+                   fragments: FragmentCache = None) -> dict:
+    """Return rel -> content hash of the readable files, in the order of files.
+
+    Hashes still valid in fragments or the ScanCache are reused; only the
+    other files are read.
+    """
+    hashes = {}
+    missing = []
+    for file_path in files:
+        rel_str = str(file_path.relative_to(project_root)).replace('\\', '/')
+        hashes[rel_str] = None  # keeps the order of files
+        hit = fragments.lookup(file_path) if fragments is not None else None
+        if hit is not None:
+            hashes[rel_str] = hit[2]
+            continue
+        record = cache.records.get(rel_str) if cache is not None else None
+        if record is not None and record.hash:
+            try:
+                if record[:3] == stat_signature(file_path.stat()):
+                    hashes[rel_str] = record.hash
+                    continue
+            except OSError:
+                pass
+        missing.append((rel_str, file_path))
+    results = ordered_map(_hash_for_delta, [path for _, path in missing], window=PACK_READ_AHEAD)
+    for (rel_str, _), (digest, st) in zip(missing, results):
+        hashes[rel_str] = digest
+        if cache is not None and digest is not None:
+            cache.store_hash(rel_str, st, digest)
+    return {rel: digest for rel, digest in hashes.items() if digest is not None}
+
+
+def plan_delta(files: list, project_root: Path, snapshot: Snapshot, cache: ScanCache = None,
+               fragments: FragmentCache = None) -> Delta:
+    """Compare files with what the snapshot says was last sent."""
+    current = current_hashes(files, project_root, cache, fragments)
+    return Delta(current, snapshot.files, project_root)
+
+
+def iter_context_delta(delta: Delta, project_root: Path, snapshot: Snapshot, writer=None,
+                       cache: ScanCache = None, tokens: FileTokenCounts = None,
+                       fragments: FragmentCache = None):
+    """Yield the <changes> manifest, then each added or modified file (see bridge_delta).
+
+    Unchanged files are not read. writer (a SnapshotWriter started from
+    delta.unchanged_hashes()) records the files sent.
+    """
+    yield delta.manifest(snapshot.time)
+    unchanged = set(delta.unchanged)
+    modified = set(delta.modified)
+    paths = [project_root / rel for rel in delta.current if rel not in unchanged]
+    for rel_str, content, _, digest in _iter_read(paths, project_root, cache, tokens,
+                                                  fragments=fragments):
+        old = snapshot.text(delta.previous[rel_str]) if rel_str in modified else None
+        yield '\n\n'
+        yield render_change(rel_str, content, rel_str in modified, old)
+        if writer is not None and digest is not None:
+            writer.add(rel_str, digest, content)
+    
+    if cache is not None:
+        cache.save()
+
+
+def iter_delta_prompt(delta: Delta, project_root: Path, instruction: str, snapshot: Snapshot,
+                      writer=None, cache: ScanCache = None, tokens: FileTokenCounts = None,
+                      fragments: FragmentCache = None):
+    """Yield a follow-up prompt holding only the changes since the snapshot."""
+    yield DELTA_PROMPT
+    yield '\n'
+    yield from iter_context_delta(delta, project_root, snapshot, writer, cache, tokens, fragments)
+    yield _instruction_block(instruction)
+
+
+def delta_report(delta: Delta) -> dict:
+    """A JSON-friendly summary of a Delta."""
+    return {
+        'added': list(delta.added),
+        'modified': list(delta.modified),
+        'removed': list(delta.removed),
+        'deselected': list(delta.deselected),
+        'unchanged': len(delta.unchanged),
+    }
+
+
+def parse_patches(text: str, issues: list = None) -> list:
+    """Parse SEARCH/REPLACE blocks from text (or an iterable of text chunks).
+
+    Malformed blocks are appended to issues as ParseIssue(line, message).
+    """
+    with tracer.span('parse'):
+        return list(iter_patches(text, issues))
+
+
+def _read_for_apply(file_path: Path) -> tuple:
+    """Decode a patch target: (text, raw bytes, encoding).
+
+    Raises instead of returning an error string.
+    """
+    is_text, data = read_file_bytes(file_path)
+    if not is_text:
+        raise ValueError("Binary file")
+    text, encoding = decode_text(data)
+    return text, data, encoding
+
+
+def read_for_search(file_path: Path):
+    """Decoded text of a file for the search index.
+
+    Returns '' for large files (indexed by path only) and None if the file
+    is unreadable.
+    """
+    try:
+        if os.stat(file_path).st_size >= LARGE_FILE_SIZE:
+            return ''
+        is_text, data = read_file_bytes(file_path)
+    except OSError:
+        return None
+    return decode_content(data) if is_text else None
+
+
+def apply_patches(patches: list, project_root: Path, journal: Journal = None,
+                  atomic: bool = False, similarity: float = APPLY_SIMILARITY) -> list:
+    """Apply a batch of patches; returns (success, message) per patch.
+
+    Each target file is read once, every block is located against it
+    (exact match, then whitespace-insensitive line match through a line
+    index, then the closest unique lines at least similarity alike) and
+    all changed files are replaced together through synced temp files.
+    With a Journal the batch can be undone; with atomic, nothing is
+    written unless every block applies.
+    """
+    return apply_batch(patches, project_root, _read_for_apply, journal, atomic, similarity)
+
+
+def apply_patch(patch: dict, project_root: Path) -> tuple:
+    """Apply a single patch to a file. Returns (success, message)."""
+    return apply_patches([patch], project_root)[0]
+
+
+# ==============================================================================
+# Library API
+# ==============================================================================
+
+def select_files(files: list, project_root: Path, paths) -> tuple:
+    """Keep the files that are one of paths or lie below one of them.
+
+    paths are project-relative files or folders ('' or '.' for all).
+    Returns (selected files in their original order, paths that matched nothing).
+    """
+    wanted = {}
+    for path in paths:
+        rel = str(path).replace('\\', '/').strip('/')
+        wanted[rel if rel != '.' else ''] = path
+    hit = set()
+    selected = []
+    for file_path in files:
+        rel = str(file_path.relative_to(project_root)).replace('\\', '/')
+        for key in (rel, *_folders_of(rel)):
+            if key in wanted:
+                hit.add(key)
+                selected.append(file_path)
+                break
+    return selected, [path for rel, path in wanted.items() if rel not in hit]
+
+
+def _folders_of(rel: str):
+    while rel:
+        rel = rel.rpartition('/')[0]
+        yield rel
+
+
+def budget_report(plan, overhead: int = 0) -> dict:
+    """A JSON-friendly summary of a BudgetPlan after packing.
+
+    budget is the limit of the whole prompt as requested; overhead (system
+    prompt + instruction) comes off it, leaving context_budget for the
+    files, of which used went into the context.
+    """
+    overflow = set(plan.overflow)
+    return {
+        'budget': plan.budget + overhead,
+        'overhead': overhead,
+        'context_budget': plan.budget,
+        'used': plan.used,
+        'strategy': plan.strategy,
+        'policies': list(plan.policies),
+        'packed': [c.rel for c in plan.selected if c.rel not in overflow],
+        'outlined': list(plan.outlined),
+        'omitted': plan.omitted(),
+    }
+
+
+class Project:
+    """One project root for scripted pack / apply / stats runs (no GUI needed).
+
+    The index is scanned on first use and reused by later calls. With
+    use_cache, stat verdicts, content hashes and token counts persist
+    across runs (see bridge_cache), applied batches go to the same undo
+    journal and packed files to the same delta snapshot the GUI uses;
+    without it nothing is written outside the project. counter is a
+    TOKEN_COUNTER kind or a TokenCounter. A driver that packs the same
+    project repeatedly can pass a FragmentCache to keep file contents
+    between packs (see bridge_fragments).
+    """
+
+    def __init__(self, project_root, use_cache: bool = True, counter=TOKEN_COUNTER,
+                 max_depth: int = MAX_SCAN_DEPTH, max_files: int = MAX_SCAN_FILES,
+                 fragments: FragmentCache = None):
+        self.root = Path(project_root).resolve()
+        if not self.root.is_dir():
+            raise NotADirectoryError(f"Directory does not exist: {self.root}")
+        self.cache = ScanCache(self.root) if use_cache else None
+        self.journal = Journal(self.root) if use_cache else None
+        self.snapshot = Snapshot(self.root) if use_cache else None
+        if isinstance(counter, str):
+            counter = get_token_counter(counter)
+        self.tokens = FileTokenCounts(counter, self.cache)
+        self.index = build_project_index(self.root, self.cache, max_depth, max_files)
+        self.search_index = SearchIndex(self.root, persist=use_cache)
+        self.fragments = fragments
+        self._scanned = False
+
+    def files(self, paths=None, rescan: bool = False) -> list:
+        """Indexed text files (absolute Paths), optionally limited to paths (see select_files).
+
+        Raises ScanLimitExceeded if the scan hit a limit, and ValueError
+        naming the paths that matched no file.
+        """
+        if rescan or not self._scanned:
+            self.index.rescan()
+            self._scanned = True
+            if self.cache is not None:
+                self.cache.save()
+        files = list(self.index.files())
+        if self.index.truncated:
+            raise ScanLimitExceeded(f"Scan stopped early: {self.index.truncated}", files)
+        if paths:
+            files, unmatched = select_files(files, self.root, paths)
+            if unmatched:
+                raise ValueError("No files match: " + ', '.join(str(p) for p in unmatched))
+        return files
+
+    def _save(self):
+        if self.cache is not None:
+            self.cache.save()
+
+    def pack(self, instruction: str = '', files: list = None, sink=None,
+             budget: int = TOKEN_BUDGET, policies=BUDGET_POLICIES, strategy: str = BUDGET_STRATEGY,
+             outlines: bool = True, part_limit: int = PART_LIMIT, part_unit: str = PART_UNIT,
+             part_sink=None, delta: bool = False, reduce: bool = REDUCE_CONTEXT) -> dict:
+        """Write the prompt for files (default: every indexed file) into sink.
+
+        budget is the token limit of the whole prompt (0 = unlimited). When
+        part_limit splits the prompt into several parts, part i (0-based)
+        of n goes to part_sink(i, n). With delta, only the changes since
+        the last pack are sent (budget and parts do not apply); without a
+        snapshot yet, everything is. Every pack updates the snapshot. With
+        reduce, a prompt without budget or parts is reduced (see
+        bridge_reduce) and 'reduction' tells what was saved. Without sinks
+        the text is returned under 'prompt' (a list of strings for parts).
+        Raises ValueError if the budget or part limit is too small.
+        """
+        if files is None:
+            files = self.files()
+        counter = self.tokens.counter
+        overhead = prompt_overhead(counter, instruction)
+        result = {'files': len(files), 'chars': 0, 'tokens': 0, 'parts': 1,
+                  'counter': counter.name, 'budget': None, 'delta': None, 'reduction': None}
+        snapshot = self.snapshot
+        if delta and snapshot is None:
+            raise ValueError("Delta mode needs the cache (use_cache=True)")
+        out = sink if sink is not None else StringSink()
+
+        if delta and snapshot.files:
+            changes = plan_delta(files, self.root, snapshot, self.cache, self.fragments)
+            writer = snapshot.writer(changes.unchanged_hashes())
+            tokens = 0
+            for piece in iter_delta_prompt(changes, self.root, instruction, snapshot,
+                                           writer, self.cache, self.tokens, self.fragments):
+                out.write(piece)
+                tokens += counter.count(piece)
+            text = out.close()
+            writer.commit()
+            result.update(files=len(changes.added) + len(changes.modified), chars=out.chars,
+                          tokens=tokens, delta=delta_report(changes))
+            if sink is None:
+                result['prompt'] = text
+            return result
+
+        if 0 < budget <= overhead:
+            raise ValueError(f"Token budget too small (needs more than {overhead:,})")
+        writer = snapshot.writer() if snapshot is not None else None
+        record = writer.add if writer is not None else None
+        plan = None
+        context = None
+        if budget > 0:
+            candidates = budget_candidates(files, self.root, self.tokens, self.index.signatures())
+            plan = plan_budget(candidates, budget - overhead, policies, strategy, instruction)
+            context = iter_context_budget(plan, self.root, self.tokens, self.cache, outlines,
+                                          record, self.fragments)
+
+        if part_limit > 0:
+            part_files = [c.path for c in plan.selected] if plan is not None else files
+            measure = counter.count if part_unit == 'tokens' else len
+            parts = plan_prompt_parts(part_files, self.root, instruction, part_limit, measure,
+                                      self.cache, record, self.fragments)
+            if parts.count > 1:
+                texts = []
+                part_texts = iter_prompt_parts(parts, part_files, self.root, self.fragments)
+                for i, text in enumerate(part_texts):
+                    if part_sink is None:
+                        texts.append(text)
+                    else:
+                        write_prompt((text,), part_sink(i, parts.count))
+                    result['chars'] += len(text)
+                    result['tokens'] += counter.count(text)
+                result.update(files=len(part_files), parts=parts.count)
+                if part_sink is None:
+                    result['prompt'] = texts
+                if plan is not None:
+                    plan.used = plan.planned  # parts are not written through iter_context_budget
+                    result['budget'] = budget_report(plan, overhead)
+                if writer is not None:
+                    writer.commit()
+                self._save()
+                return result
+            # One part: the prompt is written normally below
+            if writer is not None:
+                writer = snapshot.writer()
+                record = writer.add
+                if plan is not None:
+                    context = iter_context_budget(plan, self.root, self.tokens, self.cache,
+                                                  outlines, record, self.fragments)
+
+        reducer = None
+        if context is None:
+            reducer = Reducer(counter) if reduce else None
+            # Large files go to the sink straight from disk when it takes bytes
+            mapped = getattr(out, 'accepts_bytes', False)
+            context = iter_context_xml(files, self.root, self.cache, self.tokens, record, mapped,
+                                       reducer, self.fragments)
+        prompt = iter_prompt(files, self.root, instruction, self.cache, self.tokens, context)
+        text = write_prompt(prompt, out)
+        if writer is not None:
+            writer.commit()
+        self._save()
+        result['chars'] = out.chars
+        if plan is not None:
+            result['files'] = len(plan.selected) - len(plan.overflow)
+            result['tokens'] = overhead + plan.used
+            result['budget'] = budget_report(plan, overhead)
+        else:
+            known = self.tokens.known
+            result['tokens'] = overhead + sum(known.get(self.index.rel(f), (None, 0))[1]
+                                              for f in files)
+            if reducer is not None:
+                result['reduction'] = reducer.report()
+                result['tokens'] -= reducer.tokens_saved
+        if sink is None:
+            result['prompt'] = text
+        return result
+
+    def relevant(self, instruction: str, limit: int = RELEVANT_FILES,
+                 imports: bool = True) -> dict:
+        """Files to send for instruction.
+
+        These are the files it names, the limit most relevant ones and the
+        files they import. The search index is brought up to date first;
+        only files changed since the last call (or run, with the cache) are
+        read again.
+        """
+        self.files()
+        search = self.search_index
+        entries = self.index.entries
+        search.sync({rel: entry.signature for rel, entry in entries.items()},
+                    lambda rel: read_for_search(self.root / rel))
+        search.save()
+        picks = search.preselect(instruction, limit, imports)
+        return {
+            'mentioned': picks.mentioned,
+            'ranked': [{'file': rel, 'score': round(score, 3)} for rel, score in picks.ranked],
+            'imported': picks.imported,
+            'files': picks.mentioned + [rel for rel, _ in picks.ranked] + picks.imported,
+        }
+
+    def apply(self, text, atomic: bool = APPLY_ATOMIC, dry_run: bool = False,
+              similarity: float = APPLY_SIMILARITY) -> dict:
+        """Parse SEARCH/REPLACE blocks from text (a str or text chunks) and apply them.
+
+        With dry_run every block is located but nothing is written;
+        similarity is the approximate match threshold (0 disables it).
+        """
+        issues = []
+        patches = parse_patches(text, issues)
+        if not patches:
+            results = []
+        elif dry_run:
+            results = plan_patches(patches, self.root, _read_for_apply, similarity)[1]
+        else:
+            results = apply_patches(patches, self.root, self.journal, atomic, similarity)
+        return {
+            'applied': sum(1 for ok, _ in results if ok),
+            'failed': sum(1 for ok, _ in results if not ok),
+            'dry_run': dry_run,
+            'results': [{'file': p['file'], 'line': p['line'], 'ok': ok, 'message': message}
+                        for p, (ok, message) in zip(patches, results)],
+            'issues': [{'line': i.line, 'message': i.message} for i in issues],
+        }
+
+    def stats(self, files: list = None, exact: bool = True) -> dict:
+        """Size and token count of files (default: every indexed file).
+
+        Token counts come from the cache where still valid; the other files
+        are read and counted, or with exact=False estimated from their size.
+        """
+        if files is None:
+            files = self.files()
+        signatures = self.index.signatures()
+        total_bytes = tokens = estimated = 0
+        for c in budget_candidates(files, self.root, self.tokens, signatures):
+            n = c.tokens
+            if not c.exact and exact:
+                try:
+                    n = self.tokens.count_file(c.path, c.rel, decode_content)
+                except OSError:
+                    estimated += 1
+            elif not c.exact:
+                estimated += 1
+            total_bytes += signatures.get(c.rel, (0, 0))[1]
+            tokens += n
+        self._save()
+        return {'files': len(files), 'bytes': total_bytes, 'tokens': tokens,
+                'estimated': estimated, 'counter': self.tokens.counter.name}
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Differential context
+前回AIに送った内容（スナップショット）を記録しておき、次回は追加・変更・
+削除されたファイルだけを送る「差分モード」。変更されたファイルは unified
+diff で送る。スナップショットは GUI を再起動しても残る。
+
+A snapshot maps each sent file to the content hash it was sent with; the
+sent texts are kept as zlib-compressed blobs named by that hash so the
+next delta can diff against them. Snapshots live next to the scan cache
+(one directory per project). Like the scan cache, a snapshot that cannot
+be read or written is treated as empty and never breaks a Copy.
+"""
+
+import os
+import json
+import zlib
+import difflib
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from bridge_cache import project_cache_path
+
+# Lines of context around each diff hunk
+DIFF_CONTEXT = 3
+
+# Files larger than this (characters) are sent whole instead of diffed
+DIFF_MAX_CHARS = 1 << 20
+
+# Replaces SYSTEM_PROMPT in a delta prompt: the chat already has the rules
+DELTA_PROMPT = """以下は、前回送信したプロジェクトの内容からの**変更点のみ**です。
+- <changes> に追加(A)・変更(M)・削除(D)されたファイルの一覧があります
+- 選択から外した(X)ファイルは今回送信していないだけで、削除されておらずプロジェクトに残っています
+- 追加されたファイルと大きく変わったファイルは <file> で全文を、それ以外の変更は <diff> で unified diff を示します
+- 一覧にないファイルは前回送信した内容から変わっていません
+コードの変更は、引き続き <<<< SEARCH / ==== / >>>> のブロック形式で、現在の内容に対して出力してください。
+"""
+
+
+class Snapshot:
+    """What was last sent for one project: rel -> content hash, plus the sent texts."""
+
+    def __init__(self, project_root: Path, cache_dir: Path = None):
+        self.project_root = Path(project_root).resolve()
+        self.dir = project_cache_path(self.project_root, '.snapshot', cache_dir)
+        self.files = {}
+        self.time = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.dir / 'snapshot.json', encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = dict(data['files'])
+            self.time = data.get('time')
+        except (OSError, ValueError, KeyError, TypeError):
+            self.files = {}
+            self.time = None
+
+    def _blob(self, digest: str) -> Path:
+        return self.dir / 'blobs' / digest
+
+    def text(self, digest: str):
+        """The text sent with this content hash, or None if it is not stored."""
+        try:
+            return zlib.decompress(self._blob(digest).read_bytes()).decode('utf-8')
+        except (OSError, zlib.error, UnicodeDecodeError):
+            return None
+
+    def writer(self, keep: dict = None):
+        """Start recording a new snapshot, starting from keep (rel -> hash) if given."""
+        return SnapshotWriter(self, keep)
+
+    def clear(self):
+        """Forget what was sent (the next delta sends everything)."""
+        self.writer().commit()
+
+
+class SnapshotWriter:
+    """Records the files one prompt sends; commit() makes them the snapshot.
+
+    Texts are stored as soon as they are added so nothing has to be held
+    until the prompt is finished. Without commit() (e.g. a cancelled
+    Copy) the previous snapshot stays; stray blobs go at the next commit.
+    """
+
+    def __init__(self, snapshot: Snapshot, keep: dict = None):
+        self.snapshot = snapshot
+        self.files = dict(keep) if keep else {}
+        self.failed = False
+        self._blobs = snapshot.dir / 'blobs'
+
+    def add(self, rel: str, digest: str, text: str):
+        self.files[rel] = digest
+        if self.failed:
+            return
+        path = self._blobs / digest
+        try:
+            if not path.exists():
+                self._blobs.mkdir(parents=True, exist_ok=True)
+                _write_atomic(path, zlib.compress(text.encode('utf-8'), 1))
+        except OSError:
+            self.failed = True
+
+    def commit(self) -> bool:
+        """Replace the snapshot with the recorded files; False if it could not be stored."""
+        if self.failed:
+            return False
+        now = datetime.now().isoformat(timespec='seconds')
+        data = json.dumps({'time': now, 'files': self.files}, ensure_ascii=False)
+        try:
+            self.snapshot.dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(self.snapshot.dir / 'snapshot.json', data.encode('utf-8'))
+        except OSError:
+            return False
+        self.snapshot.files = dict(self.files)
+        self.snapshot.time = now
+        # Drop the blobs no longer referenced
+        used = set(self.files.values())
+        try:
+            names = os.listdir(self._blobs)
+        except OSError:
+            names = []
+        for name in names:
+            if name not in used:
+                try:
+                    os.remove(self._blobs / name)
+                except OSError:
+                    pass
+        return True
+
+
+def _write_atomic(path: Path, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, str(path))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class Delta:
+    """Differences between the current files (rel -> hash, in prompt order) and a snapshot.
+
+    A file that was sent but is not among the current files is removed
+    only if it no longer exists under project_root; one that is still
+    there was merely left out of the selection (deselected). Without
+    project_root every such file counts as removed.
+    """
+
+    def __init__(self, current: dict, previous: dict, project_root: Path = None):
+        self.current = current
+        self.previous = previous
+        self.added = [rel for rel in current if rel not in previous]
+        self.modified = [rel for rel, digest in current.items()
+                         if rel in previous and previous[rel] != digest]
+        self.unchanged = [rel for rel, digest in current.items() if previous.get(rel) == digest]
+        self.removed = []
+        self.deselected = []
+        for rel in previous:
+            if rel not in current:
+                exists = project_root is not None and os.path.exists(os.path.join(project_root, rel))
+                (self.deselected if exists else self.removed).append(rel)
+
+    @property
+    def changed(self) -> int:
+        return len(self.added) + len(self.modified) + len(self.removed)
+
+    def unchanged_hashes(self) -> dict:
+        return {rel: self.current[rel] for rel in self.unchanged}
+
+    def manifest(self, since: str = None) -> str:
+        status = {rel: 'A' for rel in self.added}
+        status.update((rel, 'M') for rel in self.modified)
+        lines = [f'{status[rel]} {rel}' for rel in self.current if rel in status]
+        lines += [f'D {rel}' for rel in self.removed]
+        lines += [f'X {rel}' for rel in self.deselected]
+        since_attr = f' since="{since}"' if since else ''
+        head = (f'<changes{since_attr} added="{len(self.added)}" modified="{len(self.modified)}" '
+                f'removed="{len(self.removed)}" deselected="{len(self.deselected)}" '
+                f'unchanged="{len(self.unchanged)}">')
+        if not lines:
+            lines = ['(no changes)']
+        return head + '\n' + '\n'.join(lines) + '\n</changes>'
+
+
+def unified_diff(rel: str, old: str, new: str) -> str:
+    """A unified diff of one file's text; lines without a final newline are marked like diff(1)."""
+    out = []
+    for line in difflib.unified_diff(old.splitlines(True), new.splitlines(True),
+                                     f'a/{rel}', f'b/{rel}', n=DIFF_CONTEXT):
+        out.append(line)
+        if not line.endswith('\n'):
+            out.append('\n\\ No newline at end of file\n')
+    return ''.join(out)
+
+
+def render_change(rel: str, text: str, modified: bool, old: str = None) -> str:
+    """The <file> or <diff> element for an added or modified file.
+
+    A modified file is sent whole when its old text is not stored, it is
+    too large to diff, or the diff would not be smaller than the file.
+    """
+    if old is not None and max(len(old), len(text)) <= DIFF_MAX_CHARS:
+        diff = unified_diff(rel, old, text)
+        if len(diff) < len(text):
+            return f'<diff path="{rel}">\n{diff}</diff>'
+    status = 'modified' if modified else 'added'
+    return f'<file path="{rel}" status="{status}">\n{text}\n</file>'
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Encoding detection
+ファイルの文字コードを1回の判定で決める。BOM、UTF-8 としての妥当性、
+日本語（Shift_JIS / EUC-JP）らしさの統計の順に調べ、判定に使った
+デコード結果をそのまま返すので、ファイルを何度もデコードし直さない。
+
+Order of the checks:
+  1. a byte order mark (UTF-8, UTF-16, UTF-32)
+  2. NUL bytes: binary (only when sniffing)
+  3. strict UTF-8 (pure ASCII is UTF-8)
+  4. cp932 / EUC-JP, kept only if the decoded text looks Japanese: most
+     non-ASCII characters form runs of kana / kanji / full-width symbols
+     (Latin-1 text decoded as cp932 gives isolated kanji instead)
+  5. cp1252, then latin-1 (which accepts any bytes)
+The first decode that fits is the one returned, so a UTF-8 file is
+decoded exactly once.
+"""
+
+import re
+import codecs
+
+from bridge_trace import tracer
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Japanese legacy encodings, most common first
+JAPANESE_ENCODINGS = ('cp932', 'euc_jp')
+
+# Single-byte encodings when nothing else fits; latin-1 never fails
+FALLBACK_ENCODINGS = ('cp1252', 'latin-1')
+
+# Characters of decoded text looked at by the Japanese check
+SAMPLE_CHARS = 1 << 12
+
+_JAPANESE_RUN = re.compile('[\u3000-\u30ff\u4e00-\u9fff\uff01-\uff5e]{2,}')
+_NON_ASCII_RUN = re.compile('[^\x00-\x7f]+')
+
+
+def _decode(data: bytes, encoding: str, final: bool):
+    """data decoded strictly, or None; with final=False a truncated last character is allowed."""
+    try:
+        if final:
+            return data.decode(encoding)
+        return codecs.getincrementaldecoder(encoding)().decode(data, False)
+    except (UnicodeDecodeError, LookupError):
+        tracer.count('decode retries')
+        return None
+
+
+def japanese_score(text: str) -> int:
+    """Characters in runs of Japanese script minus twice the other non-ASCII characters."""
+    runs = other = 0
+    for chunk in _NON_ASCII_RUN.findall(text, 0, SAMPLE_CHARS):
+        japanese = sum(len(run) for run in _JAPANESE_RUN.findall(chunk))
+        runs += japanese
+        other += len(chunk) - japanese
+    return runs - 2 * other if runs else 0
+
+
+def _detect(data: bytes, final: bool, binary: bool) -> tuple:
+    """(encoding, text) of data; (None, None) for binary data when binary is checked."""
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            text = _decode(data, encoding, final)
+            if text is not None:
+                return encoding, text
+            break
+    if binary and b'\x00' in data:
+        return None, None
+
+    text = _decode(data, 'utf-8', final)
+    if text is not None:
+        return 'utf-8', text
+
+    best = None
+    for encoding in JAPANESE_ENCODINGS:
+        text = _decode(data, encoding, final)
+        if text is not None:
+            score = japanese_score(text)
+            if score > 0 and (best is None or score > best[0]):
+                best = (score, encoding, text)
+    if best is not None:
+        return best[1], best[2]
+
+    for encoding in FALLBACK_ENCODINGS:
+        text = _decode(data, encoding, final)
+        if text is not None:
+            return encoding, text
+    return 'latin-1', data.decode('latin-1')
+
+
+def detect_encoding(data: bytes, final: bool = True):
+    """Return the encoding of data, or None if it looks binary.
+
+    Pass final=False for the head of a longer file (a multi-byte
+    character may be cut off at the end).
+    """
+    return _detect(data, final, True)[0]
+
+
+def decode_text(data: bytes, encoding: str = None) -> tuple:
+    """Decode a whole file: (text, encoding).
+
+    encoding (e.g. the verdict recorded at scan time) is tried first; if it
+    does not fit, the encoding is detected. Never fails: latin-1 is last.
+    """
+    if encoding is not None:
+        text = _decode(data, encoding, True)
+        if text is not None:
+            return text, encoding
+    encoding, text = _detect(data, True, False)
+    return text, encoding
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Fragment cache
+プロンプトに入れたファイル内容をメモリ上に保持し、変更のないファイルを
+次のコピーで読み直さないためのキャッシュ（LRU・上限付き）。
+
+Entries are keyed by absolute path and hold the decoded text with the
+stat signature and content hash it was read with. lookup() trusts an
+entry while the file's stat signature is unchanged, the same rule the
+scan cache uses; a file that was touched but not changed is re-read and
+hashed, but its text is reused instead of decoded again. Decoding is a
+function of the bytes alone, so the content hash also stands for the
+encoding. The least recently used entries are evicted once the texts
+take more than ``limit`` bytes of memory (sys.getsizeof: a str of CJK
+text takes 2-4 bytes per character). Safe to use from the I/O pool
+threads.
+
+Nothing is cached unless a caller passes a FragmentCache: the GUI keeps
+one per session, while one-shot runs (bridge_cli, Project) read every
+file once anyway and stream with bounded memory.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from bridge_cache import stat_signature
+
+# Default cap on the memory taken by the cached texts (bytes)
+FRAGMENT_CACHE_SIZE = 32 << 20
+
+
+class FragmentCache:
+    """LRU map of path -> (stat signature, content hash, text)."""
+
+    def __init__(self, limit: int = FRAGMENT_CACHE_SIZE):
+        self.limit = limit
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def lookup(self, path) -> tuple:
+        """Return (text, stat, hash) if the file is unchanged since it was cached, else None."""
+        key = str(path)
+        with self._lock:
+            item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        try:
+            st = os.stat(key)
+        except OSError:
+            self.misses += 1
+            return None
+        if stat_signature(st) != item[0]:
+            self.misses += 1
+            return None
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+        self.hits += 1
+        return item[2], st, item[1]
+
+    def text_for(self, path, digest: str):
+        """The cached text of path if it was read with the same content hash."""
+        with self._lock:
+            item = self._items.get(str(path))
+        return item[2] if item is not None and item[1] == digest else None
+
+    def store(self, path, st, digest: str, text: str):
+        key = str(path)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= sys.getsizeof(old[2])
+            size = sys.getsizeof(text)
+            if size > self.limit:
+                return
+            self._items[key] = (stat_signature(st), digest, text)
+            self.size += size
+            while self.size > self.limit:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
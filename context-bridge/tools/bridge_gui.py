@@ -9,313 +9,49 @@ Usage:
     python tools/bridge_gui.py [--cwd /path/to/project]
 """
 
-import os
-import re
 import sys
-import fnmatch
+import time
+import threading
 from pathlib import Path
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 
+from bridge_cache import ScanCache
+from bridge_watch import start_watcher
+from bridge_sinks import BufferedSink, ClipboardSink, write_prompt
+from bridge_tokens import FileTokenCounts, get_token_counter
+from bridge_budget import STRATEGIES, plan_budget
+from bridge_journal import Journal
+from bridge_delta import Snapshot
+from bridge_jobs import JOB_WORKERS, JobRunner
+from bridge_selection import FileSelection
+from bridge_search import SearchIndex
+from bridge_fragments import FragmentCache
+from bridge_reduce import Reducer
+from bridge_trace import tracer
+from bridge_core import (
+    APPLY_ATOMIC, BUDGET_POLICIES, BUDGET_STRATEGY, PART_LIMIT, PART_UNIT, REDUCE_CONTEXT, RELEVANT_FILES,
+    TOKEN_BUDGET, TOKEN_COUNTER, apply_patches, budget_candidates, build_project_index, decode_content, iter_context_budget,
+    iter_context_xml, iter_delta_prompt, iter_prompt, iter_prompt_parts, parse_patches, plan_delta,
+    plan_prompt_parts, prompt_overhead, read_for_search,
+)
+
 # ==============================================================================
 # Configuration
 # ==============================================================================
 
-# Default excluded directories (always ignored)
-DEFAULT_EXCLUDED_DIRS = {
-    '.git', '.agent', '__pycache__', 'node_modules', '.venv', 'venv', 'env',
-    '.idea', '.vscode', '.vs', 'dist', 'build', '.next', '.nuxt',
-    'coverage', '.pytest_cache', '.mypy_cache', '.tox', 'eggs',
-    '*.egg-info', '.eggs', 'bower_components', 'jspm_packages',
-    '.cache', 'tmp', 'temp', '.temp', '.tmp'
-}
-
-# Binary file extensions (always excluded)
-BINARY_EXTENSIONS = {
-    '.exe', '.dll', '.so', '.dylib', '.bin', '.obj', '.o', '.a',
-    '.lib', '.pyc', '.pyo', '.pyd', '.class', '.jar', '.war',
-    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.svg',
-    '.mp3', '.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.wav',
-    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-    '.zip', '.tar', '.gz', '.rar', '.7z', '.bz2', '.xz',
-    '.ttf', '.otf', '.woff', '.woff2', '.eot',
-    '.db', '.sqlite', '.sqlite3', '.mdb',
-    '.lock', '.ico'
-}
-
-# System prompt for Web AI
-SYSTEM_PROMPT = """あなたは熟練したソフトウェアエンジニアです。以下のルールに**厳密に**従ってください。
-
-## 絶対ルール
-1. コードの変更は**必ず**以下のブロック形式で出力すること：
-
-<<<< SEARCH path/to/file.ext
-検索対象の既存コード（変更前のコード）
-====
-置換後の新しいコード
->>>>
+# How often the stats line is refreshed while tokens are being counted (seconds)
+TOKEN_COUNT_SLICE = 0.5
 
-2. 新規ファイル作成の場合は、SEARCHブロックを空にする：
+# How often the GUI drains file system watch events (milliseconds)
+WATCH_POLL_MS = 500
 
-<<<< SEARCH path/to/newfile.ext
-====
-新規ファイルの内容
->>>>
+# How often the GUI runs callbacks posted by background jobs (milliseconds)
+JOB_POLL_MS = 30
 
-3. ファイル削除の場合は、REPLACEブロックを空にする：
-
-<<<< SEARCH path/to/deletefile.ext
-削除するファイルの内容
-====
->>>>
-
-4. 変更がない説明文は、コードブロックの**外に**記述すること
-5. 各SEARCHブロックは、対象ファイル内で**一意に特定できる**十分な文脈を含めること
-6. インデント・空白は**正確に**保持すること
-
-## 出力例
-ファイル `src/main.py` の関数名を変更する場合：
-
-<<<< SEARCH src/main.py
-def old_function_name():
-    print("Hello")
-====
-def new_function_name():
-    print("Hello, World!")
->>>>
-
----
-以下はプロジェクトのファイル一覧とその内容です。ユーザーの指示に従って修正を行ってください。
-"""
-
-# ==============================================================================
-# Utility Functions
-# ==============================================================================
-
-def parse_gitignore(project_root: Path) -> list:
-    """Parse .gitignore file and return list of patterns."""
-    gitignore_path = project_root / '.gitignore'
-    patterns = []
-    
-    if gitignore_path.exists():
-        try:
-            with open(gitignore_path, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    line = line.strip()
-                    # Skip empty lines and comments
-                    if line and not line.startswith('#'):
-                        patterns.append(line)
-        except Exception:
-            pass
-    
-    return patterns
-
-
-def should_ignore(path: Path, project_root: Path, gitignore_patterns: list) -> bool:
-    """Check if a path should be ignored based on .gitignore patterns and defaults."""
-    rel_path = path.relative_to(project_root)
-    rel_str = str(rel_path).replace('\\', '/')
-    
-    # Check default excluded directories
-    for part in rel_path.parts:
-        if part in DEFAULT_EXCLUDED_DIRS:
-            return True
-        for pattern in DEFAULT_EXCLUDED_DIRS:
-            if fnmatch.fnmatch(part, pattern):
-                return True
-    
-    # Check binary extensions
-    if path.is_file() and path.suffix.lower() in BINARY_EXTENSIONS:
-        return True
-    
-    # Check .gitignore patterns
-    for pattern in gitignore_patterns:
-        # Handle negation patterns (not fully implemented)
-        if pattern.startswith('!'):
-            continue
-        
-        # Normalize pattern
-        p = pattern.rstrip('/')
-        
-        # Check if pattern matches
-        if fnmatch.fnmatch(rel_str, p):
-            return True
-        if fnmatch.fnmatch(rel_str, p + '/*'):
-            return True
-        if fnmatch.fnmatch(path.name, p):
-            return True
-        # Handle directory patterns
-        if pattern.endswith('/'):
-            if fnmatch.fnmatch(rel_str, p + '*'):
-                return True
-    
-    return False
-
-
-def is_text_file(file_path: Path) -> bool:
-    """Check if a file is a text file by reading first bytes."""
-    try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(8192)
-            # Check for null bytes (common in binary files)
-            if b'\x00' in chunk:
-                return False
-            # Try to decode as UTF-8
-            try:
-                chunk.decode('utf-8')
-                return True
-            except UnicodeDecodeError:
-                # Try other common encodings
-                for encoding in ['latin-1', 'cp1252', 'shift_jis']:
-                    try:
-                        chunk.decode(encoding)
-                        return True
-                    except UnicodeDecodeError:
-                        continue
-                return False
-    except Exception:
-        return False
-
-
-def collect_files(project_root: Path) -> list:
-    """Collect all text files in the project, respecting .gitignore."""
-    files = []
-    gitignore_patterns = parse_gitignore(project_root)
-    
-    for item in project_root.rglob('*'):
-        if item.is_file():
-            if not should_ignore(item, project_root, gitignore_patterns):
-                if is_text_file(item):
-                    files.append(item)
-    
-    # Sort by path
-    files.sort(key=lambda x: str(x).lower())
-    return files
-
-
-def read_file_content(file_path: Path) -> str:
-    """Read file content with fallback encodings."""
-    encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'shift_jis']
-    
-    for encoding in encodings:
-        try:
-            with open(file_path, 'r', encoding=encoding) as f:
-                return f.read()
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            return f"[Error reading file: {e}]"
-    
-    return "[Error: Unable to decode file with any known encoding]"
-
-
-def pack_context_xml(files: list, project_root: Path) -> str:
-    """Pack file contents into XML format."""
-    xml_parts = []
-    
-    for file_path in files:
-        rel_path = file_path.relative_to(project_root)
-        rel_str = str(rel_path).replace('\\', '/')
-        content = read_file_content(file_path)
-        xml_parts.append(f'<file path="{rel_str}">\n{content}\n</file>')
-    
-    return '\n\n'.join(xml_parts)
-
-
-def parse_patches(text: str) -> list:
-    """Parse SEARCH/REPLACE blocks from text."""
-    # Pattern to match <<<< SEARCH path ... ==== ... >>>>
-    pattern = r'<<<<\s*SEARCH\s+([^\n]+)\n(.*?)\n====\n(.*?)\n>>>>'
-    
-    patches = []
-    for match in re.finditer(pattern, text, re.DOTALL):
-        file_path = match.group(1).strip()
-        search_content = match.group(2)
-        replace_content = match.group(3)
-        patches.append({
-            'file': file_path,
-            'search': search_content,
-            'replace': replace_content
-        })
-    
-    return patches
-
-
-def apply_patch(patch: dict, project_root: Path) -> tuple:
-    """Apply a single patch to a file. Returns (success, message)."""
-    file_path = project_root / patch['file']
-    search_content = patch['search']
-    replace_content = patch['replace']
-    
-    # Case 1: New file creation (empty search)
-    if not search_content.strip():
-        try:
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(replace_content)
-            return (True, f"✅ Created: {patch['file']}")
-        except Exception as e:
-            return (False, f"❌ Failed to create {patch['file']}: {e}")
-    
-    # Case 2: File deletion (empty replace)
-    if not replace_content.strip() and search_content.strip():
-        try:
-            if file_path.exists():
-                file_path.unlink()
-                return (True, f"🗑️ Deleted: {patch['file']}")
-            else:
-                return (False, f"⚠️ File not found for deletion: {patch['file']}")
-        except Exception as e:
-            return (False, f"❌ Failed to delete {patch['file']}: {e}")
-    
-    # Case 3: File modification
-    if not file_path.exists():
-        return (False, f"❌ File not found: {patch['file']}")
-    
-    try:
-        content = read_file_content(file_path)
-        
-        # Try exact match first
-        if search_content in content:
-            new_content = content.replace(search_content, replace_content, 1)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
-            return (True, f"✅ Modified: {patch['file']}")
-        
-        # Try with stripped whitespace comparison (line by line)
-        content_lines = content.splitlines()
-        search_lines = search_content.splitlines()
-        
-        # Find matching block with flexible whitespace
-        for i in range(len(content_lines) - len(search_lines) + 1):
-            match = True
-            for j, search_line in enumerate(search_lines):
-                if content_lines[i + j].strip() != search_line.strip():
-                    match = False
-                    break
-            
-            if match:
-                # Replace the block
-                new_lines = (
-                    content_lines[:i] +
-                    replace_content.splitlines() +
-                    content_lines[i + len(search_lines):]
-                )
-                new_content = '\n'.join(new_lines)
-                
-                # Preserve original line ending style
-                if '\r\n' in content:
-                    new_content = new_content.replace('\n', '\r\n')
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                return (True, f"✅ Modified (fuzzy match): {patch['file']}")
-        
-        return (False, f"❌ Search content not found in: {patch['file']}")
-        
-    except Exception as e:
-        return (False, f"❌ Failed to modify {patch['file']}: {e}")
+# Check marks of the file tree rows
+CHECK_MARKS = {'all': '☑', 'some': '◩', 'none': '☐'}
 
 
 # ==============================================================================
@@ -326,7 +62,25 @@ class ManualBridgeGUI:
     def __init__(self, project_root: Path):
         self.project_root = project_root
         self.files = []
-        self.file_vars = {}  # CheckVar for each file
+        self.selection = FileSelection([])  # Which of self.files are sent
+        self._populated = set()  # Folders whose rows are in the tree
+        self.scan_cache = ScanCache(project_root)
+        self.journal = Journal(project_root)
+        self.snapshot = Snapshot(project_root)  # What the last Copy sent, for delta mode
+        self.search_index = SearchIndex(project_root)  # For "Select Relevant Files"
+        self.fragments = FragmentCache()  # File contents kept between Copies
+        self.index = build_project_index(project_root, cache=self.scan_cache)
+        self.watcher = None
+        self.token_counts = FileTokenCounts(get_token_counter(TOKEN_COUNTER), self.scan_cache)
+        self._parts = None  # (iterator over part texts, part count, parts copied)
+        
+        # Scan, pack, token counting and apply run as background jobs. The
+        # index, scan cache and token counts are only touched by jobs holding
+        # state_lock; the UI thread reads them but never waits for the lock.
+        self.jobs = JobRunner(JOB_WORKERS, on_error=self._job_failed, on_trace=self._log_trace)
+        self.state_lock = threading.Lock()
+        self._watch_changed = set()
+        self._watch_lock = threading.Lock()
         
         self.root = tk.Tk()
         self.root.title(f"Context Bridge - {project_root.name}")
@@ -352,6 +106,8 @@ class ManualBridgeGUI:
         self.style.configure('TButton', background='#4a4a4a', foreground=self.fg_color, padding=6)
         self.style.configure('TCheckbutton', background=self.bg_color, foreground=self.fg_color)
         self.style.configure('TPanedwindow', background=self.bg_color)
+        self.style.configure('Treeview', background=self.entry_bg, fieldbackground=self.entry_bg,
+                             foreground=self.entry_fg, borderwidth=1)
         self.style.configure('Header.TLabel', font=('Segoe UI', 12, 'bold'), background=self.bg_color, foreground='#64b5f6')
         
         # Configure scrollbar for dark theme
@@ -383,7 +139,14 @@ class ManualBridgeGUI:
             pass  # Silently fail on non-Windows or older Windows
         
         self._create_widgets()
+        restored = self.journal.recover()
+        if restored:
+            self.log(f"⚠️ 中断されたパッチ適用を元に戻しました: {', '.join(restored)}", 'warning')
+        if tracer.enabled:
+            self.log(f"⏱ Tracing to {tracer.path} / トレースを記録中（終了時に書き出し）", 'info')
+        self.root.after(JOB_POLL_MS, self._poll_jobs)
         self._load_files()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
     
     def _create_widgets(self):
         """Create all GUI widgets."""
@@ -432,42 +195,121 @@ class ManualBridgeGUI:
         )
         self.send_all_check.pack(anchor=tk.W)
         
+        # Preselect the files the instruction is about (ranked by the search index)
+        ttk.Button(
+            context_frame,
+            text="🎯 Select Relevant Files / 関連ファイルを選択",
+            command=self._select_relevant
+        ).pack(fill=tk.X, pady=(2, 5))
+        
+        self.watch_var = tk.BooleanVar(value=True)
+        self.watch_check = ttk.Checkbutton(
+            context_frame,
+            text="Watch Files / ファイル変更を監視",
+            variable=self.watch_var,
+            command=self._on_watch_toggle
+        )
+        self.watch_check.pack(anchor=tk.W)
+        
+        # Delta mode: only what changed since the last Copy (the chat already has the rest)
+        self.delta_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            context_frame,
+            text="Δ Send changes only / 前回からの差分のみ送信",
+            variable=self.delta_var
+        ).pack(anchor=tk.W)
+        
+        # Reduction: duplicates and shared headers once, no trailing whitespace, data files cut
+        self.reduce_var = tk.BooleanVar(value=REDUCE_CONTEXT)
+        ttk.Checkbutton(
+            context_frame,
+            text="✂️ Reduce duplicates & whitespace / 重複・空白を削減",
+            variable=self.reduce_var
+        ).pack(anchor=tk.W)
+        
+        # Token budget: 0 = send everything selected
+        budget_frame = ttk.Frame(context_frame)
+        budget_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(budget_frame, text="Token Budget / トークン上限:").pack(side=tk.LEFT)
+        self.budget_var = tk.StringVar(value=str(TOKEN_BUDGET))
+        tk.Entry(budget_frame, textvariable=self.budget_var, width=10,
+                 bg=self.entry_bg, fg=self.entry_fg, insertbackground=self.entry_fg,
+                 borderwidth=1, relief=tk.SUNKEN).pack(side=tk.LEFT, padx=5)
+        self.policy_var = tk.StringVar(value='+'.join(BUDGET_POLICIES))
+        ttk.Combobox(budget_frame, textvariable=self.policy_var, width=16, state='readonly',
+                     values=['mentioned+recent', 'mentioned+small', 'recent', 'small']).pack(side=tk.LEFT)
+        self.strategy_var = tk.StringVar(value=BUDGET_STRATEGY)
+        ttk.Combobox(budget_frame, textvariable=self.strategy_var, width=9, state='readonly',
+                     values=list(STRATEGIES)).pack(side=tk.LEFT, padx=5)
+        self.outline_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            context_frame,
+            text="Outline files over budget / 上限超過分は概要のみ送信",
+            variable=self.outline_var
+        ).pack(anchor=tk.W)
+        
+        # Multi-part export: 0 = one paste
+        part_frame = ttk.Frame(context_frame)
+        part_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(part_frame, text="Part Limit / 分割サイズ:").pack(side=tk.LEFT)
+        self.part_limit_var = tk.StringVar(value=str(PART_LIMIT))
+        tk.Entry(part_frame, textvariable=self.part_limit_var, width=10,
+                 bg=self.entry_bg, fg=self.entry_fg, insertbackground=self.entry_fg,
+                 borderwidth=1, relief=tk.SUNKEN).pack(side=tk.LEFT, padx=5)
+        self.part_unit_var = tk.StringVar(value=PART_UNIT)
+        ttk.Combobox(part_frame, textvariable=self.part_unit_var, width=8, state='readonly',
+                     values=['chars', 'tokens']).pack(side=tk.LEFT)
+        
         # File list
         ttk.Label(left_frame, text="Files to Send / 送信ファイル:").pack(anchor=tk.W, pady=(10, 0))
         
         file_list_frame = ttk.Frame(left_frame)
         file_list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        # Canvas for scrollable file list with checkboxes
-        self.file_canvas = tk.Canvas(file_list_frame, borderwidth=1, relief=tk.SUNKEN,
-                                      bg=self.entry_bg, highlightthickness=0)
-        file_scrollbar = ttk.Scrollbar(file_list_frame, orient=tk.VERTICAL, command=self.file_canvas.yview)
-        self.file_inner_frame = ttk.Frame(self.file_canvas)
-        
-        self.file_canvas.configure(yscrollcommand=file_scrollbar.set)
+        # Folder tree: rows exist only for the children of opened folders;
+        # click a row (or press Space) to select/deselect a file or a folder
+        self.file_tree = ttk.Treeview(file_list_frame, show='tree', selectmode='browse')
+        file_scrollbar = ttk.Scrollbar(file_list_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
+        self.file_tree.configure(yscrollcommand=file_scrollbar.set)
         
         file_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.file_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        self.file_canvas_window = self.file_canvas.create_window((0, 0), window=self.file_inner_frame, anchor=tk.NW)
-        
-        self.file_inner_frame.bind("<Configure>", self._on_frame_configure)
-        self.file_canvas.bind("<Configure>", self._on_canvas_configure)
-        
-        # Bind mouse wheel
-        self.file_canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        self.file_tree.bind('<<TreeviewOpen>>', self._on_tree_open)
+        self.file_tree.bind('<Button-1>', self._on_tree_click)
+        self.file_tree.bind('<space>', self._on_tree_key)
         
         # Stats label
         self.stats_label = ttk.Label(left_frame, text="Files: 0 | Size: 0 KB")
         self.stats_label.pack(anchor=tk.W)
         
+        # Background job progress
+        progress_frame = ttk.Frame(left_frame)
+        progress_frame.pack(fill=tk.X, pady=(5, 0))
+        self.cancel_btn = ttk.Button(progress_frame, text="⏹ Cancel / 中止",
+                                     command=self._cancel_jobs, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', length=120)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        self.status_label = ttk.Label(progress_frame, text="")
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
         # Copy button
         self.copy_btn = ttk.Button(
             left_frame, 
             text="📋 Copy Prompt / プロンプトをコピー",
             command=self._copy_to_clipboard
         )
-        self.copy_btn.pack(fill=tk.X, pady=10)
+        self.copy_btn.pack(fill=tk.X, pady=(10, 0))
+        
+        # Next part of a multi-part export
+        self.next_part_btn = ttk.Button(
+            left_frame,
+            text="📑 Copy Next Part / 次のパートをコピー",
+            command=self._copy_next_part,
+            state=tk.DISABLED
+        )
+        self.next_part_btn.pack(fill=tk.X, pady=(5, 10))
         
         # ====== Right Panel: Response ======
         right_frame = ttk.Frame(paned, padding="5")
@@ -503,7 +345,23 @@ class ManualBridgeGUI:
             text="🔨 Apply Patch / パッチを適用",
             command=self._apply_from_clipboard
         )
-        self.apply_btn.pack(fill=tk.X, pady=10)
+        self.apply_btn.pack(fill=tk.X, pady=(10, 5))
+        
+        self.atomic_var = tk.BooleanVar(value=APPLY_ATOMIC)
+        ttk.Checkbutton(
+            right_frame,
+            text="All or nothing / 1件でも失敗したら何も変更しない",
+            variable=self.atomic_var
+        ).pack(anchor=tk.W)
+        
+        # Undo / redo of applied batches
+        history_frame = ttk.Frame(right_frame)
+        history_frame.pack(fill=tk.X, pady=(5, 10))
+        self.undo_btn = ttk.Button(history_frame, text="↩️ Undo / 元に戻す", command=self._undo_apply)
+        self.undo_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        self.redo_btn = ttk.Button(history_frame, text="↪️ Redo / やり直す", command=self._redo_apply)
+        self.redo_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self._update_history_buttons()
         
         # Refresh button
         self.refresh_btn = ttk.Button(
@@ -513,115 +371,622 @@ class ManualBridgeGUI:
         )
         self.refresh_btn.pack(fill=tk.X)
     
-    def _on_frame_configure(self, event):
-        """Update scroll region when frame size changes."""
-        self.file_canvas.configure(scrollregion=self.file_canvas.bbox("all"))
+    def _poll_jobs(self):
+        """Run the callbacks posted by background jobs, then reschedule."""
+        try:
+            self.jobs.poll()
+        finally:
+            busy = self.jobs.busy()
+            self.cancel_btn.config(state=tk.NORMAL if busy else tk.DISABLED)
+            if not busy and self.status_label.cget('text'):
+                self._show_progress(None)
+            self.root.after(JOB_POLL_MS, self._poll_jobs)
+    
+    def _progress(self, title: str):
+        """Return an on_progress callback that shows title with the job's progress."""
+        return lambda done, total, text: self._show_progress(title, done, total, text)
     
-    def _on_canvas_configure(self, event):
-        """Update inner frame width when canvas resizes."""
-        self.file_canvas.itemconfig(self.file_canvas_window, width=event.width)
+    def _show_progress(self, title: str = None, done: int = 0, total: int = None, text: str = ''):
+        """Show background progress below the file list (None clears it)."""
+        if title is None:
+            self.status_label.config(text="")
+            self.progress_bar.config(mode='determinate', value=0)
+            return
+        if total:
+            self.progress_bar.config(mode='determinate', value=100.0 * done / total)
+        else:
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.step(5)
+        self.status_label.config(text=f"{title} {text}".rstrip())
     
-    def _on_mousewheel(self, event):
-        """Handle mouse wheel scrolling."""
-        self.file_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+    def _job_failed(self, job, error):
+        self.log(f"❌ {job.key}: {error}", 'error')
+    
+    def _log_trace(self, job, lines: list):
+        """Log the phase timings and counters of a finished job (tracing only)."""
+        self.log(f"⏱ {job.key}: {lines[0]}", 'info')
+        for line in lines[1:]:
+            self.log(f"   {line}", 'info')
+    
+    def _append_clipboard(self, block: str):
+        """Append one block of a streamed prompt to the clipboard (UI thread)."""
+        with tracer.span('clipboard', chars=len(block)):
+            self.root.clipboard_append(block)
+    
+    def _cancel_jobs(self):
+        """Stop the running background jobs (patch application always completes)."""
+        self.jobs.cancel()
+        self.log("⏹ 処理を中止しました / Cancelled", 'warning')
     
     def _load_files(self):
-        """Load and display files from project."""
+        """Rescan the project in the background, then rebuild the file list."""
         self.log("Scanning files... / ファイルをスキャン中...", 'info')
-        
-        # Clear existing checkboxes
-        for widget in self.file_inner_frame.winfo_children():
-            widget.destroy()
-        self.file_vars.clear()
-        
-        # Collect files
-        self.files = collect_files(self.project_root)
-        
-        # Create checkboxes
-        for file_path in self.files:
-            rel_path = file_path.relative_to(self.project_root)
-            rel_str = str(rel_path).replace('\\', '/')
-            
-            var = tk.BooleanVar(value=self.send_all_var.get())
-            self.file_vars[file_path] = var
-            
-            cb = ttk.Checkbutton(
-                self.file_inner_frame,
-                text=rel_str,
-                variable=var,
-                command=self._update_stats
-            )
-            cb.pack(anchor=tk.W)
+        self._show_progress("Scanning / スキャン中")
+        default = self.send_all_var.get()
+        self.jobs.submit('scan', lambda job: self._scan_job(job, default), on_done=self._on_scanned,
+                         on_progress=self._progress("Scanning / スキャン中"))
+    
+    def _scan_job(self, job, default: bool) -> tuple:
+        # Full rescan of the index (unchanged files come from the scan cache)
+        with self.state_lock:
+            job.check()
+            self.index.rescan(check=lambda walked: job.progress(walked, None, f"{walked:,}"))
+            files = list(self.index.files())
+            rels = [self.index.rel(f) for f in files]
+            return files, FileSelection(rels, default, *self._weights(rels))
+    
+    def _weights(self, rels: list) -> tuple:
+        """Sizes (from the index) and known token counts of rels, for FileSelection (under state_lock)."""
+        entries, lookup = self.index.entries, self.token_counts.lookup
+        sizes, tokens = [], []
+        for rel in rels:
+            entry = entries.get(rel)
+            if entry is None:
+                sizes.append(0)
+                tokens.append(None)
+            else:
+                sizes.append(entry.signature[1])
+                tokens.append(lookup(rel, entry.signature))
+        return sizes, tokens
+    
+    def _on_scanned(self, result: tuple):
+        self.files, self.selection = result
+        self._render_tree()
+        if self.index.truncated:
+            self.log(f"⚠️ Scan stopped early: {self.index.truncated} / スキャンを途中で打ち切りました", 'warning')
         
         self._update_stats()
         self.log(f"Found {len(self.files)} text files / {len(self.files)}個のテキストファイルを発見", 'success')
+        self._on_watch_toggle()
+    
+    def _selected_files(self) -> list:
+        files = self.files
+        return [files[i] for i in self.selection.selected()]
+    
+    @staticmethod
+    def _folder_iid(folder: str) -> str:
+        return 'd:' + folder if folder else ''
+    
+    def _row_text(self, iid: str) -> str:
+        selection = self.selection
+        rel = iid[2:]
+        if iid.startswith('d:'):
+            node = selection.folders[rel]
+            return (f"{CHECK_MARKS[selection.state(rel)]} 📁 {rel.rpartition('/')[2]}"
+                    f"  ({node.selected:,}/{node.total:,})")
+        mark = CHECK_MARKS['all' if selection.is_selected(selection.number[rel]) else 'none']
+        return f"{mark} {rel.rpartition('/')[2]}"
+    
+    def _render_tree(self):
+        """Show the file tree again from the top, re-opening the folders that were open."""
+        tree = self.file_tree
+        opened = [rel for rel in self._populated
+                  if rel and tree.exists('d:' + rel) and tree.item('d:' + rel, 'open')]
+        tree.delete(*tree.get_children(''))
+        self._populated = set()
+        self._populate('')
+        for rel in sorted(opened, key=lambda r: r.count('/')):
+            if tree.exists('d:' + rel):
+                self._populate(rel)
+                tree.item('d:' + rel, open=True)
+    
+    def _populate(self, folder: str):
+        """Insert the rows of a folder's direct children (once)."""
+        if folder in self._populated:
+            return
+        self._populated.add(folder)
+        tree = self.file_tree
+        parent = self._folder_iid(folder)
+        if folder:
+            tree.delete(*tree.get_children(parent))  # the placeholder row
+        node = self.selection.folders[folder]
+        for sub in node.dirs:
+            iid = 'd:' + sub
+            tree.insert(parent, tk.END, iid=iid, text=self._row_text(iid))
+            tree.insert(iid, tk.END, iid='p:' + sub)  # makes the folder openable
+        for i in node.files:
+            iid = 'f:' + self.selection.rels[i]
+            tree.insert(parent, tk.END, iid=iid, text=self._row_text(iid))
+    
+    def _on_tree_open(self, event):
+        iid = self.file_tree.focus()
+        if iid.startswith('d:'):
+            self._populate(iid[2:])
+    
+    def _on_tree_click(self, event):
+        tree = self.file_tree
+        iid = tree.identify_row(event.y)
+        if iid and 'indicator' not in tree.identify_element(event.x, event.y):
+            self._toggle_row(iid)
+    
+    def _on_tree_key(self, event):
+        iid = self.file_tree.focus()
+        if iid:
+            self._toggle_row(iid)
+        return 'break'
+    
+    def _toggle_row(self, iid: str):
+        """Select or deselect the file or whole folder of a tree row."""
+        selection = self.selection
+        rel = iid[2:]
+        if iid.startswith('f:'):
+            number = selection.number[rel]
+            selection.set_file(number, not selection.is_selected(number))
+            self._refresh_rows(rel)
+        elif iid.startswith('d:'):
+            selection.set_folder(rel, selection.state(rel) != 'all')
+            self._refresh_rows(rel, below=True)
+        self._update_stats()
+    
+    def _refresh_rows(self, rel: str, below: bool = False):
+        """Relabel the row of rel, its folders and (below) the shown rows inside it."""
+        tree = self.file_tree
+        rows = []
+        if below:
+            prefix = rel + '/'
+            for folder in self._populated:
+                if not rel or folder == rel or folder.startswith(prefix):
+                    rows.extend(tree.get_children(self._folder_iid(folder)))
+        rows.extend('d:' + folder for folder in self.selection.ancestors(rel) if folder)
+        if rel:
+            rows.append(('d:' if below else 'f:') + rel)
+        for iid in rows:
+            if tree.exists(iid):
+                tree.item(iid, text=self._row_text(iid))
+    
+    def _on_watch_toggle(self):
+        """Start or stop watching the project for changes (in the background)."""
+        if self.watch_var.get():
+            if self.watcher is None:
+                self.jobs.submit('watch-start', self._start_watch_job,
+                                 on_done=self._on_watch_started, restart=False)
+        elif self.watcher is not None:
+            watcher, self.watcher = self.watcher, None
+            self.jobs.submit('watch', lambda job: watcher.stop(), restart=False, cancellable=False)
+    
+    def _start_watch_job(self, job):
+        with self.state_lock:
+            return start_watcher(self.index)
+    
+    def _on_watch_started(self, watcher):
+        if self.watcher is None and self.watch_var.get():
+            self.watcher = watcher
+            self.root.after(WATCH_POLL_MS, self._poll_watch)
+        else:
+            watcher.stop()
+    
+    def _poll_watch(self):
+        """Let a background job apply pending file system changes to the index."""
+        if self.watcher is None:
+            return
+        if not self.jobs.busy('watch'):
+            self.jobs.submit('watch', self._watch_job, on_done=self._on_index_updated,
+                             restart=False, cancellable=False)
+        self.root.after(WATCH_POLL_MS, self._poll_watch)
+    
+    def _watch_job(self, job):
+        watcher = self.watcher
+        if watcher is None:
+            return None
+        with self.state_lock:
+            changed = watcher.poll()
+            if not changed:
+                return None
+            diff = self.index.update(changed)
+            if diff.rescanned:
+                watcher.resync()
+            entries = self.index.entries
+            sizes = {rel: entries[rel].signature[1] for rel in diff.modified if rel in entries}
+            if not (diff.added or diff.removed):
+                return diff, sizes, None
+            files = list(self.index.files())
+            rels = [self.index.rel(f) for f in files]
+            return diff, sizes, (files, rels) + self._weights(rels)
+    
+    def _on_index_updated(self, result):
+        if result is None:
+            return
+        diff, sizes, listing = result
+        if listing is not None:
+            self._sync_file_list(diff, *listing)
+        else:
+            selection = self.selection
+            for rel, size in sizes.items():
+                number = selection.number.get(rel)
+                if number is not None:
+                    selection.set_size(number, size)
+        if diff.added or diff.removed or diff.modified:
+            self._update_stats()
+    
+    def _sync_file_list(self, diff, files: list, rels: list, sizes: list, tokens: list):
+        """Rebuild the file list after files were added or removed, keeping the selection."""
+        self.files = files
+        self.selection = self.selection.rebuilt(rels, self.send_all_var.get(), sizes, tokens)
+        self._render_tree()
+        
+        if diff.added or diff.removed:
+            self.log(f"🔄 {len(diff.added)} added, {len(diff.removed)} removed / ファイル一覧を更新", 'info')
     
     def _on_send_all_toggle(self):
         """Handle 'Send ALL Files' checkbox toggle."""
-        checked = self.send_all_var.get()
-        for var in self.file_vars.values():
-            var.set(checked)
+        self.selection.set_all(self.send_all_var.get())
+        self._refresh_rows('', below=True)
         self._update_stats()
     
-    def _update_stats(self):
-        """Update file count and size statistics."""
-        selected_files = [f for f, var in self.file_vars.items() if var.get()]
-        total_size = sum(f.stat().st_size for f in selected_files if f.exists())
-        
+    def _select_relevant(self):
+        """Select only the files named in the instruction, the most relevant ones and what they import."""
+        instruction = self.instruction_text.get("1.0", tk.END).strip()
+        if not instruction:
+            messagebox.showwarning("警告", "指示を入力してください。")
+            return
+        selection = self.selection
+        self.jobs.submit('relevant', lambda job: self._relevant_job(job, instruction),
+                         on_done=lambda picks: self._on_relevant(selection, picks),
+                         on_progress=self._progress("Indexing / 索引を更新中"))
+    
+    def _relevant_job(self, job, instruction: str):
+        # Only files changed since the last search are read again
+        with self.state_lock:
+            job.check()
+            signatures = {rel: entry.signature for rel, entry in self.index.entries.items()}
+            root = self.project_root
+            try:
+                self.search_index.sync(signatures, lambda rel: read_for_search(root / rel),
+                                       progress=lambda done, total: job.progress(done, total, f"{done:,}/{total:,}"))
+            finally:
+                self.search_index.save()
+            return self.search_index.preselect(instruction, RELEVANT_FILES)
+    
+    def _on_relevant(self, selection, picks):
+        if selection is not self.selection:
+            self.log("⚠️ File list changed, try again / ファイル一覧が更新されたため再実行してください", 'warning')
+            return
+        rels = picks.mentioned + [rel for rel, _ in picks.ranked] + picks.imported
+        if not rels:
+            self.log("🎯 No relevant files found / 関連ファイルが見つかりません", 'warning')
+            return
+        self.send_all_var.set(False)
+        selection.set_all(False)
+        for rel in rels:
+            number = selection.number.get(rel)
+            if number is not None:
+                selection.set_file(number, True)
+        self._refresh_rows('', below=True)
+        self._update_stats()
+        self.log(f"🎯 Selected {len(rels)} files: {len(picks.mentioned)} named, {len(picks.ranked)} ranked, "
+                 f"{len(picks.imported)} imported / 関連ファイルを選択しました", 'success')
+        for rel, score in picks.ranked[:5]:
+            self.log(f"   {score:6.2f}  {rel}", 'info')
+    
+    def _update_stats(self, count: bool = True):
+        """Show the selection totals (kept up to date by FileSelection, no per-file work).
+
+        With count, selected files without a token count yet are counted by
+        a background job, which refreshes the stats as it goes.
+        """
+        selection = self.selection
+        counting = f" (counting {selection.pending:,}...)" if selection.pending else ""
         self.stats_label.config(
-            text=f"Files: {len(selected_files)}/{len(self.files)} | Size: {total_size / 1024:.1f} KB"
+            text=f"Files: {selection.count}/{len(self.files)} | Size: {selection.bytes / 1024:.1f} KB"
+                 f" | Tokens: ~{selection.token_total:,} ({self.token_counts.counter.name}){counting}"
         )
+        
+        # A running job is left alone; when it is done the stats are updated
+        # again and a new job picks up whatever is still uncounted
+        if selection.pending and count and not self.jobs.busy('tokens'):
+            self.jobs.submit('tokens', lambda job: self._count_tokens_job(job, selection),
+                             on_done=lambda counted: self._record_tokens(selection, counted, True),
+                             on_cancel=lambda: self._update_stats(False),
+                             on_progress=self._progress("Counting tokens / トークン計測中"))
+    
+    def _count_tokens_job(self, job, selection) -> list:
+        """Count tokens of the selected files that only have an estimate.
+
+        Results go back to the UI thread as (number, tokens) batches every
+        TOKEN_COUNT_SLICE; the last batch is the job's result.
+        """
+        pending = selection.uncounted()
+        total = len(pending)
+        counted = []
+        refresh = time.perf_counter() + TOKEN_COUNT_SLICE
+        try:
+            for done, number in enumerate(pending):
+                job.progress(done, total, f"{done:,}/{total:,}")
+                rel = selection.rels[number]
+                n = None
+                with self.state_lock:
+                    entry = self.index.entries.get(rel)
+                    if entry is not None:
+                        n = self.token_counts.lookup(rel, entry.signature)
+                        if n is None:
+                            try:
+                                n = self.token_counts.count_file(self.project_root / rel, rel, decode_content)
+                            except OSError:
+                                pass
+                counted.append((number, n))
+                if time.perf_counter() >= refresh:
+                    job.post(self._record_tokens, selection, counted)
+                    counted = []
+                    refresh = time.perf_counter() + TOKEN_COUNT_SLICE
+        finally:
+            with self.state_lock:
+                self.scan_cache.save()
+        return counted
+    
+    def _record_tokens(self, selection, counted: list, done: bool = False):
+        if selection is self.selection:
+            for number, n in counted:
+                # Unreadable files keep their estimate and are not retried
+                selection.set_tokens(number, n if n is not None else selection.tokens[number])
+        self._update_stats(done)
     
     def _copy_to_clipboard(self):
-        """Generate prompt and copy to clipboard."""
+        """Generate the prompt in the background and copy it to the clipboard."""
         instruction = self.instruction_text.get("1.0", tk.END).strip()
         if not instruction:
             messagebox.showwarning("警告", "指示を入力してください。")
             return
         
-        selected_files = [f for f, var in self.file_vars.items() if var.get()]
+        selected_files = self._selected_files()
         if not selected_files:
             messagebox.showwarning("警告", "少なくとも1つのファイルを選択してください。")
             return
         
-        self.log("プロンプトを生成中...", 'info')
-        
-        # Build prompt
-        xml_context = pack_context_xml(selected_files, self.project_root)
+        if self._parts is not None:
+            self._reset_parts()
         
-        prompt = f"""{SYSTEM_PROMPT}
-
-{xml_context}
-
----
-## User Instruction
-{instruction}
-"""
+        try:
+            budget = int(self.budget_var.get().strip() or 0)
+            part_limit = int(self.part_limit_var.get().strip() or 0)
+        except ValueError:
+            messagebox.showwarning("警告", "トークン上限・分割サイズには整数を入力してください。")
+            return
         
-        # Copy to clipboard using tkinter
-        self.root.clipboard_clear()
-        self.root.clipboard_append(prompt)
-        self.root.update()  # Required for clipboard to persist
+        overhead = prompt_overhead(self.token_counts.counter, instruction)
+        if 0 < budget <= overhead:
+            messagebox.showwarning("警告", f"トークン上限が小さすぎます（最低 {overhead:,} 以上）。")
+            return
         
-        char_count = len(prompt)
-        token_estimate = char_count // 4  # Rough estimate
+        # Tk variables are read here: jobs must not touch widgets
+        options = {
+            'budget': budget,
+            'part_limit': part_limit,
+            'policies': self.policy_var.get().split('+'),
+            'strategy': self.strategy_var.get(),
+            'outlines': self.outline_var.get(),
+            'unit': self.part_unit_var.get(),
+            'delta': self.delta_var.get(),
+            'reduce': self.reduce_var.get(),
+        }
+        self.log("プロンプトを生成中...", 'info')
+        self.jobs.submit('pack', lambda job: self._pack_job(job, selected_files, instruction, options),
+                         on_done=self._on_packed, on_cancel=self.root.clipboard_clear,
+                         on_progress=self._progress("Packing / 生成中"))
+    
+    def _pack_job(self, job, files: list, instruction: str, options: dict) -> dict:
+        """Build the prompt; the text goes to the clipboard in blocks posted to the UI thread."""
+        counter = self.token_counts.counter
+        overhead = prompt_overhead(counter, instruction)
+        budget = options['budget']
+        with self.state_lock:
+            if options['delta'] and self.snapshot.files:
+                return self._pack_delta_job(job, files, instruction)
+            
+            # Every Copy records what it sends for the next delta
+            writer = self.snapshot.writer()
+            plan = None
+            context = None
+            reducer = None
+            if budget > 0:
+                signatures = {rel: e.signature for rel, e in self.index.entries.items()}
+                candidates = budget_candidates(files, self.project_root, self.token_counts, signatures)
+                plan = plan_budget(candidates, budget - overhead, options['policies'],
+                                   options['strategy'], instruction)
+            job.check()
+            
+            if options['part_limit'] > 0:
+                part_files = [c.path for c in plan.selected] if plan is not None else files
+                measure = counter.count if options['unit'] == 'tokens' else len
+                try:
+                    parts = plan_prompt_parts(part_files, self.project_root, instruction,
+                                              options['part_limit'], measure, self.scan_cache,
+                                              writer.add, self.fragments)
+                except ValueError as e:
+                    return {'kind': 'too-small', 'error': e}
+                # Everything fits into one part: copy the prompt normally
+                if parts.count > 1:
+                    job.check()
+                    writer.commit()
+                    texts = iter_prompt_parts(parts, part_files, self.project_root, self.fragments)
+                    if plan is not None:
+                        plan.used = plan.planned  # parts are not written through iter_context_budget
+                    return {'kind': 'parts', 'plan': plan, 'overhead': overhead, 'texts': texts,
+                            'count': parts.count,
+                            'files': len(part_files), 'first': next(texts),
+                            'limit': options['part_limit'], 'unit': options['unit'],
+                            'delta': None, 'no_snapshot': options['delta']}
+                writer = self.snapshot.writer()
+            
+            if plan is not None:
+                context = iter_context_budget(plan, self.project_root, self.token_counts,
+                                              self.scan_cache, options['outlines'], writer.add,
+                                              self.fragments)
+            else:
+                reducer = Reducer(counter) if options['reduce'] else None
+                context = iter_context_xml(files, self.project_root, self.scan_cache,
+                                           self.token_counts, writer.add, reducer=reducer,
+                                           fragments=self.fragments)
+            
+            # Stream the prompt into the clipboard without building it in Python
+            job.post(self.root.clipboard_clear)
+            sink = BufferedSink(lambda block: job.post(self._append_clipboard, block))
+            for piece in iter_prompt(files, self.project_root, instruction,
+                                     self.scan_cache, self.token_counts, context):
+                sink.write(piece)
+                job.progress(sink.chars, None, f"{sink.chars:,} chars")
+            sink.close()
+            self.scan_cache.save()
+            job.check()
+            writer.commit()
+            
+            if plan is not None:
+                file_count = len(plan.selected) - len(plan.overflow)
+                token_estimate = overhead + plan.used
+            else:
+                file_count = len(files)
+                token_estimate = overhead + sum(
+                    self.token_counts.known.get(self.index.rel(f), (None, 0))[1] for f in files
+                )
+                if reducer is not None:
+                    token_estimate -= reducer.tokens_saved
+        return {'kind': 'prompt', 'plan': plan, 'overhead': overhead, 'chars': sink.chars, 'files': file_count,
+                'tokens': token_estimate, 'delta': None, 'no_snapshot': options['delta'],
+                'reduction': reducer.report() if reducer is not None else None}
+    
+    def _pack_delta_job(self, job, files: list, instruction: str) -> dict:
+        """Copy only the changes since the last Copy (runs under state_lock)."""
+        counter = self.token_counts.counter
+        delta = plan_delta(files, self.project_root, self.snapshot, self.scan_cache, self.fragments)
+        job.check()
+        writer = self.snapshot.writer(delta.unchanged_hashes())
+        job.post(self.root.clipboard_clear)
+        sink = BufferedSink(lambda block: job.post(self._append_clipboard, block))
+        tokens = 0
+        for piece in iter_delta_prompt(delta, self.project_root, instruction, self.snapshot,
+                                       writer, self.scan_cache, self.token_counts, self.fragments):
+            sink.write(piece)
+            tokens += counter.count(piece)
+            job.progress(sink.chars, None, f"{sink.chars:,} chars")
+        sink.close()
+        job.check()
+        writer.commit()
+        return {'kind': 'prompt', 'plan': None, 'chars': sink.chars, 'tokens': tokens,
+                'files': len(delta.added) + len(delta.modified), 'delta': delta, 'no_snapshot': False,
+                'reduction': None}
+    
+    def _on_packed(self, result: dict):
+        kind = result['kind']
+        if kind == 'too-small':
+            messagebox.showwarning("警告", f"分割サイズが小さすぎます。\n{result['error']}")
+            return
+        plan = result['plan']
+        if result['no_snapshot']:
+            self.log("ℹ️ 前回の送信記録がないため、すべて送信します / No earlier copy to diff against: "
+                     "sending everything", 'info')
+        if kind == 'parts':
+            texts = result['texts']
+            self._parts = (texts, result['count'], 0)
+            self.log(f"📑 {result['files']}ファイルを {result['count']} パートに分割しました "
+                     f"(≤ {result['limit']:,} {result['unit']})", 'info')
+            self._copy_part(texts, result['first'])
+            if plan is not None:
+                self._log_budget_report(plan, result['overhead'])
+            return
         
+        self.root.update()  # Required for clipboard to persist
+        char_count = result['chars']
+        token_estimate = result['tokens']
+        file_count = result['files']
         self.log(f"✅ クリップボードにコピーしました！", 'success')
         self.log(f"   文字数: {char_count:,}", 'info')
-        self.log(f"   推定トークン数: ~{token_estimate:,}", 'info')
-        self.log(f"   含まれるファイル数: {len(selected_files)}", 'info')
+        self.log(f"   推定トークン数: ~{token_estimate:,} ({self.token_counts.counter.name})", 'info')
+        self.log(f"   含まれるファイル数: {file_count}", 'info')
+        if plan is not None:
+            self._log_budget_report(plan, result['overhead'])
+        delta = result['delta']
+        if delta is not None:
+            self.log(f"   Δ 差分: 追加 {len(delta.added)} / 変更 {len(delta.modified)} / "
+                     f"削除 {len(delta.removed)} / 選択外 {len(delta.deselected)} / "
+                     f"変更なし {len(delta.unchanged)}", 'info')
+        reduction = result['reduction']
+        if reduction is not None:
+            self.log(f"   ✂️ 削減: {reduction['chars_saved']:,} 文字 / ~{reduction['tokens_saved']:,} トークン "
+                     f"(重複 {len(reduction['duplicates'])} / ヘッダー {len(reduction['headers'])} / "
+                     f"データ省略 {len(reduction['truncated'])})", 'info')
         
         messagebox.showinfo(
             "コピー完了",
             f"プロンプトをクリップボードにコピーしました！\n\n"
             f"文字数: {char_count:,}\n"
             f"推定トークン数: ~{token_estimate:,}\n"
-            f"ファイル数: {len(selected_files)}\n\n"
+            f"ファイル数: {file_count}\n\n"
             f"Google AI StudioやChatGPTにペーストしてください。"
         )
     
+    def _copy_next_part(self):
+        """Copy the next part of the current multi-part export to the clipboard."""
+        if self._parts is None:
+            return
+        texts = self._parts[0]
+        # Not cancellable: a part taken from the iterator must reach the clipboard
+        self.jobs.submit('pack', lambda job: next(texts, None),
+                         on_done=lambda text: self._copy_part(texts, text),
+                         restart=False, cancellable=False)
+    
+    def _copy_part(self, texts, text: str):
+        """Copy one part produced by the texts iterator of the current export."""
+        if self._parts is None or self._parts[0] is not texts:
+            return
+        _, count, done = self._parts
+        if text is None:
+            self._reset_parts()
+            return
+        sink = ClipboardSink(self.root)
+        write_prompt([text], sink)
+        done += 1
+        self.log(f"✅ パート {done}/{count} をコピーしました（{sink.chars:,}文字）", 'success')
+        if done == count:
+            self._reset_parts()
+            messagebox.showinfo("コピー完了", f"最後のパート（{count}/{count}）をコピーしました。\n"
+                                           f"貼り付けるとAIが指示に従って回答します。")
+            return
+        self._parts = (texts, count, done)
+        self.next_part_btn.config(state=tk.NORMAL,
+                                  text=f"📑 Copy Part {done + 1}/{count} / 次のパートをコピー")
+        if done == 1:
+            messagebox.showinfo("コピー完了", f"パート 1/{count} をコピーしました。\n"
+                                           f"貼り付けたら「次のパートをコピー」で続きをコピーしてください。")
+    
+    def _reset_parts(self):
+        self._parts = None
+        self.next_part_btn.config(state=tk.DISABLED, text="📑 Copy Next Part / 次のパートをコピー")
+    
+    def _log_budget_report(self, plan, overhead: int):
+        """Log what a token-budgeted copy left out."""
+        omitted = plan.omitted()
+        self.log(f"   上限 {plan.budget + overhead:,} tokens (プロンプト {overhead:,} + "
+                 f"コンテキスト {plan.used:,} / {plan.budget:,}; {plan.strategy}, {'+'.join(plan.policies)}): "
+                 f"概要のみ {len(plan.outlined)}件, 除外 {len(omitted)}件", 'info')
+        for rel in omitted[:20]:
+            self.log(f"   - {rel}", 'warning')
+        if len(omitted) > 20:
+            self.log(f"   ... and {len(omitted) - 20} more / 他 {len(omitted) - 20}件", 'warning')
+    
     def _apply_from_clipboard(self):
-        """Apply patches from clipboard content."""
+        """Apply patches from clipboard content (parsed and written in the background)."""
+        if self.jobs.busy('apply'):
+            self.log("⏳ パッチを適用中です。完了までお待ちください。", 'warning')
+            return
         try:
             clipboard_content = self.root.clipboard_get()
         except tk.TclError:
@@ -635,8 +1000,21 @@ class ManualBridgeGUI:
         self.log("=" * 50, 'info')
         self.log(f"パッチを適用中 ({datetime.now().strftime('%H:%M:%S')})", 'info')
         
-        # Parse patches
-        patches = parse_patches(clipboard_content)
+        atomic = self.atomic_var.get()
+        # Not cancellable: a batch is always written completely or not at all
+        self.jobs.submit('apply', lambda job: self._apply_job(clipboard_content, atomic),
+                         on_done=self._on_applied, restart=False, cancellable=False)
+    
+    def _apply_job(self, text: str, atomic: bool) -> tuple:
+        issues = []
+        patches = parse_patches(text, issues)
+        results = apply_patches(patches, self.project_root, self.journal, atomic) if patches else []
+        return issues, patches, results
+    
+    def _on_applied(self, result: tuple):
+        issues, patches, results = result
+        for issue in issues:
+            self.log(f"⚠️ {issue.line}行目 / line {issue.line}: {issue.message}", 'warning')
         
         if not patches:
             self.log("❌ クリップボードに有効なSEARCH/REPLACEブロックが見つかりません。", 'error')
@@ -649,12 +1027,11 @@ class ManualBridgeGUI:
         
         self.log(f"{len(patches)}個のパッチを検出", 'info')
         
-        # Apply each patch
+        # Log each patch
         success_count = 0
         fail_count = 0
         
-        for patch in patches:
-            success, message = apply_patch(patch, self.project_root)
+        for success, message in results:
             if success:
                 self.log(message, 'success')
                 success_count += 1
@@ -671,6 +1048,46 @@ class ManualBridgeGUI:
             messagebox.showinfo("成功", f"すべてのパッチ（{success_count}件）を正常に適用しました！")
         else:
             messagebox.showwarning("部分的成功", summary)
+        self._update_history_buttons()
+    
+    def _update_history_buttons(self):
+        self.undo_btn.config(state=tk.NORMAL if self.journal.can_undo() else tk.DISABLED)
+        self.redo_btn.config(state=tk.NORMAL if self.journal.can_redo() else tk.DISABLED)
+    
+    def _undo_apply(self):
+        """Restore the files changed by the last applied batch."""
+        self._replay_history(False)
+    
+    def _redo_apply(self):
+        """Re-apply the last undone batch."""
+        self._replay_history(True)
+    
+    def _replay_history(self, forward: bool):
+        """Undo or redo one batch in the background (serialized with patch application)."""
+        if self.jobs.busy('apply'):
+            return
+        journal = self.journal
+        
+        def replay(job):
+            label = journal.describe(journal.head + 1 if forward else journal.head)
+            return label, journal.redo() if forward else journal.undo()
+        
+        def done(result):
+            label, rels = result
+            if forward:
+                self.log(f"↪️ やり直しました ({label}): {', '.join(rels)}", 'success')
+            else:
+                self.log(f"↩️ 元に戻しました ({label}): {', '.join(rels)}", 'success')
+            self._update_history_buttons()
+        
+        def failed(error):
+            action = "やり直せませんでした" if forward else "元に戻せませんでした"
+            self.log(f"❌ {action}: {error}", 'error')
+            messagebox.showerror("エラー", f"{action}。\n{error}")
+            self._update_history_buttons()
+        
+        self.jobs.submit('apply', replay, on_done=done, on_error=failed,
+                         restart=False, cancellable=False)
     
     def log(self, message: str, tag: str = None):
         """Add a message to the log area."""
@@ -682,6 +1099,14 @@ class ManualBridgeGUI:
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
     
+    def _on_close(self):
+        """Stop background jobs and watching, and close the window."""
+        self.jobs.shutdown()
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.root.destroy()
+    
     def run(self):
         """Start the GUI main loop."""
         self.root.mainloop()
@@ -706,6 +1131,8 @@ def main():
     
     print(f"Context Bridge")
     print(f"Project: {cwd}")
+    if tracer.enable_from_env():
+        print(f"Tracing to: {tracer.path}")
     print("Starting GUI...")
     
     app = ManualBridgeGUI(cwd)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Compiled ignore engine
+.gitignore のパターンを一度だけコンパイルし、パスごとの判定コストを
+パターン数に依存しない程度に抑えるためのモジュール。
+
+Supported gitignore rules:
+    - negation (``!pattern``), last matching rule wins
+    - ``**`` (leading, trailing and inner), ``*``, ``?`` and ``[...]``
+    - anchored patterns (containing ``/``) and directory-only patterns (``dir/``)
+    - nested ``.gitignore`` files, deeper files taking precedence
+    - a file cannot be re-included when one of its parent directories is ignored
+"""
+
+import os
+import re
+import fnmatch
+from pathlib import Path
+
+GITIGNORE_NAME = '.gitignore'
+
+_GLOB_CHARS = re.compile(r'[*?\[\]\\]')
+
+
+# ==============================================================================
+# Pattern parsing
+# ==============================================================================
+
+def read_gitignore(gitignore_path: Path) -> list:
+    """Read a .gitignore file and return its raw pattern lines."""
+    patterns = []
+    try:
+        with open(gitignore_path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = _strip_line(line)
+                if line:
+                    patterns.append(line)
+    except OSError:
+        pass
+    return patterns
+
+
+def _strip_line(line: str) -> str:
+    """Normalize a .gitignore line; return '' for blanks and comments."""
+    line = line.rstrip('\r\n')
+    if not line or line.startswith('#'):
+        return ''
+    # Trailing spaces are ignored unless escaped with a backslash
+    stripped = line.rstrip(' \t')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += ' '
+    return stripped
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob (without anchor/negation) into a regex body."""
+    res = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                j = i + 2
+                seg_start = i == 0 or pattern[i - 1] == '/'
+                seg_end = j == n or pattern[j] == '/'
+                if seg_start and seg_end:
+                    if j == n:
+                        res.append('.+')          # 'dir/**' -> everything inside
+                        i = j
+                    else:
+                        res.append('(?:.*/)?')    # '**/' -> zero or more directories
+                        i = j + 1
+                    continue
+                while j < n and pattern[j] == '*':
+                    j += 1
+                res.append('[^/]*')
+                i = j
+                continue
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                res.append('[' + body + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            res.append(re.escape(pattern[i]))
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return ''.join(res)
+
+
+def _literal_ext(body: str) -> str:
+    """Return the literal trailing '.ext' of a glob, or '' if it has none.
+
+    A bracket class anywhere may hold the dot ('foo[.]txt'), so a body
+    with one has no literal extension.
+    """
+    head, dot, ext = body.rpartition('.')
+    if not dot or not ext or _GLOB_CHARS.search(ext) or '/' in ext or '[' in body or ']' in body:
+        return ''
+    return '.' + ext
+
+
+def _ordered_regex(entries: list):
+    """Compile (index, body) entries so the highest index is tried first.
+
+    Python's alternation returns the first alternative that matches, so
+    ordering by descending rule index makes the match the last rule in the
+    file. Returns (regex, group-number -> rule-index table).
+    """
+    entries = sorted(entries, reverse=True)
+    regex = re.compile('(?:' + '|'.join('(' + body + ')' for _, body in entries) + ')\\Z', re.DOTALL)
+    return regex, [None] + [idx for idx, _ in entries]
+
+
+class _Bucket:
+    """Rules of one kind (all paths / directories only) indexed for lookup.
+
+    Literal names, '*.ext' suffixes and anchored literal paths are plain
+    dict lookups. Remaining globs are compiled into a few regexes keyed by
+    their literal first path segment (anchored) or trailing extension
+    (basename globs), so a path is only tested against the patterns that
+    could possibly match it. Every lookup yields the highest matching rule
+    index, which makes the cost per path independent of the pattern count.
+    """
+
+    __slots__ = ('names', 'suffixes', 'paths', '_name_globs', '_path_globs',
+                 'name_regexes', 'path_regexes')
+
+    def __init__(self):
+        self.names = {}          # unanchored literal basenames: 'node_modules'
+        self.suffixes = {}       # unanchored '*.ext' patterns, stored as '.ext'
+        self.paths = {}          # anchored literal paths: 'build/out'
+        self._name_globs = {}    # trailing '.ext' (or '') -> [(index, regex body)]
+        self._path_globs = {}    # literal first segment (or '') -> [(index, regex body)]
+        self.name_regexes = {}
+        self.path_regexes = {}
+
+    def add(self, index: int, body: str, anchored: bool):
+        if not anchored:
+            if not _GLOB_CHARS.search(body):
+                self.names[body] = index
+            elif body.startswith('*') and body[1:2] == '.' and not _GLOB_CHARS.search(body[1:]):
+                self.suffixes[body[1:]] = index
+            else:
+                key = _literal_ext(body)
+                self._name_globs.setdefault(key, []).append((index, _translate(body)))
+        elif not _GLOB_CHARS.search(body):
+            self.paths[body] = index
+        else:
+            first = body.split('/', 1)[0]
+            key = '' if _GLOB_CHARS.search(first) else first
+            self._path_globs.setdefault(key, []).append((index, _translate(body)))
+
+    def compile(self):
+        self.name_regexes = {k: _ordered_regex(v) for k, v in self._name_globs.items()}
+        self.path_regexes = {k: _ordered_regex(v) for k, v in self._path_globs.items()}
+
+    def best(self, rel: str, name: str) -> int:
+        """Return the highest index of a rule matching rel, or -1."""
+        best = self.names.get(name, -1)
+        if self.paths:
+            best = max(best, self.paths.get(rel, -1))
+        if self.suffixes:
+            pos = name.find('.')
+            while pos != -1:
+                best = max(best, self.suffixes.get(name[pos:], -1))
+                pos = name.find('.', pos + 1)
+        if self.name_regexes:
+            dot = name.rfind('.')
+            keys = ('', name[dot:]) if dot != -1 else ('',)
+            for key in keys:
+                best = max(best, _regex_best(self.name_regexes.get(key), name))
+        if self.path_regexes:
+            for key in ('', rel.split('/', 1)[0]):
+                best = max(best, _regex_best(self.path_regexes.get(key), rel))
+        return best
+
+
+def _regex_best(compiled, text: str) -> int:
+    if compiled is None:
+        return -1
+    regex, table = compiled
+    m = regex.match(text)
+    return table[m.lastindex] if m else -1
+
+
+class CompiledRules:
+    """One .gitignore file compiled into indexed lookup tables."""
+
+    def __init__(self, patterns: list):
+        self.negated = []
+        self.any = _Bucket()     # applies to files and directories
+        self.dirs = _Bucket()    # directory-only patterns ('dir/')
+        for raw in patterns:
+            self._add(raw)
+        self.any.compile()
+        self.dirs.compile()
+
+    def _add(self, raw: str):
+        pattern = raw
+        negated = False
+        if pattern.startswith('!'):
+            negated = True
+            pattern = pattern[1:]
+        elif pattern.startswith('\\!') or pattern.startswith('\\#'):
+            pattern = pattern[1:]
+        dir_only = pattern.endswith('/') and not pattern.endswith('\\/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        # '**/name' is the same as an unanchored 'name'
+        rest = pattern
+        while rest.startswith('**/'):
+            rest = rest[3:]
+        if rest and rest != pattern and '/' not in rest:
+            pattern, anchored = rest, False
+        if not pattern:
+            return
+        index = len(self.negated)
+        self.negated.append(negated)
+        (self.dirs if dir_only else self.any).add(index, pattern, anchored)
+
+    def verdict(self, rel: str, is_dir: bool):
+        """Return True (ignored), False (re-included) or None (no rule matched)."""
+        name = rel.rsplit('/', 1)[-1]
+        best = self.any.best(rel, name)
+        if is_dir:
+            best = max(best, self.dirs.best(rel, name))
+        if best < 0:
+            return None
+        return not self.negated[best]
+
+
+def compile_name_patterns(patterns):
+    """Compile fnmatch-style name patterns into a single predicate on a name."""
+    literals = {p for p in patterns if not _GLOB_CHARS.search(p)}
+    globs = [fnmatch.translate(p) for p in patterns if p not in literals]
+    regex = re.compile('|'.join(globs)) if globs else None
+
+    def match(name: str) -> bool:
+        if name in literals:
+            return True
+        return regex is not None and regex.match(name) is not None
+
+    return match
+
+
+# ==============================================================================
+# Matcher
+# ==============================================================================
+
+class IgnoreMatcher:
+    """Compiled .gitignore matcher for one project root.
+
+    Paths are given relative to the project root using '/' separators.
+    Nested .gitignore files are loaded lazily the first time a directory is
+    visited, and directory verdicts are cached so each ancestor is only
+    evaluated once per scan.
+    """
+
+    def __init__(self, project_root: Path, patterns: list = None, nested: bool = True):
+        self.project_root = Path(project_root)
+        self.nested = nested
+        if patterns is None:
+            patterns = read_gitignore(self.project_root / GITIGNORE_NAME)
+        self.patterns = list(patterns)
+        self._rules = {'': CompiledRules(self.patterns)}
+        self._dir_cache = {}
+
+    def _rules_for(self, rel_dir: str):
+        """Return the compiled rules of the .gitignore directly in rel_dir (or None)."""
+        try:
+            return self._rules[rel_dir]
+        except KeyError:
+            pass
+        rules = None
+        if self.nested:
+            gitignore = self.project_root / rel_dir / GITIGNORE_NAME
+            if os.path.isfile(gitignore):
+                patterns = read_gitignore(gitignore)
+                if patterns:
+                    rules = CompiledRules(patterns)
+        self._rules[rel_dir] = rules
+        return rules
+
+    def _verdict(self, rel: str, is_dir: bool, parent: str) -> bool:
+        """Evaluate rel against the .gitignore chain, deepest file first."""
+        bases = [parent]
+        while bases[-1]:
+            bases.append(bases[-1].rpartition('/')[0])
+        for base in bases:
+            rules = self._rules_for(base)
+            if rules is None:
+                continue
+            sub = rel[len(base) + 1:] if base else rel
+            verdict = rules.verdict(sub, is_dir)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def is_dir_ignored(self, rel_dir: str) -> bool:
+        """Check a directory, including all of its ancestors (cached)."""
+        try:
+            return self._dir_cache[rel_dir]
+        except KeyError:
+            pass
+        parent = rel_dir.rpartition('/')[0]
+        ignored = bool(parent) and self.is_dir_ignored(parent)
+        if not ignored:
+            ignored = self._verdict(rel_dir, True, parent)
+        self._dir_cache[rel_dir] = ignored
+        return ignored
+
+    def match(self, rel: str, is_dir: bool = False) -> bool:
+        """Return True if the project-relative path is ignored."""
+        if is_dir:
+            return self.is_dir_ignored(rel)
+        parent = rel.rpartition('/')[0]
+        if parent and self.is_dir_ignored(parent):
+            return True
+        return self._verdict(rel, False, parent)
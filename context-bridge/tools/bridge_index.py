@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - In-memory project index
+スキャン結果（送信対象のテキストファイルとその stat 情報）をメモリ上に保持し、
+変更のあったパスだけを再判定して最新の状態に保つ。
+"""
+
+import os
+import stat
+from collections import namedtuple
+from pathlib import Path
+
+from bridge_cache import stat_signature
+from bridge_scan import ProjectWalker, ordered_map, sniff_file
+from bridge_trace import tracer
+
+# One indexed text file: stat signature (mtime_ns, size, inode) + head encoding
+IndexEntry = namedtuple('IndexEntry', 'signature encoding')
+
+# Result of rescan()/update(): sets of project-relative paths
+IndexDiff = namedtuple('IndexDiff', 'added removed modified rescanned')
+
+# Entries walked between two calls of a rescan's check callback
+CHECK_EVERY = 512
+
+
+def _sniff(path):
+    try:
+        return sniff_file(path)
+    except Exception:
+        return None
+
+
+class ProjectIndex:
+    """The set of text files to offer for a project, kept up to date incrementally.
+
+    make_predicate(project_root) must return is_ignored(rel, name, is_dir),
+    the same predicate ProjectWalker uses; it is rebuilt on every full rescan
+    so edits to .gitignore files take effect. Files that pass the ignore
+    rules and sniff as text are kept in ``entries``; the signatures of the
+    remaining (binary) files go to ``binary`` so they are not re-sniffed.
+    """
+
+    def __init__(self, project_root: Path, make_predicate, cache=None,
+                 max_depth: int = None, max_files: int = None):
+        self.project_root = Path(project_root)
+        self.make_predicate = make_predicate
+        self.cache = cache
+        self.max_depth = max_depth
+        self.max_files = max_files
+        self.entries = {}
+        self.binary = {}
+        self.truncated = None
+        self.version = 0
+        self._is_ignored = None
+        self._sorted = None
+
+    # --------------------------------------------------------------------------
+    # Queries
+    # --------------------------------------------------------------------------
+
+    def files(self) -> list:
+        """Return indexed files as absolute Paths, sorted like collect_files()."""
+        if self._sorted is None or self._sorted[0] != self.version:
+            paths = [self.project_root / rel for rel in self.entries]
+            paths.sort(key=lambda x: str(x).lower())
+            self._sorted = (self.version, paths)
+        return self._sorted[1]
+
+    def rel(self, path: Path) -> str:
+        """Return the index key ('/'-separated relative path) for an absolute path."""
+        return str(path.relative_to(self.project_root)).replace('\\', '/')
+
+    def signatures(self) -> dict:
+        """Return rel -> stat signature for every non-ignored file (text or binary)."""
+        sigs = dict(self.binary)
+        sigs.update((rel, entry.signature) for rel, entry in self.entries.items())
+        return sigs
+
+    def is_ignored(self, rel: str, is_dir: bool) -> bool:
+        """Check a project-relative path and all of its parent directories."""
+        if self._is_ignored is None:
+            self._is_ignored = self.make_predicate(self.project_root)
+        parts = rel.split('/')
+        prefix = ''
+        for name in parts[:-1]:
+            prefix = prefix + '/' + name if prefix else name
+            if self._is_ignored(prefix, name, True):
+                return True
+        return self._is_ignored(rel, parts[-1], is_dir)
+
+    # --------------------------------------------------------------------------
+    # Updates
+    # --------------------------------------------------------------------------
+
+    def _classify(self, candidates, previous: dict, new: dict, modified: set, binary: dict):
+        """Sniff (rel, path, signature) candidates on the I/O pool into new/binary."""
+        cache = self.cache
+        sniff = tracer.timed('sniff', _sniff)
+        results = ordered_map(lambda item: (item, sniff(item[1])), candidates)
+        for (rel, _, signature), encoding in results:
+            if cache is not None:
+                cache.store(rel, signature, encoding is not None, encoding)
+            if encoding is not None:
+                new[rel] = IndexEntry(signature, encoding)
+                if rel in previous:
+                    modified.add(rel)
+            else:
+                binary[rel] = signature
+
+    def _walk(self, start: str, previous: dict, new: dict, modified: set, binary: dict,
+              seen: list = None, check=None):
+        """Walk from start into new, reusing unchanged previous entries and cache hits.
+
+        Returns the walker so callers can inspect ``truncated``.
+        """
+        walker = ProjectWalker(self.project_root, tracer.timed('ignore', self._is_ignored),
+                               max_depth=self.max_depth, max_files=self.max_files, start=start)
+        cache = self.cache
+
+        def candidates():
+            walked = 0
+            for rel, entry in walker:
+                walked += 1
+                if check is not None and not walked % CHECK_EVERY:
+                    check(walked)
+                try:
+                    signature = stat_signature(entry.stat())
+                except OSError:
+                    continue
+                if seen is not None:
+                    seen.append(rel)
+                old = previous.get(rel)
+                if old is not None and old.signature == signature:
+                    new[rel] = old
+                    continue
+                if old is None and self.binary.get(rel) == signature:
+                    binary[rel] = signature
+                    continue
+                if cache is not None:
+                    record = cache.lookup(rel, signature)
+                    if record is not None:
+                        if record.is_text:
+                            new[rel] = IndexEntry(signature, record.encoding)
+                            if old is not None:
+                                modified.add(rel)
+                        else:
+                            binary[rel] = signature
+                        continue
+                yield rel, entry.path, signature
+            tracer.count("files stat'ed", walked)
+
+        self._classify(candidates(), previous, new, modified, binary)
+        return walker
+
+    def rescan(self, check=None) -> IndexDiff:
+        """Walk the whole project again; unchanged files are not reopened.
+
+        check(walked), if given, is called every CHECK_EVERY entries; an
+        exception it raises aborts the scan and leaves the index as it was.
+        """
+        self._is_ignored = self.make_predicate(self.project_root)
+        new, modified, binary, seen = {}, set(), {}, []
+        with tracer.span('rescan'):
+            walker = self._walk('', self.entries, new, modified, binary, seen, check)
+        self.truncated = walker.truncated
+        if self.cache is not None:
+            if not walker.truncated:
+                self.cache.retain(seen)
+            self.cache.save()
+        diff = IndexDiff(set(new) - set(self.entries), set(self.entries) - set(new), modified, True)
+        self.entries = new
+        self.binary = binary
+        self.version += 1
+        return diff
+
+    def update(self, rels) -> IndexDiff:
+        """Re-check only the given project-relative paths (files or directories).
+
+        An empty path (the project root) or a changed .gitignore triggers a
+        full rescan, since ignore verdicts may change anywhere.
+        """
+        rels = set(rels)
+        if self._is_ignored is None or '' in rels or any(
+                r.rpartition('/')[2] == '.gitignore' for r in rels):
+            return self.rescan()
+
+        added, removed, modified = set(), set(), set()
+        for rel in sorted(rels):
+            path = os.path.join(str(self.project_root), rel)
+            try:
+                st = os.lstat(path)
+                is_dir = stat.S_ISDIR(st.st_mode)
+                if stat.S_ISLNK(st.st_mode):
+                    st = os.stat(path)
+            except OSError:
+                st, is_dir = None, False
+            # A vanished or (re)created directory replaces everything below it
+            before = self._drop_subtree(rel) if st is None or is_dir else {}
+            if st is None or self.is_ignored(rel, is_dir):
+                self.binary.pop(rel, None)
+                if rel in self.entries:
+                    del self.entries[rel]
+                    removed.add(rel)
+                removed.update(before)
+                continue
+            if is_dir:
+                new = {}
+                self._walk(rel, before, new, modified, self.binary)
+                self.entries.update(new)
+                added.update(set(new) - set(before))
+                removed.update(set(before) - set(new))
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            signature = stat_signature(st)
+            old = self.entries.get(rel)
+            if old is not None and old.signature == signature:
+                continue
+            if self.binary.get(rel) == signature:
+                continue
+            new = {}
+            self.binary.pop(rel, None)
+            self._classify([(rel, path, signature)], self.entries, new, modified, self.binary)
+            if rel in new:
+                self.entries[rel] = new[rel]
+                if old is None:
+                    added.add(rel)
+            elif old is not None:
+                del self.entries[rel]
+                removed.add(rel)
+        if added or removed or modified:
+            self.version += 1
+            if self.cache is not None:
+                self.cache.save()
+        return IndexDiff(added, removed - added, modified, False)
+
+    def _drop_subtree(self, rel: str) -> dict:
+        """Remove and return every entry below directory rel."""
+        prefix = rel + '/'
+        for r in [r for r in self.binary if r.startswith(prefix)]:
+            del self.binary[r]
+        dropped = {r: e for r, e in self.entries.items() if r.startswith(prefix)}
+        for r in dropped:
+            del self.entries[r]
+        return dropped
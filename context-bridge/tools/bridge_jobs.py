@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Background jobs
+スキャン・プロンプト生成・トークン計測・パッチ適用などの重い処理をワーカー
+スレッドで実行し、結果だけを GUI スレッドに返すためのジョブ管理。
+
+A job is a function func(job) run on a worker pool. It talks to the UI only
+through job.post() / job.progress() and its callbacks, which are queued
+and run on the UI thread by JobRunner.poll() (the GUI calls it from
+root.after). Jobs share a key per kind of work: jobs with the same key
+never run at the same time, a newly submitted one waits for the running
+one and replaces any job already waiting (coalescing), and by default the
+running one is asked to stop. Cancellation is cooperative: job.check() and
+job.progress() raise JobCancelled once the job is cancelled.
+
+While tracing (see bridge_trace), every job runs inside a span named by
+its key and on_trace(job, lines) gets the phase breakdown of its run on
+the UI thread, after the callbacks the job posted. The breakdown covers
+everything traced meanwhile, including jobs of other keys.
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge_trace import tracer
+
+# Worker threads
+JOB_WORKERS = 2
+
+# Minimum seconds between two progress reports of one job
+PROGRESS_INTERVAL = 0.1
+
+# Seconds of callbacks run per poll() so a burst of posts cannot freeze the UI
+POLL_SLICE = 0.05
+
+
+class JobCancelled(Exception):
+    """Raised inside a job by check()/progress() once it has been cancelled."""
+
+
+class Job:
+    """One unit of background work; its function gets the Job as only argument."""
+
+    def __init__(self, runner, key: str, func, callbacks: tuple, cancellable: bool):
+        self.key = key
+        self.func = func
+        self.on_done, self.on_error, self.on_progress, self.on_cancel = callbacks
+        self.cancellable = cancellable
+        self._runner = runner
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._finished = False
+        self._last_progress = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the job to stop; no effect once it has finished or if it is not cancellable."""
+        with self._lock:
+            if self.cancellable and not self._finished:
+                self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(self.key)
+
+    def post(self, func, *args):
+        """Run func(*args) on the UI thread (dropped if the job gets cancelled)."""
+        self._runner._queue.put((self, func, args, False))
+
+    def progress(self, done: int, total: int = None, text: str = ''):
+        """Report progress to on_progress(done, total, text), at most every PROGRESS_INTERVAL.
+
+        Raises JobCancelled if the job was cancelled.
+        """
+        self.check()
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL or (total is not None and done >= total):
+            self._last_progress = now
+            self.post(self.on_progress, done, total, text)
+
+
+class JobRunner:
+    """Worker pool plus the queue of callbacks waiting for the UI thread.
+
+    on_error(job, exception) handles failures of jobs submitted without
+    their own on_error; on_trace(job, lines) receives trace reports.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, on_error=None, on_trace=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bridge-job')
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._running = {}  # key -> Job
+        self._pending = {}  # key -> Job waiting for the running one
+        self._closed = False
+        self.on_error = on_error
+        self.on_trace = on_trace
+
+    def submit(self, key: str, func, on_done=None, on_error=None, on_progress=None,
+               on_cancel=None, restart: bool = True, cancellable: bool = True) -> Job:
+        """Run func(job) in the background; callbacks run on the UI thread.
+
+        on_done(result) follows a normal return, on_error(exception) a
+        failure and on_cancel() a cancellation; exactly one of them is
+        called, unless it is replaced or cancelled while still waiting. With
+        restart, a running job of the same key is cancelled.
+        """
+        job = Job(self, key, func, (on_done, on_error, on_progress, on_cancel), cancellable)
+        with self._lock:
+            if self._closed:
+                return job
+            running = self._running.get(key)
+            if running is None:
+                self._running[key] = job
+            else:
+                self._pending[key] = job
+                if restart:
+                    running.cancel()
+                return job
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        callback, args = None, ()
+        mark = tracer.mark()
+        try:
+            job.check()
+            with tracer.span(job.key):
+                result = job.func(job)
+        except JobCancelled:
+            pass
+        except Exception as e:
+            callback, args = job.on_error, (e,)
+            if callback is None and self.on_error is not None:
+                callback, args = self.on_error, (job, e)
+        else:
+            callback, args = job.on_done, (result,)
+        with job._lock:
+            job._finished = True
+            if job._cancelled.is_set():
+                callback, args = job.on_cancel, ()
+
+        # The key is free (or taken by the next job) before the final
+        # callback runs, so the callback may submit again
+        with self._lock:
+            if self._running.get(job.key) is job:
+                del self._running[job.key]
+            following = self._pending.pop(job.key, None)
+            if following is not None and not self._closed:
+                self._running[job.key] = following
+            else:
+                following = None
+        if callback is not None:
+            self._queue.put((job, callback, args, True))
+        if mark is not None and self.on_trace is not None:
+            self._queue.put((job, self._report_trace, (job, mark), True))
+        if following is not None:
+            self._pool.submit(self._run, following)
+
+    def _report_trace(self, job: Job, mark):
+        lines = tracer.report(mark)
+        if lines:
+            self.on_trace(job, lines)
+
+    def poll(self, slice_seconds: float = POLL_SLICE) -> int:
+        """Run queued callbacks (call from the UI thread); returns how many ran."""
+        deadline = time.monotonic() + slice_seconds
+        ran = 0
+        while time.monotonic() < deadline:
+            try:
+                job, func, args, final = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled and not final:
+                continue
+            func(*args)
+            ran += 1
+        return ran
+
+    def busy(self, key: str = None) -> bool:
+        with self._lock:
+            if key is None:
+                return bool(self._running)
+            return key in self._running
+
+    def cancel(self, key: str = None):
+        """Cancel the running and waiting jobs of key (of every key if None)."""
+        with self._lock:
+            keys = list(self._running) if key is None else [key]
+            for k in keys:
+                waiting = self._pending.get(k)
+                if waiting is not None and waiting.cancellable:
+                    del self._pending[k]
+                running = self._running.get(k)
+                if running is not None:
+                    running.cancel()
+
+    def shutdown(self):
+        """Cancel everything and stop accepting jobs (does not wait for workers)."""
+        self.cancel()
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=False)
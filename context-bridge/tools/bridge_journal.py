@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Transactional writes and undo journal
+パッチ適用をトランザクションとして扱う。新しい内容を同じディレクトリの一時
+ファイルに書き出して fsync し、まとめて rename で置き換える。途中で失敗した
+場合は元の内容に戻す。適用したバッチはジャーナルに記録し、バッチ単位で
+元に戻す（Undo）／やり直す（Redo）ことができる。
+
+A journal record holds, per file, the content hashes before and after the
+batch and the sequence of text edits between them ([offset, old, new]), so
+its size is proportional to the changed text. Files whose bytes do not
+round-trip through the text (non-UTF-8 encodings) store both versions raw.
+Records live next to the scan cache, one JSON file per batch.
+"""
+
+import os
+import json
+import stat
+import time
+import base64
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+from bridge_cache import content_hash, project_cache_path
+
+# Batches kept for undo
+JOURNAL_LIMIT = 50
+
+# One file of a transaction: data/before are bytes, or None for "absent"
+FileWrite = namedtuple('FileWrite', 'path data before')
+
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class TransactionError(Exception):
+    """A batch could not be written (the files were left or put back as before)."""
+
+
+# ==============================================================================
+# Atomic multi-file commit
+# ==============================================================================
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _fsync_dir(path):
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _stage(path: Path, data: bytes) -> str:
+    """Write data to a synced temp file next to path; returns the temp path."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.cb-tmp', dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+    except BaseException:
+        _remove(tmp)
+        raise
+    return tmp
+
+
+def _put(path: Path, data):
+    """Replace path with data (None deletes it) through a temp file."""
+    if data is None:
+        if os.path.lexists(path):
+            os.unlink(path)
+    else:
+        os.replace(_stage(path, data), path)
+
+
+def commit_files(writes: list):
+    """Write every FileWrite or none of them.
+
+    All new contents are staged and fsynced first; only then are they
+    renamed into place (deletions last). If a rename fails, the files
+    already replaced are restored from their `before` bytes.
+    """
+    staged = {}
+    try:
+        for w in writes:
+            if w.data is not None:
+                staged[w.path] = _stage(w.path, w.data)
+    except Exception as e:
+        for tmp in staged.values():
+            _remove(tmp)
+        raise TransactionError(f"could not stage {w.path.name}: {e}") from e
+
+    done = []
+    try:
+        for w in sorted(writes, key=lambda w: w.data is None):
+            if w.data is not None:
+                os.replace(staged[w.path], w.path)
+                del staged[w.path]
+            elif os.path.lexists(w.path):
+                os.unlink(w.path)
+            done.append(w)
+    except Exception as e:
+        for tmp in staged.values():
+            _remove(tmp)
+        for d in reversed(done):
+            try:
+                _put(d.path, d.before)
+            except OSError:
+                pass
+        raise TransactionError(f"could not replace {w.path.name}: {e}") from e
+
+    for parent in {w.path.parent for w in writes}:
+        _fsync_dir(parent)
+
+
+# ==============================================================================
+# Journal
+# ==============================================================================
+
+def apply_ops(text: str, ops: list) -> str:
+    """Replay [offset, old, new] edits in order."""
+    for offset, old, new in ops:
+        text = text[:offset] + new + text[offset + len(old):]
+    return text
+
+
+def revert_ops(text: str, ops: list) -> str:
+    """Undo apply_ops()."""
+    for offset, old, new in reversed(ops):
+        text = text[:offset] + old + text[offset + len(new):]
+    return text
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii') if data is not None else None
+
+
+def _unb64(text):
+    return base64.b64decode(text) if text is not None else None
+
+
+def make_entry(rel: str, before, after, ops=None, base_text: str = None,
+               encoding: str = 'utf-8') -> dict:
+    """Describe one file of a batch for the journal.
+
+    ops are the edits from base_text (the decoded `before`, '' for a new
+    file) to the new text; they are stored when `before` round-trips
+    through base_text, otherwise both versions are stored raw.
+    """
+    entry = {
+        'rel': rel,
+        'before': content_hash(before) if before is not None else None,
+        'after': content_hash(after) if after is not None else None,
+        'encoding': encoding,
+    }
+    if ops is not None and (before is None or (base_text is not None and
+                                               base_text.encode(encoding) == before)):
+        entry['ops'] = ops
+    else:
+        entry['before_raw'] = _b64(before)
+        entry['after_raw'] = _b64(after)
+    return entry
+
+
+def _read_current(path: Path):
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _other_side(entry: dict, current, forward: bool):
+    """Bytes the file should have after redo (forward) or undo, given its current bytes."""
+    expected = entry['before'] if forward else entry['after']
+    if (content_hash(current) if current is not None else None) != expected:
+        raise TransactionError(f"{entry['rel']} was changed after the batch; not touching it")
+    target = entry['after'] if forward else entry['before']
+    if target is None:
+        return None
+    if 'ops' in entry:
+        encoding = entry['encoding']
+        text = current.decode(encoding) if current is not None else ''
+        text = apply_ops(text, entry['ops']) if forward else revert_ops(text, entry['ops'])
+        data = text.encode(encoding)
+    else:
+        data = _unb64(entry['after_raw'] if forward else entry['before_raw'])
+    if content_hash(data) != target:
+        raise TransactionError(f"journal record for {entry['rel']} does not reproduce the file")
+    return data
+
+
+class Journal:
+    """Undo/redo history of applied batches for one project.
+
+    Records are numbered; ``head`` is the last applied one. Records above
+    head are the redo stack (state 'committed') or a batch interrupted
+    mid-commit (state 'prepared'), which recover() rolls back.
+    """
+
+    def __init__(self, project_root: Path, cache_dir: Path = None, limit: int = JOURNAL_LIMIT):
+        self.project_root = Path(project_root).resolve()
+        self.dir = project_cache_path(self.project_root, '.journal', cache_dir)
+        self.limit = limit
+        self.head = self._read_head()
+
+    # --------------------------------------------------------------------------
+    # Storage
+    # --------------------------------------------------------------------------
+
+    def _path(self, seq: int) -> Path:
+        return self.dir / f'{seq:06d}.json'
+
+    def _seqs(self) -> list:
+        try:
+            names = os.listdir(self.dir)
+        except OSError:
+            return []
+        return sorted(int(n[:-5]) for n in names if n.endswith('.json') and n[:-5].isdigit())
+
+    def _read_head(self) -> int:
+        try:
+            return int((self.dir / 'HEAD').read_text().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _write(self, path: Path, text: str):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        os.replace(_stage(path, text.encode('utf-8')), path)
+
+    def _set_head(self, seq: int):
+        self._write(self.dir / 'HEAD', str(seq))
+        self.head = seq
+
+    def _load(self, seq: int):
+        try:
+            return json.loads(self._path(seq).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, record: dict):
+        self._write(self._path(record['seq']), json.dumps(record, ensure_ascii=False))
+
+    # --------------------------------------------------------------------------
+    # Recording
+    # --------------------------------------------------------------------------
+
+    def begin(self, entries: list, label: str = ''):
+        """Record a batch about to be committed; returns its number, or None if the journal is unavailable."""
+        try:
+            for seq in self._seqs():
+                if seq > self.head:
+                    _remove(self._path(seq))
+            seq = self.head + 1
+            self._save({'seq': seq, 'state': 'prepared', 'time': time.time(),
+                        'label': label, 'files': entries})
+            return seq
+        except OSError:
+            return None
+
+    def finish(self, seq: int):
+        """Mark a begun batch as committed and make it the head."""
+        try:
+            record = self._load(seq)
+            record['state'] = 'committed'
+            self._save(record)
+            self._set_head(seq)
+            for old in self._seqs():
+                if old <= seq - self.limit:
+                    _remove(self._path(old))
+        except (OSError, TypeError):
+            pass
+
+    def abort(self, seq: int):
+        _remove(self._path(seq))
+
+    # --------------------------------------------------------------------------
+    # Undo / redo
+    # --------------------------------------------------------------------------
+
+    def _record(self, seq: int):
+        record = self._load(seq)
+        return record if record is not None and record.get('state') == 'committed' else None
+
+    def can_undo(self) -> bool:
+        return self.head > 0 and self._record(self.head) is not None
+
+    def can_redo(self) -> bool:
+        return self._record(self.head + 1) is not None
+
+    def describe(self, seq: int) -> str:
+        record = self._load(seq)
+        return record.get('label', '') if record else ''
+
+    def _replay(self, record: dict, forward: bool) -> list:
+        writes = []
+        for entry in record['files']:
+            path = self.project_root / entry['rel']
+            current = _read_current(path)
+            writes.append(FileWrite(path, _other_side(entry, current, forward), current))
+        commit_files(writes)
+        return [entry['rel'] for entry in record['files']]
+
+    def undo(self) -> list:
+        """Restore the files of the head batch; returns their rels.
+
+        Raises TransactionError (touching nothing) if any of them changed since.
+        """
+        record = self._record(self.head)
+        if record is None:
+            raise TransactionError("nothing to undo")
+        rels = self._replay(record, False)
+        self._set_head(self.head - 1)
+        return rels
+
+    def redo(self) -> list:
+        """Re-apply the batch after head; returns its rels."""
+        record = self._record(self.head + 1)
+        if record is None:
+            raise TransactionError("nothing to redo")
+        rels = self._replay(record, True)
+        self._set_head(self.head + 1)
+        return rels
+
+    def recover(self) -> list:
+        """Roll back a batch whose commit was interrupted; returns the rels restored."""
+        restored = []
+        for seq in self._seqs():
+            if seq <= self.head:
+                continue
+            record = self._load(seq)
+            if record is None or record.get('state') != 'prepared':
+                continue
+            for entry in record['files']:
+                path = self.project_root / entry['rel']
+                current = _read_current(path)
+                if entry['after'] is None and current is None and entry['before'] is not None \
+                        or current is not None and content_hash(current) == entry['after']:
+                    try:
+                        _put(path, _other_side(entry, current, False))
+                        restored.append(entry['rel'])
+                    except (OSError, TransactionError):
+                        pass
+            self.abort(seq)
+        return restored
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Memory-mapped large files
+大きなファイル（LARGE_FILE_SIZE 以上）をメモリマップし、UTF-8 であれば
+バイト列のまま出力先へ流す。SQL ダンプや生成コードのような巨大ファイルでも、
+ファイル全体の str を作らずにプロンプトへ書き出せる。
+
+A MappedText stands for the text of one large UTF-8 file. It is checked
+when it is opened, window by window, so no more than WINDOW bytes are
+ever decoded at once; the binary sniff only looks at the first pages of
+the map. Sinks then write it in one of two ways (see bridge_sinks):
+sinks that accept bytes copy windows of the map straight to their file,
+the others get the text as str pieces of about WINDOW bytes. Consumers
+that need the whole text (e.g. token counting on a cache miss) call
+str(). Files in other encodings are not mapped and are read as before.
+"""
+
+import os
+import mmap
+import codecs
+
+from bridge_cache import content_hash
+from bridge_scan import SNIFF_SIZE, detect_head_encoding
+from bridge_trace import tracer
+
+# Files at least this large (bytes) are mapped instead of read
+LARGE_FILE_SIZE = 8 << 20
+
+# Bytes decoded or written at a time
+WINDOW = 1 << 20
+
+
+class MappedText:
+    """The UTF-8 text of a mapped file; len() is its length in characters."""
+
+    def __init__(self, path, data: mmap.mmap, start: int, chars: int):
+        self.path = path
+        self.chars = chars
+        self.encoding = 'utf-8-sig' if start else 'utf-8'
+        self._map = data
+        self._start = start  # after a byte order mark
+
+    def __len__(self) -> int:
+        return self.chars
+
+    def __str__(self) -> str:
+        with memoryview(self._map) as view:
+            return str(view[self._start:], 'utf-8')
+
+    def windows(self):
+        """Yield memoryviews of at most WINDOW bytes; each is released once the next is requested."""
+        with memoryview(self._map) as view:
+            for pos in range(self._start, len(view), WINDOW):
+                with view[pos:pos + WINDOW] as window:
+                    yield window
+
+    def chunks(self):
+        """Yield the text as str pieces of at most WINDOW bytes each."""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for window in self.windows():
+            text = decoder.decode(window)
+            if text:
+                yield text
+        text = decoder.decode(b'', True)
+        if text:
+            yield text
+
+    def encode(self, encoding: str = 'utf-8') -> bytes:
+        """The text encoded, like str.encode(); UTF-8 is copied from the map without decoding."""
+        if codecs.lookup(encoding).name != 'utf-8':
+            return str(self).encode(encoding)
+        return self._map[self._start:]
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # a window is still held (e.g. a failed write); freed with it
+
+
+def _count_chars(data: mmap.mmap, start: int):
+    """Characters of data[start:] as UTF-8, or None if it is not valid UTF-8."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chars = 0
+    try:
+        with memoryview(data) as view:
+            for pos in range(start, len(view), WINDOW):
+                with view[pos:pos + WINDOW] as window:
+                    chars += len(decoder.decode(window))
+        chars += len(decoder.decode(b'', True))
+    except UnicodeDecodeError:
+        return None
+    return chars
+
+
+def map_text(file_path) -> tuple:
+    """Map a large text file: (MappedText, fstat, hash).
+
+    Returns (None, fstat, None) if the file is smaller than LARGE_FILE_SIZE
+    or is not UTF-8 text, in which case it should be read normally. The
+    caller closes the MappedText. Raises OSError if the file cannot be read.
+    """
+    with open(file_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if st.st_size < LARGE_FILE_SIZE:
+            return None, st, None
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # The mapping stays valid after the file is closed
+    try:
+        encoding = detect_head_encoding(data[:SNIFF_SIZE])
+        if encoding not in ('utf-8', 'utf-8-sig'):
+            data.close()
+            return None, st, None
+        start = len(codecs.BOM_UTF8) if encoding == 'utf-8-sig' else 0
+        chars = _count_chars(data, start)
+        if chars is None:
+            data.close()
+            return None, st, None
+        digest = content_hash(data)
+        tracer.count('bytes mapped', len(data))
+    except BaseException:
+        data.close()
+        raise
+    return MappedText(file_path, data, start, chars), st, digest
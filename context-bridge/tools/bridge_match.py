@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Approximate block matching
+完全一致・空白無視の一致がどちらも見つからない SEARCH ブロックを、編集距離の
+近さで探す。ブロックあたりの CPU 時間に上限を設け、候補が一つに絞れないときは
+適用しない。
+
+The search works on stripped lines, like the whitespace-insensitive match:
+    1. Anchors: search lines that occur verbatim (and not too often) in the
+       file vote for the offset between the block and the file; unless half
+       of them agree on one offset, the rare words (three or more
+       characters) of the lines missing from the file vote too, so a block
+       whose every line was edited is still found.
+    2. Verification: around each of the best offsets, the lines matching
+       verbatim fix a window of whole lines; the runs of lines that differ
+       are compared with Myers' bit-parallel edit distance and the window
+       scores 1 - distance / longer length.
+    3. Decision: the best window at or above the similarity threshold wins,
+       unless another window that does not overlap it scores within
+       AMBIGUITY_MARGIN; then nothing is chosen.
+Anchoring is linear in the file (dictionary lookups and str.find), the
+rest only looks at MAX_CANDIDATES windows, and the CPU time of the calling
+thread is checked against the budget while comparing.
+"""
+
+import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from bridge_trace import tracer
+
+# Default similarity a window needs to replace a block (0 disables the search)
+MIN_SIMILARITY = 0.9
+
+# CPU seconds one block may spend in the approximate search
+BUDGET_SECONDS = 0.05
+
+# Shorter blocks (in stripped characters) are too easy to match by accident
+MIN_CHARS = 20
+
+# Lines or words occurring more often than this do not vote
+ANCHOR_LIMIT = 64
+
+# Offsets verified per block, best voted first
+MAX_CANDIDATES = 32
+
+# Windows scoring this close to the best one make the match ambiguous
+AMBIGUITY_MARGIN = 0.02
+
+# A window covering lines [first, end) of the file
+Match = namedtuple('Match', 'first end similarity')
+
+_WORD = re.compile(r'\w{3,}')
+
+
+class OutOfBudget(Exception):
+    """The approximate search used up its CPU budget before deciding."""
+
+
+class Ambiguous(Exception):
+    """Several windows match about equally well."""
+
+    def __init__(self, places: int):
+        super().__init__(f"{places} similar places")
+        self.places = places
+
+
+# ==============================================================================
+# Bit-parallel edit distance
+# ==============================================================================
+
+def _pattern_masks(pattern: str) -> dict:
+    masks = {}
+    bit = 1
+    for c in pattern:
+        masks[c] = masks.get(c, 0) | bit
+        bit <<= 1
+    return masks
+
+
+def _distance(a: str, b: str, deadline: float) -> int:
+    """Levenshtein distance of a and b by Myers' bit-parallel algorithm.
+
+    Raises OutOfBudget once time.thread_time() passes deadline.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    m = len(a)
+    if not m:
+        return len(b)
+    masks = _pattern_masks(a)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for j, c in enumerate(b):
+        eq = masks.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # Shifting a 1 in makes the first row 0, 1, 2, ...: the whole of b is matched
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+        if not j & 1023 and time.thread_time() > deadline:
+            raise OutOfBudget()
+    return score
+
+
+# ==============================================================================
+# Matcher
+# ==============================================================================
+
+class ApproxMatcher:
+    """Approximate search over a file's stripped lines.
+
+    lines are the stripped lines, index maps each of them to the line
+    numbers where it occurs (both as built by bridge_apply.Document).
+    """
+
+    def __init__(self, lines: list, index: dict):
+        self.lines = lines
+        self.index = index
+        self._text = None
+        self._starts = None
+
+    def _joined(self):
+        if self._text is None:
+            starts = [0] * len(self.lines)
+            pos = 0
+            for i, line in enumerate(self.lines):
+                starts[i] = pos
+                pos += len(line) + 1
+            self._text, self._starts = '\n'.join(self.lines), starts
+        return self._text, self._starts
+
+    def _votes(self, keys: list) -> dict:
+        """Offset (file line - block line) -> number of anchors agreeing on it."""
+        votes = {}
+        anchored = 0
+        missing = []
+        for i, key in enumerate(keys):
+            where = self.index.get(key, ()) if key else ()
+            if not where and key:
+                missing.append(i)
+            elif len(where) <= ANCHOR_LIMIT:
+                anchored += bool(where)
+                for pos in where:
+                    votes[pos - i] = votes.get(pos - i, 0) + 1
+        if votes and 2 * max(votes.values()) >= anchored:
+            return votes
+        # The lines that agree are too few: let the words of the edited lines vote too
+        block_lines = {}
+        for i in missing:
+            for word in set(_WORD.findall(keys[i])):
+                block_lines.setdefault(word, []).append(i)
+        if not block_lines:
+            return votes
+        text, starts = self._joined()
+        for word, where in block_lines.items():
+            lines = self._word_lines(text, starts, word)
+            if lines is None:
+                continue
+            for line in lines:
+                for i in where:
+                    votes[line - i] = votes.get(line - i, 0) + 1
+        return votes
+
+    @staticmethod
+    def _word_lines(text: str, starts: list, word: str):
+        """Lines where word occurs as a whole word, or None if more than ANCHOR_LIMIT times."""
+        lines = []
+        size = len(word)
+        pos = text.find(word)
+        while pos != -1:
+            before = text[pos - 1] if pos else ' '
+            after = text[pos + size] if pos + size < len(text) else ' '
+            if not (before.isalnum() or before == '_' or after.isalnum() or after == '_'):
+                if len(lines) == ANCHOR_LIMIT:
+                    return None
+                lines.append(bisect_right(starts, pos) - 1)
+            pos = text.find(word, pos + size)
+        return lines
+
+    def find(self, keys: list, similarity: float = MIN_SIMILARITY, budget: float = BUDGET_SECONDS,
+             free=None):
+        """The window of lines closest to the stripped block lines keys, or None.
+
+        free(first, end), if given, rejects windows that are not available.
+        Raises Ambiguous if several windows qualify about equally and
+        OutOfBudget if the budget ran out first.
+        """
+        pattern = '\n'.join(keys)
+        if similarity <= 0 or len(pattern.replace('\n', '')) < MIN_CHARS:
+            return None
+        deadline = time.thread_time() + budget
+        m, n = len(keys), len(self.lines)
+        slack = 2 + m // 10
+        votes = self._votes(keys)
+        chosen = []
+        for offset in sorted(votes, key=lambda d: (-votes[d], d)):
+            if len(chosen) >= MAX_CANDIDATES:
+                break
+            if all(abs(offset - d) > slack for d in chosen):
+                chosen.append(offset)
+
+        windows = {}
+        for offset in chosen:
+            lo, hi = max(0, offset - slack), min(n, offset + m + slack)
+            if lo >= hi:
+                continue
+            if time.thread_time() > deadline:
+                raise OutOfBudget()
+            window = self._window(keys, offset, lo, hi)
+            if window is None or window in windows:
+                continue
+            windows[window] = self._score(keys, pattern, *window, deadline)
+        tracer.count('approx windows', len(windows))
+
+        qualified = sorted(((score, first, end) for (first, end), score in windows.items()
+                            if score >= similarity and (free is None or free(first, end))),
+                           reverse=True)
+        if not qualified:
+            return None
+        score, first, end = qualified[0]
+        rivals = [(f, e) for s, f, e in qualified[1:]
+                  if s >= score - AMBIGUITY_MARGIN and (e <= first or f >= end)]
+        if rivals:
+            raise Ambiguous(len(rivals) + 1)
+        return Match(first, end, score)
+
+    def _window(self, keys: list, offset: int, lo: int, hi: int):
+        """Lines (first, end) of region [lo, hi) that line up with keys, or None.
+
+        Lines unique to both fix the window; the lines before the first and
+        after the last of them extend it. Without such a line, the window is
+        the block at the voted offset.
+        """
+        anchors = _anchors(keys, self.lines[lo:hi])
+        if not anchors:
+            first, end = max(lo, offset), min(hi, offset + len(keys))
+        else:
+            (head_i, head_j), (tail_i, tail_j) = anchors[0], anchors[-1]
+            first = lo + max(0, head_j - head_i)
+            end = lo + min(hi - lo, tail_j + len(keys) - tail_i)
+        return (first, end) if first < end else None
+
+    def _score(self, keys: list, pattern: str, first: int, end: int, deadline: float) -> float:
+        """Similarity of keys to lines [first, end): 1 - edit distance / longer length.
+
+        Lines are aligned first; only the runs between them are compared
+        character by character, so long blocks with a few edits stay cheap
+        (and the distance is at most a little above the true one).
+        """
+        window = self.lines[first:end]
+        distance = 0
+        for i1, i2, j1, j2 in _runs(keys, window):
+            old, new = '\n'.join(keys[i1:i2]), '\n'.join(window[j1:j2])
+            if i1 < i2 and j1 < j2:
+                distance += _distance(old, new, deadline)
+            else:
+                # A whole line goes with its line break
+                distance += len(old) + len(new) + (i2 - i1) + (j2 - j1)
+        size = max(len(pattern), sum(map(len, window)) + len(window) - 1, 1)
+        return 1 - distance / size
+
+
+# ==============================================================================
+# Line alignment
+# ==============================================================================
+
+def _anchors(a: list, b: list) -> list:
+    """(i, j) pairs of lines occurring once in a and once in b, the longest run in order of both."""
+    counts = {}
+    for line in a:
+        counts[line] = counts.get(line, 0) + 1
+    where = {}
+    for j, line in enumerate(b):
+        if counts.get(line) == 1:
+            where[line] = -1 if line in where else j
+    pairs = [(i, where[line]) for i, line in enumerate(a) if where.get(line, -1) >= 0]
+    # Longest increasing subsequence of j (patience sorting)
+    tails, tail_index, previous = [], [], [None] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        previous[k] = tail_index[pos - 1] if pos else None
+    out = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        out.append(pairs[k])
+        k = previous[k]
+    return out[::-1]
+
+
+def _runs(a: list, b: list) -> list:
+    """(i1, i2, j1, j2) runs where a[i1:i2] and b[j1:j2] differ, between aligned equal lines."""
+    runs = []
+    bounds = [(-1, -1)] + _anchors(a, b) + [(len(a), len(b))]
+    for (i0, j0), (i3, j3) in zip(bounds, bounds[1:]):
+        i1, j1, i2, j2 = i0 + 1, j0 + 1, i3, j3
+        while i1 < i2 and j1 < j2 and a[i1] == b[j1]:
+            i1 += 1
+            j1 += 1
+        while i1 < i2 and j1 < j2 and a[i2 - 1] == b[j2 - 1]:
+            i2 -= 1
+            j2 -= 1
+        if i1 < i2 or j1 < j2:
+            runs.append((i1, i2, j1, j2))
+    return runs
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Multi-part export
+1回の貼り付けに収まらない大きなプロンプトを、<file> 単位（大きなファイルは
+行単位）で番号付きの複数パートに分割する。
+
+plan_parts() makes one streaming pass over (rel, content) documents and
+records only where each part starts and ends, so the part count is known
+for every header. PartPlan.render() later builds one part at a time from
+the contents of just the files in that part; nothing else is kept.
+Sizes are measured with any measure(text) -> int: len for characters, or a
+token counter's count for tokens.
+"""
+
+from collections import namedtuple
+
+PART_HEADER = "=== Context Bridge: パート {index}/{count} / Part {index} of {count} ===\n"
+PART_MANIFEST = "このパートのファイル / Files in this part:\n"
+PART_WAIT = ("\n\n=== パート {index}/{count} ここまで。すべてのパートを受け取るまで「OK」とだけ返答してください。"
+             " / End of part {index} of {count}: reply only \"OK\" until all parts have arrived. ===\n")
+
+# A part is not started on with less room than this fraction of a whole part
+MIN_ROOM_FRACTION = 0.125
+
+# One piece of a file in a part; lines are 1-based and inclusive, split is
+# (piece, pieces) for files spread over several parts, else None
+Segment = namedtuple('Segment', 'file rel start end first_line last_line split')
+
+
+def _open_tag(rel: str, split=None, lines=None) -> str:
+    if split is None:
+        return f'<file path="{rel}">\n'
+    return f'<file path="{rel}" part="{split[0]}/{split[1]}" lines="{lines[0]}-{lines[1]}">\n'
+
+
+def _manifest_line(rel: str, split=None, lines=None) -> str:
+    if split is None:
+        return f'- {rel}\n'
+    return f'- {rel} (lines {lines[0]}-{lines[1]}, {split[0]}/{split[1]})\n'
+
+
+class PartPlan:
+    """Where every part starts and ends; see plan_parts()."""
+
+    def __init__(self, limit: int, prefix: str = '', suffix: str = ''):
+        self.limit = limit
+        self.prefix = prefix
+        self.suffix = suffix
+        self.parts = [[]]
+
+    @property
+    def count(self) -> int:
+        return len(self.parts)
+
+    def files_of(self, index: int) -> list:
+        """File numbers (positions in the planned documents) used by part index."""
+        return sorted({seg.file for seg in self.parts[index]})
+
+    def render(self, index: int, contents: dict) -> str:
+        """Build part index (0-based) from {file number: content} of its files."""
+        count = self.count
+        out = [PART_HEADER.format(index=index + 1, count=count)]
+        if index == 0 and self.prefix:
+            out.append(self.prefix)
+        segments = self.parts[index]
+        if segments:
+            out.append(PART_MANIFEST)
+            for seg in segments:
+                out.append(_manifest_line(seg.rel, seg.split, (seg.first_line, seg.last_line)))
+            out.append('\n')
+        for i, seg in enumerate(segments):
+            if i:
+                out.append('\n\n')
+            out.append(_open_tag(seg.rel, seg.split, (seg.first_line, seg.last_line)))
+            out.append(contents[seg.file][seg.start:seg.end])
+            out.append('\n</file>')
+        if index == count - 1:
+            out.append(self.suffix)
+        else:
+            out.append(PART_WAIT.format(index=index + 1, count=count))
+        return ''.join(out)
+
+    def iter_parts(self, read):
+        """Yield every part's text lazily; read(file numbers) yields their contents in order."""
+        for index in range(self.count):
+            files = self.files_of(index)
+            yield self.render(index, dict(zip(files, read(files))))
+
+
+def _fit(text: str, start: int, room: int, cost, ratio: float, hard: bool) -> int:
+    """Largest end at a line boundary with cost(start, end) <= room.
+
+    The first guess comes from the document's cost per character and is
+    shrunk proportionally until it fits, so only a few measurements are
+    made. Returns start when not even one line fits, unless hard is set
+    (an empty part), in which case an over-long line is cut anywhere.
+    """
+    total = len(text)
+    span = max(1, int(room / ratio))
+    for _ in range(12):
+        end = min(total, start + span)
+        if end < total:
+            cut = text.rfind('\n', start, end)
+            if cut >= start:
+                end = cut + 1
+            elif not hard:
+                return start
+        used = cost(start, end)
+        if used <= room:
+            return end
+        span = max(1, int((end - start) * room / used * 0.9))
+    return start
+
+
+def plan_parts(documents, limit: int, measure=len, prefix: str = '', suffix: str = '') -> PartPlan:
+    """Lay out documents ((rel, content) pairs, in order) into parts of at most limit.
+
+    Files that fit into a part are never split; larger ones are cut at line
+    boundaries. prefix opens the first part (system prompt) and suffix
+    closes the last one (instruction). Raises ValueError when the limit
+    cannot even hold the fixed text of a part.
+    """
+    plan = PartPlan(limit, prefix, suffix)
+    overhead = (measure(PART_HEADER.format(index=999, count=999)) + measure(PART_MANIFEST) +
+                measure(PART_WAIT.format(index=999, count=999)) + 2)
+    room = limit - overhead
+    if room <= 0 or measure(prefix) >= room:
+        raise ValueError(f"Part limit {limit} is too small")
+    wait = measure(PART_WAIT.format(index=999, count=999))
+    min_room = max(1, int(room * MIN_ROOM_FRACTION))
+    left = room - measure(prefix)
+
+    def new_part():
+        plan.parts.append([])
+        return room
+
+    for number, (rel, content) in enumerate(documents):
+        close = measure('\n</file>\n\n')
+
+        def cost(start, end, lines=(99999, 99999)):
+            split = None if start == 0 and end == len(content) else (99, 99)
+            return (measure(_open_tag(rel, split, lines)) + measure(content[start:end]) + close +
+                    measure(_manifest_line(rel, split, lines)))
+
+        whole = cost(0, len(content))
+        if whole > left and whole <= room:
+            left = new_part()
+        if whole <= left:
+            lines = content.count('\n') + 1
+            plan.parts[-1].append(Segment(number, rel, 0, len(content), 1, lines, None))
+            left -= whole
+            continue
+
+        # Larger than a whole part: spread over several parts at line boundaries
+        ratio = max(whole / max(1, len(content)), 1e-3)
+        pieces = []
+        start, line = 0, 1
+        while start < len(content):
+            if left < min_room:
+                left = new_part()
+            end = _fit(content, start, left, cost, ratio, hard=not plan.parts[-1])
+            if end == start:
+                if not plan.parts[-1]:
+                    raise ValueError(f"Part limit {limit} is too small for {rel}")
+                left = new_part()
+                continue
+            last = line + content.count('\n', start, end - 1)
+            seg = Segment(number, rel, start, end, line, last, None)
+            plan.parts[-1].append(seg)
+            pieces.append((len(plan.parts) - 1, len(plan.parts[-1]) - 1))
+            left -= cost(start, end)
+            line = last + (content[end - 1] == '\n')
+            start = end
+        for i, (p, s) in enumerate(pieces):
+            plan.parts[p][s] = plan.parts[p][s]._replace(split=(i + 1, len(pieces)))
+
+    # The last part ends with suffix instead of the wait notice
+    if measure(suffix) > left + wait:
+        new_part()
+    return plan
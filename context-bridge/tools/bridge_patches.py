@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - SEARCH/REPLACE parser
+AIの応答から <<<< SEARCH ... ==== ... >>>> ブロックを取り出す、行単位の
+状態機械パーサー。入力を少しずつ受け取り、ブロックが閉じるたびに返す。
+
+Block format (one marker per line; CRLF is accepted):
+
+    <<<< SEARCH path/to/file.ext
+    existing lines (none for a new file)
+    ====
+    replacement lines (none to delete the file)
+    >>>>
+
+Markdown fences around a block, or directly inside it (after the header
+and before the closing marker), are ignored, as are backticks or quotes
+around the path. Malformed blocks are reported as ParseIssue(line,
+message) instead of being skipped silently. Runs in linear time: every
+line is looked at once.
+"""
+
+import re
+from collections import namedtuple
+
+# A problem found in the input; line is 1-based
+ParseIssue = namedtuple('ParseIssue', 'line message')
+
+_HEADER = re.compile(r'\s*<{4,}\s*SEARCH(?:\s+(.*))?$')
+_FENCE = re.compile(r'\s*(?:```|~~~)')
+_BARE_FENCE = re.compile(r'\s*(?:```|~~~)\s*$')
+
+_OUTSIDE, _SEARCH, _REPLACE = range(3)
+_MARKERS = ('====', '>>>>')
+
+
+def _clean_path(path: str) -> str:
+    path = path.strip()
+    if len(path) >= 2 and path[0] == path[-1] and path[0] in '`"\'':
+        path = path[1:-1].strip()
+    return path
+
+
+class PatchParser:
+    """Incremental parser: feed() text chunks, then close().
+
+    feed() and close() return the patches completed by that call, as dicts
+    with 'file', 'search', 'replace' and 'line' (line number of the header).
+    Problems are collected in ``issues``.
+    """
+
+    def __init__(self):
+        self.issues = []
+        self.line_no = 0
+        self._partial = ''
+        self._state = _OUTSIDE
+        self._file = None
+        self._start = 0
+        self._fence = None
+        self._search = []
+        self._replace = []
+        self._body = None  # the list being filled, None outside a block
+
+    def feed(self, text: str) -> list:
+        if not text:
+            return []
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        out = []
+        for line in lines:
+            body = self._body
+            if '<<<<' in line:
+                self._line(line, out)
+            elif body is None:
+                self.line_no += 1
+            elif body and line[:4] not in _MARKERS:
+                # Fast path: an ordinary line inside a block
+                self.line_no += 1
+                body.append(line[:-1] if line.endswith('\r') else line)
+            else:
+                self._line(line, out)
+        return out
+
+    def close(self) -> list:
+        out = []
+        if self._partial:
+            self._line(self._partial, out)
+            self._partial = ''
+        if self._state != _OUTSIDE:
+            missing = '====' if self._state == _SEARCH else '>>>>'
+            self._issue(self._start, f"block for {self._file} is not closed (missing {missing} before end of input)")
+            self._close()
+        return out
+
+    def _issue(self, line: int, message: str):
+        self.issues.append(ParseIssue(line, message))
+
+    def _open(self, match) -> bool:
+        path = _clean_path(match.group(1) or '')
+        if not path:
+            self._issue(self.line_no, "SEARCH marker without a file path")
+            self._close()
+            return False
+        self._state = _SEARCH
+        self._file = path
+        self._start = self.line_no
+        self._fence = None
+        self._search = []
+        self._replace = []
+        self._body = self._search
+        return True
+
+    def _close(self):
+        self._state = _OUTSIDE
+        self._body = None
+
+    def _line(self, line: str, out: list):
+        self.line_no += 1
+        if line.endswith('\r'):
+            line = line[:-1]
+        state = self._state
+
+        if '<<<<' in line:
+            match = _HEADER.match(line)
+            if match is not None:
+                if state != _OUTSIDE:
+                    self._issue(self._start, f"block for {self._file} is not closed "
+                                             f"before the next SEARCH marker on line {self.line_no}")
+                self._open(match)
+                return
+
+        if state == _OUTSIDE:
+            return
+
+        if state == _SEARCH:
+            if line.rstrip() == '====':
+                self._unwrap(self._search)
+                self._state = _REPLACE
+                self._body = self._replace
+            elif line.startswith('>>>>'):
+                self._issue(self._start, f"block for {self._file} has no ==== separator")
+                self._close()
+            elif not self._search and self._fence is None and _FENCE.match(line):
+                self._fence = line  # maybe a fence around the body; see _unwrap()
+            else:
+                self._search.append(line)
+            return
+
+        # _REPLACE
+        if line.startswith('>>>>'):
+            self._unwrap(self._replace)
+            out.append({
+                'file': self._file,
+                'search': '\n'.join(self._search),
+                'replace': '\n'.join(self._replace),
+                'line': self._start,
+            })
+            self._close()
+        elif not self._replace and self._fence and _FENCE.match(line):
+            pass  # the replacement's own opening fence
+        else:
+            self._replace.append(line)
+
+    def _unwrap(self, body: list):
+        """Drop the closing fence of a fenced body, or keep a first line that only looked like a fence."""
+        if not self._fence:
+            return
+        if body and _BARE_FENCE.match(body[-1]):
+            body.pop()
+        elif body is self._search:
+            body.insert(0, self._fence)
+            self._fence = ''
+
+
+def iter_patches(chunks, issues: list = None):
+    """Yield patches from an iterable of text chunks (a str, a file, a pipe...)."""
+    parser = PatchParser()
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    try:
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+    finally:
+        if issues is not None:
+            issues.extend(parser.issues)
+
+
+def read_chunks(stream, size: int = 1 << 16):
+    """Read a text stream in fixed-size chunks."""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Context reduction
+プロンプトに入れるファイル内容から、同一ファイルの重複・共通のライセンス
+ヘッダー・行末の空白や連続する空行を取り除き、巨大なデータファイルは先頭だけを
+送る。削った文字数とトークン数を報告する。
+
+Reductions, in the order they apply to one file:
+    same-as      - a file identical (by content hash) to one already in
+                   the prompt is sent as <file path="b" same-as="a" />
+    header-as    - a leading comment block (license, copyright) that an
+                   earlier file started with is left out and the file is
+                   tagged <file path="b" header-as="a">
+    whitespace   - trailing spaces and tabs are removed, runs of blank
+                   lines are cut to MAX_BLANK_LINES, and so is the end of
+                   the file
+    truncation   - data files (JSON, CSV, lock files, ...) longer than
+                   DATA_LIMIT characters are cut after the last whole line
+                   that fits, followed by a marker line
+Removing trailing whitespace keeps SEARCH blocks quoted from the prompt
+applicable (they are matched ignoring it); blank line runs and cut data are
+left to the approximate match, so these are opt-in. What a file reduces
+to depends only on its content and whether it is a data file; it is kept
+in an LRU cache by content hash, so a repeated Copy only decides which
+headers and files were already sent.
+"""
+
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from bridge_mapped import MappedText
+
+# Blank lines kept in a row
+MAX_BLANK_LINES = 2
+
+# A leading comment block is only folded with at least this many lines and characters
+HEADER_MIN_LINES = 3
+HEADER_MIN_CHARS = 120
+
+# Characters of a data file that are sent
+DATA_LIMIT = 16 * 1024
+
+# Default cap on the cached reductions (characters)
+REDUCE_CACHE_SIZE = 32 << 20
+
+DATA_EXTENSIONS = {
+    '.json', '.jsonl', '.ndjson', '.geojson', '.csv', '.tsv', '.lock', '.log', '.map', '.svg',
+    '.xml', '.yaml', '.yml', '.sql', '.dat', '.snap',
+}
+LOCK_FILES = {
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'composer.lock',
+    'Gemfile.lock', 'Cargo.lock', 'poetry.lock', 'Pipfile.lock', 'go.sum', 'uv.lock',
+}
+
+# Explains the attributes and markers to the AI, once, before the first reduced file
+REDUCE_NOTE = ('<!-- Reduced context: same-as="X" = identical to file X; header-as="X" = starts with '
+               'the same comment header as file X (omitted here); "[... N more lines (M characters) omitted ...]" = '
+               'the rest of a data file was cut. Trailing whitespace and extra blank lines were removed. -->')
+
+_TRAILING = re.compile(r'[ \t]+(?=\r?$)', re.MULTILINE)
+_BLANKS = re.compile(r'(\r?\n)(?:\r?\n){%d,}' % (MAX_BLANK_LINES + 1))
+_PREAMBLE = re.compile(r'#!|#.*coding[:=]|<\?xml')
+_COMMENT = re.compile(r'[ \t]*(?:#(?:[ \t#]|$)|//|--(?:[ \t]|$))')
+
+# One file, reduced: prefix (shebang / coding lines) + header + body is the
+# whole file; truncated is the number of lines cut from a data file (0: none)
+Reduced = namedtuple('Reduced', 'prefix header body truncated')
+
+
+# ==============================================================================
+# Per-file reduction
+# ==============================================================================
+
+def is_data_file(rel: str) -> bool:
+    """Whether rel is a data or lock file, which is cut after DATA_LIMIT characters."""
+    name = rel.rpartition('/')[2]
+    if name in LOCK_FILES:
+        return True
+    return '.' in name and name[name.rfind('.'):].lower() in DATA_EXTENSIONS
+
+
+def _wrapper(rel: str, attrs: str) -> str:
+    """The XML wrapper around one file's content (file_wrapper() with attributes)."""
+    return f'<file path="{rel}"{attrs}>\n\n</file>\n\n'
+
+
+def normalize_whitespace(text: str) -> str:
+    """Drop trailing spaces/tabs and cut blank line runs to MAX_BLANK_LINES (and at the end)."""
+    text = _TRAILING.sub('', text)
+    text = _BLANKS.sub(lambda m: m.group(1) * (MAX_BLANK_LINES + 1), text)
+    return text.rstrip('\r\n')
+
+
+def split_header(text: str) -> tuple:
+    """(prefix, header, body) of text: header is its leading comment block, '' if too short.
+
+    prefix holds a shebang, coding or XML declaration line kept in front.
+    Block comments (/* */, <!-- -->) and line comments (#, //, --) count.
+    """
+    lines = text.splitlines(True)
+    i = 0
+    while i < len(lines) and i < 2 and _PREAMBLE.match(lines[i]):
+        i += 1
+    start = i
+    closing = None
+    last = None  # end of the last comment line
+    counted = 0
+    while i < len(lines):
+        stripped = lines[i].strip()
+        if closing is not None:
+            if closing in stripped:
+                closing = None
+        elif not stripped:
+            i += 1
+            continue
+        elif stripped.startswith('/*'):
+            closing = None if '*/' in stripped[2:] else '*/'
+        elif stripped.startswith('<!--'):
+            closing = None if '-->' in stripped[4:] else '-->'
+        elif not _COMMENT.match(lines[i]):
+            break
+        i += 1
+        last = i
+        counted += 1
+    if closing is not None or last is None:
+        return '', '', text
+    prefix = ''.join(lines[:start])
+    header = ''.join(lines[start:last])
+    if counted < HEADER_MIN_LINES or len(header.strip()) < HEADER_MIN_CHARS:
+        return '', '', text
+    return prefix, header, ''.join(lines[last:])
+
+
+def _cut(pieces, limit: int) -> tuple:
+    """(head, characters after it, lines after it) of the text in pieces.
+
+    head is at most limit characters, cut at its last line break if it has one.
+    """
+    head = []
+    size = chars = lines = 0
+    last = '\n'
+    for piece in pieces:
+        if size < limit:
+            take = piece[:limit - size]
+            head.append(take)
+            size += len(take)
+            piece = piece[len(take):]
+        if piece:
+            chars += len(piece)
+            lines += piece.count('\n')
+            last = piece[-1]
+    text = ''.join(head)
+    if not chars:
+        return text, 0, 0
+    cut = text.rfind('\n')
+    if cut > 0:
+        chars += len(text) - cut - 1
+        text = text[:cut]
+    return text, chars, lines + (last != '\n')
+
+
+def reduce_file(rel: str, content) -> Reduced:
+    """Reduce the text of one file (a str or a MappedText) on its own (None: send it as it is)."""
+    if is_data_file(rel):
+        if len(content) > DATA_LIMIT:
+            pieces = content.chunks() if isinstance(content, MappedText) else (content,)
+            head, chars, lines = _cut(pieces, DATA_LIMIT)
+            if chars:
+                more = f'{lines:,} more line' + ('s' if lines != 1 else '')
+                body = normalize_whitespace(head) + f'\n[... {more} ({chars:,} characters) omitted ...]'
+                return Reduced('', '', body, lines)
+        if isinstance(content, MappedText):
+            return None
+        return Reduced('', '', normalize_whitespace(content), 0)
+    if isinstance(content, MappedText):
+        return None  # streamed as it is
+    prefix, header, body = split_header(content)
+    if header:
+        header = normalize_whitespace(header) + '\n'
+        body = normalize_whitespace(body.lstrip('\r\n'))
+        return Reduced(prefix, header, body, 0)
+    return Reduced('', '', normalize_whitespace(content), 0)
+
+
+class ReduceCache:
+    """LRU map of (content hash, data file) -> Reduced, plus token counts of the reduced texts."""
+
+    def __init__(self, limit: int = REDUCE_CACHE_SIZE):
+        self.limit = limit
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, reduced: Reduced) -> dict:
+        """Store reduced; returns the dict its token counts are kept in."""
+        item = (reduced, {})
+        size = _size(reduced)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= _size(old[0])
+            if size > self.limit:
+                return item[1]
+            self._items[key] = item
+            self.size += size
+            while self.size > self.limit:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.size -= _size(evicted)
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+def _size(reduced: Reduced) -> int:
+    return len(reduced.prefix) + len(reduced.header) + len(reduced.body)
+
+
+# Reductions shared by every project
+reduce_cache = ReduceCache()
+
+
+# ==============================================================================
+# One prompt
+# ==============================================================================
+
+class Reducer:
+    """The reduction of one prompt: which files and headers were sent, and what was saved.
+
+    With a token counter, tokens_saved is counted too (the reduced texts
+    are counted once per content hash).
+    """
+
+    def __init__(self, counter=None, cache: ReduceCache = None):
+        self.counter = counter
+        self.cache = cache if cache is not None else reduce_cache
+        self.sent = {}  # content hash -> rel sent in full
+        self.headers = {}  # header -> rel that sent it
+        self.files = 0
+        self.duplicates = []
+        self.folded = []
+        self.truncated = []
+        self.chars_before = 0
+        self.chars_after = 0
+        self.tokens_saved = 0
+        self._explained = False
+
+    def _reduced(self, rel: str, content, digest):
+        if digest is None:
+            return reduce_file(rel, content), None
+        key = (digest, is_data_file(rel))
+        item = self.cache.get(key)
+        if item is not None:
+            return item
+        reduced = reduce_file(rel, content)
+        if reduced is None:
+            return None, None
+        return reduced, self.cache.put(key, reduced)
+
+    def _tokens(self, counts, key, text: str) -> int:
+        n = counts.get(key) if counts is not None else None
+        if n is None:
+            n = self.counter.count(text)
+            if counts is not None:
+                counts[key] = n
+        return n
+
+    def _saved(self, rel: str, content, tokens, counts, key, attrs: str, text) -> int:
+        """Tokens of the file as it is (tokens, if known) minus tokens of what is sent instead."""
+        counter = self.counter
+        if tokens is None:
+            tokens = counter.count(str(content)) + counter.count(_wrapper(rel, ''))
+        if text is None:
+            return tokens - counter.count(f'<file path="{rel}"{attrs} />\n\n')
+        return tokens - self._tokens(counts, key, text) - counter.count(_wrapper(rel, attrs))
+
+    def reduce(self, rel: str, content, digest, tokens: int = None) -> tuple:
+        """(note, attributes for the file tag, text to send) for one file, in prompt order.
+
+        text is None for a duplicate (an empty <file ... /> tag), content
+        itself when nothing applies. note is REDUCE_NOTE for the first file
+        with an attribute or a cut, '' otherwise. tokens is the file's count
+        with its XML wrapper, if known.
+        """
+        self.files += 1
+        before = len(content)
+        self.chars_before += before
+        first = self.sent.get(digest) if digest is not None else None
+        if first is not None:
+            self.duplicates.append(rel)
+            attrs = f' same-as="{first}"'
+            if self.counter is not None:
+                self.tokens_saved += self._saved(rel, content, tokens, None, None, attrs, None)
+            return self._note(True), attrs, None
+        if digest is not None:
+            self.sent[digest] = rel
+        reduced, counts = self._reduced(rel, content, digest)
+        if reduced is None:
+            self.chars_after += before
+            return '', '', content
+        attrs = ''
+        text = reduced.prefix + reduced.header + reduced.body
+        if reduced.header:
+            owner = self.headers.get(reduced.header)
+            if owner is None:
+                self.headers[reduced.header] = rel
+            else:
+                attrs = f' header-as="{owner}"'
+                text = reduced.prefix + reduced.body
+                self.folded.append(rel)
+        if reduced.truncated:
+            self.truncated.append(rel)
+        self.chars_after += len(text)
+        if self.counter is not None and len(text) < before:
+            key = (bool(attrs), self.counter.name)
+            self.tokens_saved += self._saved(rel, content, tokens, counts, key, attrs, text)
+        return self._note(bool(attrs or reduced.truncated)), attrs, text
+
+    def _note(self, needed: bool) -> str:
+        if not needed or self._explained:
+            return ''
+        self._explained = True
+        return REDUCE_NOTE
+
+    def report(self) -> dict:
+        """A JSON-friendly summary of what was saved."""
+        return {
+            'files': self.files,
+            'chars_before': self.chars_before,
+            'chars_after': self.chars_after,
+            'chars_saved': self.chars_before - self.chars_after,
+            'tokens_saved': self.tokens_saved if self.counter is not None else None,
+            'duplicates': list(self.duplicates),
+            'headers': list(self.folded),
+            'truncated': list(self.truncated),
+        }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Project scanning
+os.scandir ベースのディレクトリ走査。除外対象のディレクトリには降りずに
+枝刈りし、DirEntry が持つ種別・stat 情報をそのまま後段に渡す。
+"""
+
+import os
+import mmap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bridge_encoding import detect_encoding
+from bridge_trace import tracer
+
+# Bytes read to decide whether a file is text (whole pages, also for mapped files)
+SNIFF_SIZE = max(8192, mmap.PAGESIZE)
+
+# File I/O is latency-bound (network shares, WSL bridges), not CPU-bound
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+class ScanLimitExceeded(Exception):
+    """Raised when a scan hits its file-count or depth limit.
+
+    ``files`` holds the partial result collected before the limit was hit.
+    """
+
+    def __init__(self, message: str, files: list = None):
+        super().__init__(message)
+        self.files = files if files is not None else []
+
+
+class ProjectWalker:
+    """Depth-first os.scandir walk that prunes ignored directories.
+
+    is_ignored(rel, name, is_dir) decides both whether a file is yielded and
+    whether a directory is descended into; rel is project-relative with '/'
+    separators. Iterating yields (rel, os.DirEntry) for every kept file.
+    Symlinked directories are not followed, which also rules out cycles.
+
+    When max_depth or max_files is reached the walk stops descending (or
+    stops entirely) and ``truncated`` describes which limit was hit.
+    start limits the walk to one project-relative subdirectory, which the
+    caller has already checked.
+    """
+
+    def __init__(self, project_root: Path, is_ignored, max_depth: int = None, max_files: int = None,
+                 start: str = ''):
+        self.project_root = Path(project_root)
+        self.start = start
+        self.is_ignored = is_ignored
+        self.max_depth = max_depth
+        self.max_files = max_files
+        self.truncated = None
+        self.dirs_scanned = 0
+        self.dirs_pruned = 0
+
+    def __iter__(self):
+        count = 0
+        start_dir = os.path.join(str(self.project_root), self.start) if self.start else str(self.project_root)
+        stack = [(self.start, start_dir, self.start.count('/') + 1 if self.start else 0)]
+        while stack:
+            rel_dir, abs_dir, depth = stack.pop()
+            try:
+                it = os.scandir(abs_dir)
+            except OSError:
+                continue
+            self.dirs_scanned += 1
+            subdirs = []
+            with it:
+                for entry in it:
+                    name = entry.name
+                    rel = rel_dir + '/' + name if rel_dir else name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if self.is_ignored(rel, name, True):
+                            self.dirs_pruned += 1
+                            continue
+                        if self.max_depth is not None and depth >= self.max_depth:
+                            self.truncated = f"max depth {self.max_depth} reached at {rel}"
+                            continue
+                        subdirs.append((rel, entry.path, depth + 1))
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if self.is_ignored(rel, name, False):
+                        continue
+                    if self.max_files is not None and count >= self.max_files:
+                        self.truncated = f"max file count {self.max_files} reached"
+                        return
+                    count += 1
+                    yield rel, entry
+            # Reverse so directories are visited in scandir order
+            stack.extend(reversed(subdirs))
+
+
+# ==============================================================================
+# Classification / reading pool
+# ==============================================================================
+
+def detect_head_encoding(chunk: bytes):
+    """Return the encoding of the leading bytes of a file, or None if binary (see bridge_encoding)."""
+    return detect_encoding(chunk, final=False)
+
+
+def looks_like_text(chunk: bytes) -> bool:
+    """Check if the leading bytes of a file look like text."""
+    return detect_head_encoding(chunk) is not None
+
+
+def sniff_file(file_path):
+    """Return the head encoding of a file from its first SNIFF_SIZE bytes (None if binary)."""
+    with open(file_path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+    tracer.count('bytes read', len(head))
+    return detect_head_encoding(head)
+
+
+def read_file_bytes(file_path, sniff: bool = True) -> tuple:
+    """Open a file once and return (is_text, data).
+
+    With sniff=True the first SNIFF_SIZE bytes are classified first; binary
+    files stop there (data is just the head), text files continue reading
+    and the sniffed head is reused as the start of the content.
+    Raises OSError if the file cannot be read.
+    """
+    return read_file_stat(file_path, sniff)[:2]
+
+
+def read_file_stat(file_path, sniff: bool = True) -> tuple:
+    """read_file_bytes() that also returns the fstat of the open file: (is_text, data, st)."""
+    is_text, data, st = _read_file_stat(file_path, sniff)
+    tracer.count('bytes read', len(data))
+    return is_text, data, st
+
+
+def _read_file_stat(file_path, sniff: bool) -> tuple:
+    with open(file_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if not sniff:
+            return True, f.read(), st
+        head = f.read(SNIFF_SIZE)
+        if not looks_like_text(head):
+            return False, head, st
+        if len(head) < SNIFF_SIZE:
+            return True, head, st
+        return True, head + f.read(), st
+
+
+def ordered_map(func, items, workers: int = IO_WORKERS, window: int = None):
+    """Yield func(item) for each item, running up to `workers` calls at once.
+
+    Results come back in input order regardless of completion order, so
+    callers stay deterministic. At most `window` calls are in flight, which
+    bounds memory when func returns file contents; items may be a lazy
+    iterator (e.g. a ProjectWalker) that is consumed while workers run.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    if window is None:
+        window = workers * 4
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
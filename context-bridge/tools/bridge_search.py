@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Relevance search
+プロジェクトのファイルを識別子・パス・本文の単語で索引し、指示文（日本語可）に
+関連するファイルを BM25 で順位付けして、上位のファイルとそれらが import
+しているファイルを選択候補にする。索引はファイルが変わった分だけ更新する。
+
+Terms:
+    identifiers  - lower-cased, plus their camelCase / snake_case parts
+                   (getUserName -> getusername, get, user, name)
+    CJK          - kanji and katakana runs as character bigrams (single
+                   characters as they are); hiragana (particles, okurigana)
+                   is skipped, so Japanese needs no dictionary
+    paths        - the terms of a file's path count PATH_BOOST times
+Files are numbered as they are added. A posting packs a file number and
+the term frequency (up to 255) into one integer; a term found in one
+file keeps that integer, others an array of them. A changed file gets a
+new number and the old one is marked dead, so updates never touch other
+files' postings; the postings are compacted once dead numbers pile up.
+Until then a query leaves dead postings out of a term's document
+frequency, so churn does not skew the IDF. A query walks the postings
+of its rarest terms first and stops before QUERY_POSTINGS, so common
+words cannot make it slow.
+
+The term counts of every file are kept in a SQLite file next to the scan
+cache (see bridge_cache.project_cache_path) and reloaded on the next run,
+so only files whose stat signature changed are read and tokenised again.
+Like the scan cache, an index that cannot be read or written is simply
+rebuilt.
+"""
+
+import re
+import json
+import math
+import heapq
+import sqlite3
+import posixpath
+from array import array
+from collections import Counter, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+from bridge_budget import mentioned_in, mentioned_names
+from bridge_cache import project_cache_path
+from bridge_trace import tracer
+
+# Bumped when the terms of a file change meaning (tokeniser changes)
+SCHEMA_VERSION = '1'
+
+# Characters of a file that are tokenised
+INDEX_CHARS = 1 << 18
+
+# Times a path term counts compared to a term in the text
+PATH_BOOST = 3
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Postings a query walks at most (rarest terms first)
+QUERY_POSTINGS = 80000
+
+# Dead file numbers tolerated before the postings are compacted
+COMPACT_MIN_DEAD = 1024
+
+_TERM = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[㐀-䶿一-鿿豈-﫿々]+'
+                   r'|[ァ-ヺーｦ-ﾟ]+')
+_PART = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+')
+
+# Too common in code and instructions to tell files apart
+STOP_WORDS = frozenset('''
+    a an and are as at be by do for from if in into is it of on or not the to with this that
+    def class return import self cls none true false null undefined var let const function new
+    else elif while try except finally end then public private static void int str string
+    please file files code change fix add make use
+'''.split())
+
+# Import statements: Python, JS/TS/CSS, C/C++
+_PY_IMPORT = re.compile(r'^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import|import[ \t]+([\w.]+))', re.MULTILINE)
+_JS_IMPORT = re.compile(r'''(?:\bfrom|\bimport|\brequire)\s*\(?\s*['"]([^'"\n]+)['"]''')
+_INCLUDE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"([^"\n]+)"', re.MULTILINE)
+
+_PY_EXTENSIONS = ('.py', '.pyi')
+_JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs', '.vue', '.svelte', '.css', '.scss', '.less')
+_C_EXTENSIONS = ('.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.hh', '.m', '.mm')
+
+# Result of preselect(): project-relative paths, disjoint
+Preselection = namedtuple('Preselection', 'mentioned ranked imported')
+
+
+# ==============================================================================
+# Terms
+# ==============================================================================
+
+@lru_cache(maxsize=1 << 16)
+def _word_terms(word: str) -> tuple:
+    if not word[0].isascii():
+        return (word,) if len(word) == 1 else tuple(word[i:i + 2] for i in range(len(word) - 1))
+    lower = word.lower()
+    terms = [lower] if len(lower) > 1 and lower not in STOP_WORDS else []
+    for part in _PART.findall(word):
+        part = part.lower()
+        if part != lower and len(part) > 1 and part not in STOP_WORDS:
+            terms.append(part)
+    return tuple(terms)
+
+
+def tokenize(text: str) -> list:
+    """The search terms of text, in order and with repeats."""
+    terms = []
+    for word in _TERM.findall(text):
+        terms.extend(_word_terms(word))
+    return terms
+
+
+def count_terms(text: str) -> Counter:
+    """Term -> occurrences in text (tokenize() counted, splitting each distinct word once)."""
+    counts = Counter()
+    for word, n in Counter(_TERM.findall(text)).items():
+        for term in _word_terms(word):
+            counts[term] += n
+    return counts
+
+
+def path_terms(rel: str) -> list:
+    """Terms of a project-relative path (folders and file name without extension)."""
+    head, dot, ext = rel.rpartition('.')
+    return tokenize(head if dot and '/' not in ext else rel)
+
+
+def find_imports(rel: str, text: str) -> tuple:
+    """Module names / paths that rel imports, as written (resolved later by resolve_import)."""
+    ext = rel[rel.rfind('.'):].lower() if '.' in rel.rpartition('/')[2] else ''
+    if ext in _PY_EXTENSIONS:
+        return tuple(a or b for a, b in _PY_IMPORT.findall(text))
+    if ext in _JS_EXTENSIONS:
+        return tuple(_JS_IMPORT.findall(text))
+    if ext in _C_EXTENSIONS:
+        return tuple(_INCLUDE.findall(text))
+    return ()
+
+
+def _stem(path: str) -> str:
+    """File name of path without its extension."""
+    name = path.rpartition('/')[2]
+    return name.rpartition('.')[0] or name
+
+
+def _each(entry):
+    """The postings of a postings entry (one int or an array)."""
+    return (entry,) if type(entry) is int else entry
+
+
+def _encode_terms(counts: Counter) -> str:
+    return ' '.join(f'{term}:{n}' for term, n in counts.items())
+
+
+def _decode_terms(data: str):
+    for item in data.split(' '):
+        if item:
+            term, _, n = item.rpartition(':')
+            yield term, int(n)
+
+
+# ==============================================================================
+# Index
+# ==============================================================================
+
+class SearchIndex:
+    """BM25 index of a project's text files, updated per file.
+
+    Only the thread holding the owner's lock may use it (like ScanCache).
+    With persist=False nothing is read from or written to disk.
+    """
+
+    def __init__(self, project_root: Path, cache_dir: Path = None, persist: bool = True):
+        self.project_root = Path(project_root).resolve()
+        self.db_path = project_cache_path(self.project_root, '.search.sqlite3', cache_dir) if persist else None
+        self.numbers = {}  # rel -> file number
+        self.rels = []  # file number -> rel (None once dead)
+        self.lengths = array('I')
+        self.signatures = {}  # rel -> stat signature the terms were read with
+        self.imports = {}  # rel -> import specs
+        self.postings = {}  # term -> posting or array('Q') of postings (number << 8 | frequency)
+        self.total_length = 0
+        self.dead = 0
+        self._loaded = persist is False
+        self._dirty = {}  # rel -> encoded terms not saved yet
+        self._removed = set()
+        self.stems = {}  # file name without extension -> rels, for lookups by name
+        self._norms = None
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    # --------------------------------------------------------------------------
+    # Updates
+    # --------------------------------------------------------------------------
+
+    def _add_counts(self, rel: str, signature: tuple, counts: Counter, imports: tuple):
+        self._drop(rel)
+        number = len(self.rels)
+        self.rels.append(rel)
+        self.numbers[rel] = number
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.total_length += length
+        self.signatures[rel] = signature
+        self.imports[rel] = imports
+        self.stems.setdefault(_stem(rel), []).append(rel)
+        postings = self.postings
+        number <<= 8
+        for term, n in counts.items():
+            posting = number | min(n, 255)
+            entry = postings.get(term)
+            if entry is None:
+                postings[term] = posting
+            elif type(entry) is int:
+                postings[term] = array('Q', (entry, posting))
+            else:
+                entry.append(posting)
+        self._norms = None
+
+    def add(self, rel: str, signature: tuple, text: str):
+        """Index (or re-index) rel from its text, read under stat signature."""
+        text = text[:INDEX_CHARS]
+        counts = count_terms(text)
+        for term in path_terms(rel):
+            counts[term] += PATH_BOOST
+        imports = find_imports(rel, text)
+        self._add_counts(rel, signature, counts, imports)
+        if self.db_path is not None:
+            self._dirty[rel] = (_encode_terms(counts), imports)
+            self._removed.discard(rel)
+
+    def _drop(self, rel: str):
+        number = self.numbers.pop(rel, None)
+        if number is None:
+            return
+        self.rels[number] = None
+        self.total_length -= self.lengths[number]
+        self.dead += 1
+        self.signatures.pop(rel, None)
+        self.imports.pop(rel, None)
+        stem = _stem(rel)
+        same = self.stems[stem]
+        same.remove(rel)
+        if not same:
+            del self.stems[stem]
+        self._norms = None
+
+    def remove(self, rel: str):
+        self._drop(rel)
+        self._dirty.pop(rel, None)
+        if self.db_path is not None:
+            self._removed.add(rel)
+
+    def sync(self, signatures: dict, read, progress=None) -> int:
+        """Bring the index in line with signatures (rel -> stat signature of every text file).
+
+        Files whose signature changed are read with read(rel) (text, or
+        None if unreadable) and tokenised again; the others are left
+        alone. progress(done, total) is called before each read and may
+        raise to stop (what was indexed so far is kept). Returns the
+        number of files read.
+        """
+        self.load()
+        for rel in [rel for rel in self.numbers if rel not in signatures]:
+            self.remove(rel)
+        stale = [rel for rel, signature in signatures.items() if self.signatures.get(rel) != signature]
+        with tracer.span('index search', files=len(stale)):
+            for done, rel in enumerate(stale):
+                if progress is not None:
+                    progress(done, len(stale))
+                text = read(rel)
+                if text is None:
+                    self.remove(rel)
+                else:
+                    self.add(rel, signatures[rel], text)
+        if self.dead >= max(COMPACT_MIN_DEAD, len(self.numbers)):
+            self.compact()
+        return len(stale)
+
+    def compact(self):
+        """Renumber the live files and drop dead postings."""
+        remap = array('i', [-1]) * len(self.rels)
+        rels, lengths = [], array('I')
+        for number, rel in enumerate(self.rels):
+            if rel is not None:
+                remap[number] = len(rels)
+                rels.append(rel)
+                lengths.append(self.lengths[number])
+        postings = {}
+        for term, entry in self.postings.items():
+            kept = array('Q', [remap[p >> 8] << 8 | p & 255 for p in _each(entry) if remap[p >> 8] >= 0])
+            if len(kept) > 1:
+                postings[term] = kept
+            elif kept:
+                postings[term] = kept[0]
+        self.rels, self.lengths, self.postings = rels, lengths, postings
+        self.numbers = {rel: number for number, rel in enumerate(rels)}
+        self.dead = 0
+        self._norms = None
+
+    # --------------------------------------------------------------------------
+    # Queries
+    # --------------------------------------------------------------------------
+
+    def _length_norms(self) -> list:
+        """Per file number, the BM25 length normalisation k1 * (1 - b + b * length / average)."""
+        if self._norms is None:
+            average = self.total_length / max(1, len(self.numbers)) or 1
+            k1, b = BM25_K1, BM25_B
+            # Dead files score 0
+            self._norms = [k1 * (1 - b + b * length / average) if rel is not None else math.inf
+                           for rel, length in zip(self.rels, self.lengths)]
+        return self._norms
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Up to limit (rel, score) pairs for query, best first."""
+        live = len(self.numbers)
+        if not live:
+            return []
+        postings = self.postings
+        entries = sorted((_each(postings[t]) for t in set(tokenize(query)) if t in postings), key=len)
+        norms = self._length_norms()
+        rels = self.rels
+        scores = [0.0] * len(rels)
+        walked = 0
+        for entry in entries:
+            size = len(entry)
+            if walked and walked + size > QUERY_POSTINGS:
+                break
+            walked += size
+            # Dead postings stay until compact(): only live files count
+            df = sum(1 for posting in entry if rels[posting >> 8] is not None) if self.dead else size
+            if not df:
+                continue
+            weight = math.log(1 + (live - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+            for posting in entry:
+                number, n = posting >> 8, posting & 255
+                scores[number] += weight * n / (n + norms[number])
+        tracer.count('postings walked', walked)
+        best = heapq.nlargest(limit, range(len(scores)), key=scores.__getitem__)
+        return [(self.rels[number], scores[number]) for number in best if scores[number] > 0]
+
+    def _by_suffix(self, path: str, extensions) -> list:
+        """Rels equal to path or ending with /path, with one of extensions ('' = as is)."""
+        found = []
+        for ext in extensions:
+            full = path + ext
+            for rel in self.stems.get(_stem(full), ()):
+                if (rel == full or rel.endswith('/' + full)) and rel not in found:
+                    found.append(rel)
+        return found
+
+    def resolve_import(self, rel: str, spec: str) -> list:
+        """Indexed files that the import spec written in rel refers to."""
+        folder = rel.rpartition('/')[0]
+        numbers = self.numbers
+        ext = rel[rel.rfind('.'):].lower()
+        if ext in _PY_EXTENSIONS:
+            dots = len(spec) - len(spec.lstrip('.'))
+            module = spec[dots:].replace('.', '/')
+            if dots:
+                base = folder
+                for _ in range(dots - 1):
+                    base = base.rpartition('/')[0]
+                path = posixpath.join(base, module) if module else base
+                tries = [path + '.py', path + '/__init__.py']
+                return [t for t in tries if t in numbers]
+            return self._by_suffix(module, ('.py', '/__init__.py')) if module else []
+        if ext in _JS_EXTENSIONS:
+            if spec.startswith('.'):
+                path = posixpath.normpath(posixpath.join(folder, spec))
+                tries = [path] + [path + e for e in _JS_EXTENSIONS] + [path + '/index' + e for e in _JS_EXTENSIONS]
+                return [t for t in tries if t in numbers][:1]
+            if spec.startswith(('@/', '~/')):
+                return self._by_suffix(spec[2:], ('',) + _JS_EXTENSIONS)[:1]
+            return []
+        path = posixpath.normpath(posixpath.join(folder, spec))
+        if path in numbers:
+            return [path]
+        return self._by_suffix(spec, ('',))
+
+    def related(self, rels) -> list:
+        """Indexed files imported by rels (not among them), in order of first mention."""
+        chosen = set(rels)
+        found = []
+        for rel in rels:
+            for spec in self.imports.get(rel, ()):
+                for target in self.resolve_import(rel, spec):
+                    if target not in chosen:
+                        chosen.add(target)
+                        found.append(target)
+        return found
+
+    def preselect(self, instruction: str, limit: int = 20, imports: bool = True) -> Preselection:
+        """Files for instruction: named in it, the limit best ranked, and what those import.
+
+        Imported files are capped at limit too, the imports of the named and
+        best ranked files first, so a module importing half the project does
+        not pull it all in.
+        """
+        named = [rel for name in mentioned_names(instruction) for rel in self.stems.get(_stem(name), ())]
+        mentioned = sorted(mentioned_in(instruction, named))
+        seen = set(mentioned)
+        ranked = [(rel, score) for rel, score in self.search(instruction, limit + len(mentioned))
+                  if rel not in seen][:limit]
+        picked = mentioned + [rel for rel, _ in ranked]
+        imported = self.related(picked)[:limit] if imports else []
+        return Preselection(mentioned, ranked, imported)
+
+    # --------------------------------------------------------------------------
+    # Persistence
+    # --------------------------------------------------------------------------
+
+    def _connect(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=5)
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is None or row[0] != SCHEMA_VERSION:
+            conn.execute('DROP TABLE IF EXISTS files')
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,))
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER, '
+            'terms TEXT, imports TEXT)'
+        )
+        return conn
+
+    def load(self):
+        """Read the saved index once (no-op afterwards or without persistence)."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.db_path.exists():
+            return
+        try:
+            with tracer.span('load search index'):
+                conn = self._connect()
+                try:
+                    for path, mtime_ns, size, inode, terms, imports in conn.execute('SELECT * FROM files'):
+                        if path not in self.numbers:
+                            self._add_counts(path, (mtime_ns, size, inode), Counter(dict(_decode_terms(terms))),
+                                             tuple(json.loads(imports)))
+                finally:
+                    conn.close()
+        except Exception:
+            self.__init__(self.project_root, self.db_path.parent)
+            self._loaded = True
+
+    def save(self):
+        """Write the files indexed or removed since the last save."""
+        if self.db_path is None or not (self._dirty or self._removed):
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in self._removed])
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                        [(rel,) + tuple(self.signatures[rel]) + (terms, json.dumps(imports))
+                         for rel, (terms, imports) in self._dirty.items() if rel in self.signatures],
+                    )
+            finally:
+                conn.close()
+            self._dirty.clear()
+            self._removed.clear()
+        except Exception:
+            pass
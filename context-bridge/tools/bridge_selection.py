@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - File selection model
+ファイル一覧をフォルダ単位の木構造として保持し、どのファイルを送信するかを
+1ファイル1バイトの配列で管理する。GUI は表示中の行だけを描画する。
+
+Files are numbered by their position in the sorted list the model was
+built from. Every folder knows its direct subfolders and files, how many
+files it holds below it and how many of those are selected. Toggling one
+file updates only its ancestors (O(depth)); toggling a folder touches only
+the files below it.
+
+The model also keeps running totals of the selection (files, bytes,
+tokens) from per-file sizes and token counts supplied by the index, so
+the stats line never has to walk the selection. Files whose token count
+is not known yet are counted with an estimate and reported as pending.
+"""
+
+from array import array
+
+from bridge_budget import estimate_tokens
+
+
+def parent_of(rel: str) -> str:
+    """The folder of a project-relative path ('' for the project root)."""
+    return rel.rpartition('/')[0]
+
+
+class Folder:
+    """One folder of the tree: direct subfolders and file numbers, subtree counts."""
+
+    __slots__ = ('dirs', 'files', 'total', 'selected')
+
+    def __init__(self):
+        self.dirs = []
+        self.files = []
+        self.total = 0
+        self.selected = 0
+
+
+class FileSelection:
+    """Sorted project-relative paths, their folders and a selection flag per file.
+
+    selected is True/False for every file, or one flag per rel. sizes (in
+    bytes) and tokens (exact counts, None where unknown) are per rel too.
+    """
+
+    def __init__(self, rels: list, selected=False, sizes=None, tokens=None):
+        n = len(rels)
+        self.rels = rels
+        self.number = {rel: i for i, rel in enumerate(rels)}
+        if isinstance(selected, bool):
+            self.flags = bytearray([selected]) * n
+        else:
+            self.flags = bytearray(selected)
+        self.sizes = array('q', sizes if sizes is not None else bytes(8 * n))
+        if tokens is None:
+            tokens = [None] * n
+        self.exact = bytearray(t is not None for t in tokens)
+        self.tokens = array('q', [t if t is not None else estimate_tokens(size)
+                                  for t, size in zip(tokens, self.sizes)])
+        flags = self.flags
+        self.bytes = sum(self.sizes[i] for i in range(n) if flags[i])
+        self.token_total = sum(self.tokens[i] for i in range(n) if flags[i])
+        self.pending = sum(1 for i in range(n) if flags[i] and not self.exact[i])
+        folders = self.folders = {'': Folder()}
+        self.parents = [rel.rpartition('/')[0] for rel in rels]
+        flags = self.flags
+        for i, folder in enumerate(self.parents):
+            node = folders.get(folder)
+            if node is None:
+                node = self._folder(folder)
+            node.files.append(i)
+            node.total += 1
+            node.selected += flags[i]
+        # Roll the counts up into the parents, deepest folders first
+        for rel in sorted(folders, key=lambda r: r.count('/'), reverse=True):
+            if rel:
+                node, parent = folders[rel], folders[parent_of(rel)]
+                parent.total += node.total
+                parent.selected += node.selected
+
+    def rebuilt(self, rels: list, default: bool, sizes=None, tokens=None):
+        """A model for a new file list that keeps the flags of the files known here."""
+        number, flags = self.number, self.flags
+        return FileSelection(rels, [flags[number[rel]] if rel in number else default for rel in rels],
+                             sizes, tokens)
+
+    def _folder(self, rel: str) -> Folder:
+        node = self.folders.get(rel)
+        if node is None:
+            node = self.folders[rel] = Folder()
+            self._folder(parent_of(rel)).dirs.append(rel)
+        return node
+
+    def __len__(self) -> int:
+        return len(self.rels)
+
+    @property
+    def count(self) -> int:
+        """Number of selected files."""
+        return self.folders[''].selected
+
+    def is_selected(self, number: int) -> bool:
+        return bool(self.flags[number])
+
+    def state(self, folder: str) -> str:
+        """'all', 'none' or 'some' of the files below folder are selected."""
+        node = self.folders[folder]
+        if node.selected == 0:
+            return 'none'
+        return 'all' if node.selected == node.total else 'some'
+
+    def ancestors(self, rel: str):
+        """Folders containing rel (a file or folder), innermost first, ending with ''."""
+        folder = rel
+        while folder:
+            folder = parent_of(folder)
+            yield folder
+
+    def files_under(self, folder: str):
+        """File numbers below folder, depth first."""
+        stack = [folder]
+        while stack:
+            node = self.folders[stack.pop()]
+            yield from node.files
+            stack.extend(reversed(node.dirs))
+
+    def _weigh(self, number: int, delta: int):
+        self.bytes += delta * self.sizes[number]
+        self.token_total += delta * self.tokens[number]
+        if not self.exact[number]:
+            self.pending += delta
+
+    def set_file(self, number: int, selected: bool) -> bool:
+        """Select or deselect one file; returns whether it changed."""
+        flag = 1 if selected else 0
+        if self.flags[number] == flag:
+            return False
+        self.flags[number] = flag
+        delta = 1 if flag else -1
+        self._weigh(number, delta)
+        folder = self.parents[number]
+        while True:
+            self.folders[folder].selected += delta
+            if not folder:
+                break
+            folder = parent_of(folder)
+        return True
+
+    def set_folder(self, folder: str, selected: bool) -> list:
+        """Select or deselect every file below folder; returns the numbers that changed."""
+        flag = 1 if selected else 0
+        flags = self.flags
+        changed = []
+        stack = [folder]
+        while stack:
+            node = self.folders[stack.pop()]
+            for i in node.files:
+                if flags[i] != flag:
+                    flags[i] = flag
+                    changed.append(i)
+                    self._weigh(i, 1 if flag else -1)
+            node.selected = node.total if flag else 0
+            stack.extend(node.dirs)
+        delta = len(changed) if flag else -len(changed)
+        for parent in self.ancestors(folder):
+            self.folders[parent].selected += delta
+        return changed
+
+    def set_tokens(self, number: int, tokens):
+        """Record the exact token count of a file (None: back to the estimate)."""
+        selected = self.flags[number]
+        if selected:
+            self._weigh(number, -1)
+        if tokens is None:
+            self.tokens[number] = estimate_tokens(self.sizes[number])
+            self.exact[number] = 0
+        else:
+            self.tokens[number] = tokens
+            self.exact[number] = 1
+        if selected:
+            self._weigh(number, 1)
+
+    def set_size(self, number: int, size: int):
+        """A file changed on disk: new size, token count back to the estimate."""
+        selected = self.flags[number]
+        if selected:
+            self._weigh(number, -1)
+        self.sizes[number] = size
+        self.tokens[number] = estimate_tokens(size)
+        self.exact[number] = 0
+        if selected:
+            self._weigh(number, 1)
+
+    def uncounted(self) -> list:
+        """Numbers of the selected files whose token count is still an estimate."""
+        flags, exact = self.flags, self.exact
+        return [i for i in range(len(flags)) if flags[i] and not exact[i]]
+
+    def set_all(self, selected: bool) -> list:
+        return self.set_folder('', selected)
+
+    def selected(self) -> list:
+        """Numbers of the selected files, in order."""
+        flags = self.flags
+        return [i for i in range(len(flags)) if flags[i]]
+
+    def selected_rels(self) -> set:
+        return {self.rels[i] for i in self.selected()}
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Prompt sinks
+プロンプトを文字列として丸ごと組み立てずに、ファイル・標準出力・クリップボード
+などの出力先へ逐次書き出すための Sink 群。
+
+Every sink has write(text) and close(); close() returns the sink's result
+(the joined string for StringSink, None otherwise). ``chars`` counts the
+characters written so far. write_prompt() pumps an iterable of text pieces
+into a sink.
+
+A piece may also be a MappedText (see bridge_mapped). Sinks that set
+``accepts_bytes`` write its UTF-8 bytes straight from the map; the others
+receive it as str pieces.
+"""
+
+import os
+import sys
+import codecs
+
+from bridge_trace import tracer
+
+
+class Sink:
+    """Base class: counts characters and forwards them to _write()."""
+
+    accepts_bytes = False
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text):
+        if text:
+            self.chars += len(text)
+            if isinstance(text, str):
+                self._write(text)
+            else:
+                self._write_mapped(text)
+
+    def _write(self, text: str):
+        raise NotImplementedError
+
+    def _write_mapped(self, mapped):
+        for chunk in mapped.chunks():
+            self._write(chunk)
+
+    def close(self):
+        return None
+
+
+class StringSink(Sink):
+    """Collect pieces and join them exactly once, on close()."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def _write(self, text: str):
+        self._parts.append(text)
+
+    def close(self) -> str:
+        value = ''.join(self._parts)
+        self._parts = [value]
+        return value
+
+
+class FileSink(Sink):
+    """Write to a path or an open text stream (e.g. sys.stdout).
+
+    Mapped files go to the underlying binary buffer when the stream is
+    UTF-8 and does not translate newlines.
+    """
+
+    def __init__(self, target, encoding: str = 'utf-8'):
+        super().__init__()
+        if hasattr(target, 'write'):
+            self._stream = target
+            self._owned = False
+            encoding = getattr(target, 'encoding', None)
+            translates = os.linesep != '\n'
+        else:
+            self._stream = open(target, 'w', encoding=encoding, newline='')
+            self._owned = True
+            translates = False
+        self._buffer = getattr(self._stream, 'buffer', None)
+        self.accepts_bytes = (self._buffer is not None and not translates and encoding is not None
+                              and codecs.lookup(encoding).name == 'utf-8')
+
+    def _write(self, text: str):
+        self._stream.write(text)
+
+    def _write_mapped(self, mapped):
+        if not self.accepts_bytes:
+            super()._write_mapped(mapped)
+            return
+        self._stream.flush()
+        for window in mapped.windows():
+            self._buffer.write(window)
+
+    def close(self):
+        if self._owned:
+            self._stream.close()
+        else:
+            self._stream.flush()
+        return None
+
+
+class StdoutSink(FileSink):
+    """Write to sys.stdout."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+
+class BufferedSink(Sink):
+    """Batch small pieces into blocks of about block_size characters for flush(block)."""
+
+    def __init__(self, flush, block_size: int = 1 << 20):
+        super().__init__()
+        self._flush = flush
+        self.block_size = block_size
+        self._parts = []
+        self._pending = 0
+
+    def _write(self, text: str):
+        self._parts.append(text)
+        self._pending += len(text)
+        if self._pending >= self.block_size:
+            self._drain()
+
+    def _drain(self):
+        if self._parts:
+            block = ''.join(self._parts)
+            self._parts = []
+            self._pending = 0
+            self._flush(block)
+
+    def close(self):
+        self._drain()
+        return None
+
+
+class ClipboardSink(BufferedSink):
+    """Stream into the Tk clipboard with clipboard_append() in large blocks."""
+
+    def __init__(self, tk_root, block_size: int = 1 << 20):
+        super().__init__(self._append, block_size)
+        self._root = tk_root
+        self._root.clipboard_clear()
+
+    def _append(self, block: str):
+        with tracer.span('clipboard', chars=len(block)):
+            self._root.clipboard_append(block)
+
+    def close(self):
+        super().close()
+        self._root.update()  # Required for clipboard to persist
+        return None
+
+
+def write_prompt(pieces, sink: Sink):
+    """Write every text piece into sink and return sink.close()."""
+    for piece in pieces:
+        sink.write(piece)
+    return sink.close()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Token counting
+トークン数の見積もりを差し替え可能にするモジュール。
+
+Counters (all expose ``name`` and ``count(text) -> int``):
+    TiktokenCounter   - uses the optional ``tiktoken`` package when installed
+    BPETokenCounter   - offline byte-level BPE from a ``*.tiktoken`` vocab file
+                        (base64 token + rank per line), looked up in VOCAB_DIRS
+    ApproxTokenCounter - linear model over per-script character counts
+                        (Latin words, digits, punctuation, kana, kanji, ...),
+                        calibratable against any other counter
+
+get_token_counter('auto') picks the first one available. No vocab file is
+shipped; for offline exact counts download cl100k_base.tiktoken from
+https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken
+into tools/vocab/ (or the directory named by $CONTEXT_BRIDGE_VOCAB).
+Without tiktoken or a vocab file the counts are approximate; the active
+counter's name is shown next to the counts in the GUI and CLI.
+
+FileTokenCounts caches per-file counts by content hash (persisted through
+ScanCache when one is given), so summing a selection never re-reads files.
+"""
+
+import os
+import re
+import base64
+from pathlib import Path
+
+from bridge_cache import content_hash, stat_signature
+from bridge_scan import read_file_stat
+
+# Where *.tiktoken vocab files are looked up (first match wins)
+VOCAB_DIRS = [
+    Path(os.environ['CONTEXT_BRIDGE_VOCAB']) if os.environ.get('CONTEXT_BRIDGE_VOCAB') else None,
+    Path(__file__).resolve().parent / 'vocab',
+]
+
+DEFAULT_ENCODING = 'cl100k_base'
+
+
+# ==============================================================================
+# Counters
+# ==============================================================================
+
+class TokenCounter:
+    name = 'base'
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class TiktokenCounter(TokenCounter):
+    """Exact counts through the optional tiktoken package."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING):
+        import tiktoken
+        self._enc = tiktoken.get_encoding(encoding)
+        self.name = f'tiktoken:{encoding}'
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode(text, disallowed_special=()))
+
+
+# Approximation of the cl100k pre-tokenizer with the stdlib re module
+# (\p{L} -> [^\W\d_], \p{N} -> \d)
+_PRETOKENIZE = re.compile(
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\w]?[^\W\d_]+|\d{1,3}| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+)
+
+
+class BPETokenCounter(TokenCounter):
+    """Offline byte-level BPE token counter (tiktoken vocab format).
+
+    Counts are memoised per pre-token, which makes source code (where the
+    same identifiers repeat constantly) cheap to count in pure Python.
+    """
+
+    def __init__(self, ranks: dict, name: str = 'bpe', memo_size: int = 200000):
+        self.ranks = ranks
+        self.name = f'bpe:{name}'
+        self._memo = {}
+        self._memo_size = memo_size
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'BPETokenCounter':
+        ranks = {}
+        with open(path, 'rb') as f:
+            for line in f:
+                token, _, rank = line.strip().partition(b' ')
+                if token:
+                    ranks[base64.b64decode(token)] = int(rank)
+        return cls(ranks, Path(path).stem)
+
+    def _count_piece(self, piece: bytes) -> int:
+        ranks = self.ranks
+        if piece in ranks:
+            return 1
+        parts = [piece[i:i + 1] for i in range(len(piece))]
+        while len(parts) > 1:
+            best_rank, best_i = None, -1
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank, best_i = rank, i
+            if best_i < 0:
+                break
+            parts[best_i:best_i + 2] = [parts[best_i] + parts[best_i + 1]]
+        return len(parts)
+
+    def count(self, text: str) -> int:
+        memo = self._memo
+        total = 0
+        for piece in _PRETOKENIZE.findall(text):
+            n = memo.get(piece)
+            if n is None:
+                n = self._count_piece(piece.encode('utf-8'))
+                if len(memo) >= self._memo_size:
+                    memo.clear()
+                memo[piece] = n
+            total += n
+        return total
+
+
+# Feature names of the approximate counter, in weight-vector order
+FEATURES = ['latin', 'words', 'digits', 'punct', 'indents', 'newlines', 'kana', 'kanji', 'hangul', 'other']
+
+_LATIN = bytes(range(0x41, 0x5b)) + bytes(range(0x61, 0x7b))
+_DIGITS = b'0123456789'
+_PUNCT = b'!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
+# Maps Latin letters to b'a' and every other byte to b' ' (word-start counting)
+_WORD_MAP = bytes(0x61 if b in _LATIN else 0x20 for b in range(256))
+_ASCII = bytes(range(0x80))
+# UTF-8 prefixes of each script (all 3-byte sequences, so one count per char):
+# kana U+3040-30FF / halfwidth U+FF61-FF9F, CJK ideographs U+4000-9FFF,
+# hangul syllables U+A000-DFFF lead bytes (mostly hangul in practice)
+_KANA_PREFIXES = (b'\xe3\x81', b'\xe3\x82', b'\xe3\x83', b'\xef\xbd', b'\xef\xbe')
+_KANJI_PREFIXES = (b'\xe4', b'\xe5', b'\xe6', b'\xe7', b'\xe8', b'\xe9')
+_HANGUL_PREFIXES = (b'\xea', b'\xeb', b'\xec', b'\xed')
+
+# Tokens per feature occurrence, roughly fitted to cl100k on source code and
+# Japanese prose; refine with ApproxTokenCounter.calibrate()
+DEFAULT_WEIGHTS = {
+    'latin': 0.10, 'words': 0.75, 'digits': 0.40, 'punct': 0.80, 'indents': 0.60,
+    'newlines': 0.45, 'kana': 1.00, 'kanji': 1.25, 'hangul': 1.10, 'other': 0.80,
+}
+
+
+def script_features(text: str) -> dict:
+    """Return occurrence counts of each approximate-counter feature in text.
+
+    Everything is counted on the UTF-8 bytes with bytes.translate() and
+    bytes.count() (C loops, no per-match objects); scripts are told apart by
+    their UTF-8 lead bytes, and skipped entirely for ASCII text.
+    """
+    data = text.encode('utf-8', 'surrogatepass')
+    size = len(data)
+    words = data.translate(_WORD_MAP)
+    feats = {
+        'latin': size - len(data.translate(None, _LATIN)),
+        'words': words.count(b' a') + words.startswith(b'a'),
+        'digits': size - len(data.translate(None, _DIGITS)),
+        'punct': size - len(data.translate(None, _PUNCT)),
+        'indents': data.count(b'\n ') + data.count(b'\n\t'),
+        'newlines': data.count(b'\n'),
+        'kana': 0, 'kanji': 0, 'hangul': 0, 'other': 0,
+    }
+    if size != len(text):
+        kana = sum(data.count(p) for p in _KANA_PREFIXES)
+        kanji = sum(data.count(p) for p in _KANJI_PREFIXES)
+        hangul = sum(data.count(p) for p in _HANGUL_PREFIXES)
+        non_ascii = len(text) - (size - len(data.translate(None, _ASCII)))
+        feats.update(kana=kana, kanji=kanji, hangul=hangul,
+                     other=max(0, non_ascii - kana - kanji - hangul))
+    return feats
+
+
+class ApproxTokenCounter(TokenCounter):
+    """Fast token estimate from per-script character statistics."""
+
+    def __init__(self, weights: dict = None, name: str = 'approx'):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.name = name
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        weights = self.weights
+        feats = script_features(text)
+        return max(1, int(round(sum(weights[k] * v for k, v in feats.items()))))
+
+    @classmethod
+    def calibrate(cls, texts, reference: TokenCounter, name: str = None) -> 'ApproxTokenCounter':
+        """Fit feature weights to a reference counter.
+
+        Ridge least squares pulled towards DEFAULT_WEIGHTS, so features that
+        are rare or collinear in the samples keep sensible values; negative
+        weights are clamped to zero.
+        """
+        rows, targets = [], []
+        for text in texts:
+            feats = script_features(text)
+            rows.append([feats[n] for n in FEATURES])
+            targets.append(reference.count(text))
+        k = len(FEATURES)
+        prior = [DEFAULT_WEIGHTS[n] for n in FEATURES]
+        a = [[sum(r[i] * r[j] for r in rows) for j in range(k)] for i in range(k)]
+        lam = 1e-3 * max(1.0, sum(a[i][i] for i in range(k)) / k)
+        b = [sum(r[i] * t for r, t in zip(rows, targets)) + lam * prior[i] for i in range(k)]
+        for i in range(k):
+            a[i][i] += lam
+        weights = dict(zip(FEATURES, _solve(a, b)))
+        return cls({n: max(0.0, w) for n, w in weights.items()}, name or f'approx:{reference.name}')
+
+
+def _solve(a: list, b: list) -> list:
+    """Solve the (symmetric positive definite) system a x = b by Gaussian elimination."""
+    n = len(b)
+    a = [row[:] + [rhs] for row, rhs in zip(a, b)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, n):
+            f = a[r][col] / a[col][col]
+            if f:
+                a[r] = [x - f * y for x, y in zip(a[r], a[col])]
+    x = [0.0] * n
+    for i in range(n - 1, -1, -1):
+        x[i] = (a[i][n] - sum(a[i][j] * x[j] for j in range(i + 1, n))) / a[i][i]
+    return x
+
+
+def find_vocab(encoding: str = DEFAULT_ENCODING):
+    """Return the path of a bundled/configured <encoding>.tiktoken file, or None."""
+    for directory in VOCAB_DIRS:
+        if directory is not None:
+            path = directory / f'{encoding}.tiktoken'
+            if path.is_file():
+                return path
+    return None
+
+
+_counters = {}
+
+
+def get_token_counter(kind: str = 'auto', encoding: str = DEFAULT_ENCODING) -> TokenCounter:
+    """Return a shared counter: 'approx', 'bpe', 'tiktoken' or 'auto' (best available)."""
+    key = (kind, encoding)
+    if key in _counters:
+        return _counters[key]
+    counter = None
+    if kind in ('auto', 'tiktoken'):
+        try:
+            counter = TiktokenCounter(encoding)
+        except Exception:
+            if kind == 'tiktoken':
+                raise
+    if counter is None and kind in ('auto', 'bpe'):
+        vocab = find_vocab(encoding)
+        if vocab is not None:
+            counter = BPETokenCounter.from_file(vocab)
+        elif kind == 'bpe':
+            raise FileNotFoundError(f"No {encoding}.tiktoken vocab found in {VOCAB_DIRS}")
+    if counter is None:
+        counter = ApproxTokenCounter()
+    _counters[key] = counter
+    return counter
+
+
+# ==============================================================================
+# Per-file counts
+# ==============================================================================
+
+def file_wrapper(rel: str) -> str:
+    """The XML wrapper pack_context_xml() puts around one file's content."""
+    return f'<file path="{rel}">\n\n</file>\n\n'
+
+
+class FileTokenCounts:
+    """Per-file token counts, cached by content hash.
+
+    ``known`` maps rel -> (stat signature, tokens including the XML
+    wrapper), so summing a selection is a dict lookup per file. Content
+    counts are shared between identical files and, with a ScanCache,
+    persisted across sessions.
+    """
+
+    def __init__(self, counter: TokenCounter, cache=None):
+        self.counter = counter
+        self.cache = cache
+        self.known = {}
+        self._by_hash = {}
+
+    def _content_tokens(self, digest: str):
+        n = self._by_hash.get(digest)
+        if n is None and self.cache is not None:
+            n = self.cache.get_tokens(digest, self.counter.name)
+            if n is not None:
+                self._by_hash[digest] = n
+        return n
+
+    def lookup(self, rel: str, signature: tuple):
+        """Return the cached count for rel if it is still valid, else None."""
+        known = self.known.get(rel)
+        if known is not None and known[0] == signature:
+            return known[1]
+        if self.cache is not None:
+            record = self.cache.records.get(rel)
+            if record is not None and record[:3] == signature and record.hash:
+                n = self._content_tokens(record.hash)
+                if n is not None:
+                    n += self.counter.count(file_wrapper(rel))
+                    self.known[rel] = (signature, n)
+                    return n
+        return None
+
+    def record(self, rel: str, signature: tuple, digest: str, text: str) -> int:
+        """Count already-read content of rel and remember it."""
+        n = self._content_tokens(digest)
+        if n is None:
+            if isinstance(text, str):
+                n = self.counter.count(text)
+            else:
+                # A MappedText, counted window by window (a token may split at an edge)
+                n = sum(self.counter.count(chunk) for chunk in text.chunks())
+            self._by_hash[digest] = n
+            if self.cache is not None:
+                self.cache.put_tokens(digest, self.counter.name, n)
+        n += self.counter.count(file_wrapper(rel))
+        self.known[rel] = (signature, n)
+        return n
+
+    def count_file(self, path: Path, rel: str, decode) -> int:
+        """Read, hash and count one file (decode(bytes) -> str), as it is packed."""
+        _, data, st = read_file_stat(path, sniff=False)
+        digest = content_hash(data)
+        if self.cache is not None:
+            self.cache.store_hash(rel, st, digest)
+        return self.record(rel, stat_signature(st), digest, decode(data))
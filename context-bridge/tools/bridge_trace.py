@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - Tracing
+処理ごとの所要時間（スパン）と件数（カウンター）を記録し、ログへの内訳表示と
+Chrome トレース形式（chrome://tracing / Perfetto）への書き出しを行う。
+無効のときはほとんどコストがかからない。
+
+Tracing is off until enable() is called; the GUI and the CLI call it when
+CONTEXT_BRIDGE_TRACE names a file (the CLI also with --trace). While off,
+span() returns a shared no-op context manager, count() returns at once
+and timed() returns the function unchanged. Hot loops add up locally and
+count once, or check ``tracer.enabled`` first.
+
+Three kinds of data are kept:
+    spans    - span(name) blocks; each becomes a complete ("X") event on
+               the thread it ran on, so work on the I/O pool shows up as
+               parallel lanes in the trace viewer
+    timings  - timed(name, func) wrappers for calls too small and too many
+               to be events (ignore checks, sniffs); only totals are kept
+    counters - count(name, n) totals (files stat'ed, bytes read, ...)
+mark() / report(mark) give what happened between two points in time;
+that is what the per-operation lines in the log show.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+
+# Environment variable naming the trace file; setting it turns tracing on
+TRACE_ENV = 'CONTEXT_BRIDGE_TRACE'
+
+# Phases listed per line of report()
+REPORT_PHASES = 8
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._add_span(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Tracer:
+    """Collects spans, timings and counters while enabled. Safe to use from any thread."""
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._events = []  # (name, start ns, end ns, thread id, args)
+        self._samples = []  # (ns, counters) taken by report(), for the trace's counter tracks
+        self._totals = {}  # name -> [ns, calls], spans and timings alike
+        self._counters = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._exit_hook = False
+
+    # --------------------------------------------------------------------------
+    # Switching
+    # --------------------------------------------------------------------------
+
+    def enable(self, path=None):
+        """Start recording; with path, the trace is written there at exit (and by export())."""
+        self.enabled = True
+        if path is not None:
+            self.path = str(path)
+            if not self._exit_hook:
+                atexit.register(self._export_at_exit)
+                self._exit_hook = True
+
+    def enable_from_env(self) -> bool:
+        """enable() with the file named by CONTEXT_BRIDGE_TRACE, if set; True if tracing."""
+        path = os.environ.get(TRACE_ENV)
+        if path:
+            self.enable(os.path.expanduser(path))
+        return self.enabled
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._events = []
+            self._samples = []
+            self._totals.clear()  # in place: timed() wrappers hold it
+            self._counters.clear()
+
+    # --------------------------------------------------------------------------
+    # Recording
+    # --------------------------------------------------------------------------
+
+    def span(self, name: str, **args):
+        """Context manager timing a block as one event; args are shown in the trace viewer."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def timed(self, name: str, func):
+        """Return func, or while enabled a wrapper adding its calls to the totals of name."""
+        if not self.enabled:
+            return func
+        totals = self._totals
+        lock = self._lock
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                with lock:
+                    total = totals.setdefault(name, [0, 0])
+                    total[0] += elapsed
+                    total[1] += 1
+        return wrapper
+
+    def _add_span(self, name: str, start: int, end: int, args: dict):
+        thread = threading.current_thread()
+        with self._lock:
+            self._events.append((name, start, end, thread.ident, args))
+            self._threads.setdefault(thread.ident, thread.name)
+            total = self._totals.setdefault(name, [0, 0])
+            total[0] += end - start
+            total[1] += 1
+
+    # --------------------------------------------------------------------------
+    # Reading
+    # --------------------------------------------------------------------------
+
+    def mark(self):
+        """A point in time for report(); None while disabled."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            return ({name: tuple(t) for name, t in self._totals.items()}, dict(self._counters))
+
+    def summary(self, mark=None) -> tuple:
+        """(phases, counters) since mark: phases maps name -> (ms, calls), largest first."""
+        totals, counters = mark if mark is not None else ({}, {})
+        with self._lock:
+            now = {name: tuple(t) for name, t in self._totals.items()}
+            current = dict(self._counters)
+            self._samples.append((time.perf_counter_ns(), current))
+        phases = []
+        for name, (ns, calls) in now.items():
+            ns0, calls0 = totals.get(name, (0, 0))
+            if calls > calls0:
+                phases.append((name, ((ns - ns0) / 1e6, calls - calls0)))
+        phases.sort(key=lambda item: -item[1][0])
+        changed = {name: n - counters.get(name, 0) for name, n in current.items()
+                   if n != counters.get(name, 0)}
+        return dict(phases), changed
+
+    def report(self, mark=None) -> list:
+        """Log lines for what happened since mark (empty if nothing was recorded)."""
+        phases, counters = self.summary(mark)
+        lines = []
+        items = list(phases.items())
+        for start in range(0, len(items), REPORT_PHASES):
+            lines.append(', '.join(_phase_text(name, ms, calls)
+                                   for name, (ms, calls) in items[start:start + REPORT_PHASES]))
+        if counters:
+            lines.append(', '.join(f'{name} {_count_text(name, n)}' for name, n in sorted(counters.items())))
+        return lines
+
+    # --------------------------------------------------------------------------
+    # Export
+    # --------------------------------------------------------------------------
+
+    def trace_events(self) -> list:
+        """The recorded data in Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            samples = list(self._samples) + [(time.perf_counter_ns(), dict(self._counters))]
+            threads = dict(self._threads)
+        out = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+               for tid, name in threads.items()]
+        for name, start, end, tid, args in events:
+            out.append({'name': name, 'cat': 'bridge', 'ph': 'X', 'pid': pid, 'tid': tid,
+                        'ts': (start - self._origin) / 1000, 'dur': (end - start) / 1000,
+                        'args': args})
+        for ns, counters in samples:
+            for name, n in counters.items():
+                out.append({'name': name, 'cat': 'counter', 'ph': 'C', 'pid': pid,
+                            'ts': (ns - self._origin) / 1000, 'args': {'value': n}})
+        return out
+
+    def export(self, path=None) -> str:
+        """Write the trace (Chrome JSON) to path or the enable() path; returns the path used."""
+        path = str(path) if path is not None else self.path
+        if path is None:
+            raise ValueError("No trace file given")
+        with self._lock:
+            # Timed calls have no events; their totals are kept beside them
+            totals = {name: {'ms': ns / 1e6, 'calls': calls} for name, (ns, calls) in self._totals.items()}
+            counters = dict(self._counters)
+        data = {'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms',
+                'otherData': {'totals': totals, 'counters': counters}}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+    def _export_at_exit(self):
+        if self.path is not None:
+            try:
+                self.export()
+            except (OSError, ValueError):
+                pass
+
+
+def _phase_text(name: str, ms: float, calls: int) -> str:
+    return f'{name} {ms:,.1f} ms' + (f' ({calls:,}×)' if calls > 1 else '')
+
+
+def _count_text(name: str, n: int) -> str:
+    if name.startswith('bytes'):
+        return f'{n / 2**20:,.1f} MB' if n >= 1 << 20 else f'{n / 1024:,.1f} KB'
+    return f'{n:,}'
+
+
+# Shared by every module; enabled once per process
+tracer = Tracer()
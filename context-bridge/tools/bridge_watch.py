@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Context Bridge - File system watching
+ProjectIndex を最新に保つためのファイル監視。Linux では inotify を使い、
+それ以外の環境（または inotify が使えない場合）は stat ベースのポーリングに
+フォールバックする。
+
+Both watchers expose the same interface: poll() returns the set of
+project-relative paths that changed since the last call (without blocking);
+an empty string in the set means the watcher lost track and a full rescan
+is needed. stop() releases resources.
+"""
+
+import os
+import sys
+import errno
+import queue
+import struct
+import threading
+
+from bridge_cache import stat_signature
+from bridge_scan import ProjectWalker
+
+# Seconds between stat sweeps of the polling fallback
+POLL_INTERVAL = 2.0
+
+
+# ==============================================================================
+# inotify (Linux)
+# ==============================================================================
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT = struct.Struct('iIII')
+
+
+def _load_libc():
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc, ctypes
+
+
+class InotifyWatcher:
+    """Watch every non-ignored directory of a ProjectIndex with inotify."""
+
+    def __init__(self, index):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self.index = index
+        self._libc, self._ctypes = _load_libc()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = self._ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._wds = {}
+        try:
+            self.resync()
+        except OSError:
+            self.stop()
+            raise
+
+    def _add_watch(self, rel_dir: str):
+        path = os.path.join(str(self.index.project_root), rel_dir)
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            # ENOSPC: max_user_watches exhausted -> caller falls back to polling
+            raise OSError(err, os.strerror(err))
+        self._wds[wd] = rel_dir
+
+    def _watch_tree(self, rel_dir: str):
+        """Add watches for rel_dir and every non-ignored directory below it."""
+        stack = [rel_dir]
+        root = str(self.index.project_root)
+        while stack:
+            current = stack.pop()
+            self._add_watch(current)
+            try:
+                it = os.scandir(os.path.join(root, current) if current else root)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                    except OSError:
+                        continue
+                    rel = current + '/' + entry.name if current else entry.name
+                    if not self.index.is_ignored(rel, True):
+                        stack.append(rel)
+
+    def resync(self):
+        """Re-add watches after the ignore rules changed (existing watches are kept)."""
+        self._watch_tree('')
+
+    def poll(self) -> set:
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                changed.add('')
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add('')
+                    continue
+                rel_dir = self._wds.get(wd)
+                if rel_dir is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self._wds[wd]
+                    continue
+                name = os.fsdecode(name)
+                rel = rel_dir + '/' + name if rel_dir and name else (name or rel_dir)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    if not self.index.is_ignored(rel, True):
+                        try:
+                            self._watch_tree(rel)
+                        except OSError:
+                            changed.add('')
+                changed.add(rel)
+        return changed
+
+    def stop(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# ==============================================================================
+# Polling fallback
+# ==============================================================================
+
+class PollingWatcher:
+    """Stat-sweep the indexed tree in a background thread and report differences.
+
+    Only stat calls are made per sweep; files are reopened by the index only
+    when their signature changed. Sweeps are compared against the index's own
+    signatures, re-seeded by resync() after every full rescan.
+
+    The sweep thread never reads the index: every sweep builds its own
+    ignore predicate with index.make_predicate, so a rescan rebuilding the
+    index's matcher on another thread cannot change it halfway. The index
+    is only read by __init__ and resync(), which the owner calls while
+    holding its lock.
+    """
+
+    def __init__(self, index, interval: float = POLL_INTERVAL):
+        self.index = index
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snapshot = index.signatures()
+        self._root = index.project_root
+        self._make_predicate = index.make_predicate
+        self._limits = (index.max_depth, index.max_files)
+        self._thread = threading.Thread(target=self._run, name='bridge-poll', daemon=True)
+        self._thread.start()
+
+    def _sweep(self) -> dict:
+        # The walker prunes ignored directories, so the predicate is asked
+        # about each entry once its parents were kept (as in ProjectIndex)
+        max_depth, max_files = self._limits
+        walker = ProjectWalker(self._root, self._make_predicate(self._root),
+                               max_depth=max_depth, max_files=max_files)
+        snapshot = {}
+        for rel, entry in walker:
+            try:
+                snapshot[rel] = stat_signature(entry.stat())
+            except OSError:
+                continue
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            generation = self._generation
+            try:
+                snapshot = self._sweep()
+            except Exception:
+                continue
+            with self._lock:
+                # The index was rescanned during the sweep: compare again next time
+                if generation != self._generation:
+                    continue
+                old = self._snapshot
+                changed = {rel for rel, sig in snapshot.items() if old.get(rel) != sig}
+                changed.update(rel for rel in old if rel not in snapshot)
+                self._snapshot = snapshot
+            if changed:
+                self._queue.put(changed)
+
+    def resync(self):
+        """Re-seed the baseline from the index after a full rescan.
+
+        Called by the owner's watch job on its worker thread, while it holds
+        the lock that guards the index; touches no GUI state.
+        """
+        with self._lock:
+            self._snapshot = self.index.signatures()
+            self._generation += 1
+
+    def poll(self) -> set:
+        changed = set()
+        while True:
+            try:
+                changed |= self._queue.get_nowait()
+            except queue.Empty:
+                return changed
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_watcher(index, interval: float = POLL_INTERVAL):
+    """Return an InotifyWatcher if possible, else a PollingWatcher."""
+    try:
+        return InotifyWatcher(index)
+    except (OSError, AttributeError):
+        return PollingWatcher(index, interval)